@@ -1,215 +1,251 @@
-import geemap
 import ee
 from datetime import datetime
+import Cache, Export, Context
 
 
-###########GMW#############
+###########AOI#############
 
-def gmw_hectares(aoi, year):
-    '''
-    Inputs: aoi (image, imageCollection, featureCollection). Most importantly, NOT a shpfile. That translation must be done outside of this function.
-            year - the year you are looking for, as an integer.
-    Output: The area of the aoi covered by mangroves in the given year.
+# Scale (meters) every reduction runs at in preview mode - coarse enough to come back in seconds, whatever the aoi.
+# Preview results are cached under their own keys (the scale is part of the key), so they never mix with native ones.
+PREVIEW_SCALE = 250
 
+def preview_scale(preview):
     '''
-    year_string = str(year)
-    extent_raster = ee.ImageCollection(
-        "projects/earthengine-legacy/assets/projects/sat-io/open-datasets/GMW/extent/GMW_V3")
-
-    # Filter by year, clip to AOI:
-    extent_year_clipped = extent_raster.filterDate(year_string + '-01-01', year_string + '-12-31').first().clip(aoi)
-
-    # Create mask
-    mangrove_year = extent_year_clipped.eq(1)
+    Scale override for the metric functions: PREVIEW_SCALE when preview is True, None (each dataset's native scale) otherwise.
+    '''
+    return PREVIEW_SCALE if preview else None
 
-    # Calculate pixel area in hectares
-    pixel_area_ha = ee.Image.pixelArea().divide(10000)
+def aoi_area_key(aoi):
+    return Cache.make_key(aoi, 'geometry', None, None, None, 'area(1)')
 
-    area_img_year = pixel_area_ha.updateMask(mangrove_year)
+def aoi_area_m2(aoi):
+    '''
+    Returns the geometry area of the aoi in square meters (same as aoi.geometry().area(1).getInfo(), but cached).
+    With a context (see Context.py) it's only looked up once per run.
+    '''
+    return Context.fetch(aoi, 'area_m2', lambda: Cache.fetch(aoi_area_key(aoi), Context.area_m2_ee(aoi)))
+
+###########LAND COVER#############
+
+# Class maps the land cover area functions can read. 'classes' are the pixel values and what they mean.
+LAND_COVER_DATASETS = {
+    'GMW': {
+        'collection': "projects/earthengine-legacy/assets/projects/sat-io/open-datasets/GMW/extent/GMW_V3",
+        'scale': 30,
+        'classes': {1: 'Mangrove'}
+    },
+    'FNF3': {
+        'collection': 'JAXA/ALOS/PALSAR/YEARLY/FNF',
+        'scale': 25,  # JAXA PALSAR resolution (~25 m)
+        'classes': {1: 'Forest', 2: 'Non-forest', 3: 'Water'},
+        # Percentages are of the pixel-based area (see jaxa_percent_from_areas)
+        'pixel_hectares': True
+    },
+    'FNF4': {
+        'collection': 'JAXA/ALOS/PALSAR/YEARLY/FNF4',
+        'scale': 25,
+        'classes': {1: 'Dense', 2: 'Non-dense', 3: 'Non-forest', 4: 'Water'},
+        'pixel_hectares': True
+    }
+}
 
-    # Get total area!
-    area = area_img_year.reduceRegion(
-        reducer=ee.Reducer.sum(),
-        geometry=aoi,
-        scale=30,
-        maxPixels=1e12
-    )
+def get_land_cover_image(aoi, dataset, year):
+    '''
+    Returns the single band class map of dataset ('GMW', 'FNF3' or 'FNF4') for the given year, clipped to aoi.
+    Built once per context.
+    '''
+    def builder():
+        year_string = str(year)
+        collection = ee.ImageCollection(LAND_COVER_DATASETS[dataset]['collection'])
+        region = Context.get_aoi(aoi)
 
-    # Return
-    return area.getInfo().get('area')
+        # Filter by year, clip to AOI:
+        return collection.filterDate(year_string + '-01-01', year_string + '-12-31').filterBounds(region).first().select([0]).clip(region)
 
-def gmw_percent(aoi, year):
-    Hectares = gmw_hectares(aoi, year)
-    return (Hectares / (aoi.geometry().area(1).getInfo()/10000))*100
+    return Context.build(aoi, ('land_cover', dataset, year), builder)
 
-def export_gmw_tif(aoi, year, folder):
-    year_string = str(year)
-    extent_raster = ee.ImageCollection(
-        "projects/earthengine-legacy/assets/projects/sat-io/open-datasets/GMW/extent/GMW_V3")
+def land_cover_areas_ee(aoi, dataset, year, tile_scale=1, scale=None):
+    '''
+    Area of every class of a land cover dataset, from ONE grouped reduction - nothing is fetched here.
+    scale overrides the dataset's native scale (e.g. PREVIEW_SCALE).
+    Returns an ee.Dictionary with the 'groups' ({'class': ..., 'sum': hectares}), the aoi 'area_m2' and, for the datasets whose
+    percentages need it (JAXA), its 'pixel_hectares' at the same scale (see Context.pixel_hectares_ee).
+    Use parse_land_cover_areas on the fetched result.
+    '''
+    classes = get_land_cover_image(aoi, dataset, year).rename('class')
+    scale = scale or LAND_COVER_DATASETS[dataset]['scale']
+
+    # Sum area per class value
+    area = Context.pixel_area_ha(aoi).addBands(classes).reduceRegion(
+        reducer=ee.Reducer.sum().group(groupField=1, groupName='class'),
+        geometry=Context.get_aoi(aoi),
+        scale=scale,
+        maxPixels=1e12,
+        tileScale=tile_scale
+    )
 
-    # Filter by year, clip to AOI:
-    extent_year_clipped = extent_raster.filterDate(year_string + '-01-01', year_string + '-12-31').first().clip(aoi)
+    areas = {
+        'groups': area.get('groups'),
+        'area_m2': Context.area_m2_ee(aoi)
+    }
+    if LAND_COVER_DATASETS[dataset].get('pixel_hectares'):
+        areas['pixel_hectares'] = Context.pixel_hectares_ee(aoi, scale, tile_scale)
+    return ee.Dictionary(areas)
 
-    # Create mask
-    mangrove_year = extent_year_clipped.eq(1)
+def parse_land_cover_areas(area_info, dataset):
+    '''
+    Turns the fetched result of land_cover_areas_ee into a dictionary with keys 'hectares' and 'percent',
+    each holding class value -> number for every class of the dataset (0 if the class isn't in the aoi).
+    Percentages are of the geometry area of the aoi ('aoi_hectares'), like Murray's and protected planet's.
+    'pixel_hectares' is the pixel-based area at the dataset's scale (None if the result doesn't have it - GMW's never does)
+    - only jaxa_percent uses it.
+    '''
+    hectares = {code: 0.0 for code in LAND_COVER_DATASETS[dataset]['classes']}
+    for group in area_info['groups']:
+        hectares[int(group['class'])] = group['sum']
 
-    geemap.ee_export_image(
-        mangrove_year.updateMask(mangrove_year),  # only mangrove pixels
-        filename=folder + '/gmw.tif',  # output file in outputs folder
-        scale=30,  # 30m resolution
-        region=aoi.geometry(),
-        file_per_band=False
-    )
+    aoi_hectares = area_info['area_m2'] / 10000
+    return {
+        'hectares': hectares,
+        'percent': {code: (value / aoi_hectares) * 100 for code, value in hectares.items()},
+        'aoi_hectares': aoi_hectares,
+        'pixel_hectares': area_info.get('pixel_hectares')
+    }
 
-#############JAXA#############
+def land_cover_key(aoi, dataset, year, scale=None):
+    reducer = 'sum.group(class),pixel_hectares' if LAND_COVER_DATASETS[dataset].get('pixel_hectares') else 'sum.group(class)'
+    return Cache.make_key(aoi, LAND_COVER_DATASETS[dataset]['collection'], year, 'class', scale or LAND_COVER_DATASETS[dataset]['scale'],
+                          reducer)
 
-def jaxa_hectares_fnf3(aoi, year):
-    year_str = str(year)
+def land_cover_areas(aoi, dataset, year, scale=None):
+    '''
+    Inputs: aoi (featureCollection), dataset ('GMW', 'FNF3' or 'FNF4'), year as an integer, scale to override the native one.
+    Output: hectares AND percent of the aoi for every class of the dataset (see parse_land_cover_areas), in one round trip.
+    Cached, so asking for hectares and then percent only fetches once.
+    '''
+    area_info = Cache.fetch(land_cover_key(aoi, dataset, year, scale), land_cover_areas_ee(aoi, dataset, year, scale=scale))
+    return parse_land_cover_areas(area_info, dataset)
 
-    # Load JAXA FNF dataset
-    jaxa = (
-        ee.ImageCollection('JAXA/ALOS/PALSAR/YEARLY/FNF')
-        .filterDate(year_str + '-01-01', year_str + '-12-31')
-        .filterBounds(aoi)
-        .select('fnf')
-    )
+###########GMW#############
 
-    # Get yearly image and clip
-    fnf = jaxa.first().clip(aoi)
+def gmw_hectares(aoi, year, preview=False):
+    '''
+    Inputs: aoi (image, imageCollection, featureCollection). Most importantly, NOT a shpfile. That translation must be done outside of this function.
+            year - the year you are looking for, as an integer.
+            preview - True for a quick estimate at PREVIEW_SCALE.
+    Output: The area of the aoi covered by mangroves in the given year.
 
-    # Forest mask (1 = forest)
-    forest = fnf.eq(1)
+    '''
+    return land_cover_areas(aoi, 'GMW', year, preview_scale(preview))['hectares'][1]
 
-    # Pixel area in hectares
-    pixel_area_ha = ee.Image.pixelArea().divide(10000)
+def gmw_percent(aoi, year, preview=False):
+    return land_cover_areas(aoi, 'GMW', year, preview_scale(preview))['percent'][1]
 
-    # Mask to forest pixels only
-    forest_area_img = pixel_area_ha.updateMask(forest)
+def get_gmw_image(aoi, year):
+    '''
+    Returns GMW mangrove extent for the year, clipped to the aoi: 1 where there are mangroves, masked everywhere else.
+    '''
+    # Create mask
+    mangrove_year = get_land_cover_image(aoi, 'GMW', year).eq(1)
+    return mangrove_year.updateMask(mangrove_year)  # only mangrove pixels
 
-    # Sum area
-    area = forest_area_img.reduceRegion(
-        reducer=ee.Reducer.sum(),
-        geometry=aoi,
-        scale=25,        # JAXA PALSAR resolution (~25 m)
-        maxPixels=1e12
+def export_gmw_tif(aoi, year, folder):
+    Export.export_image(
+        get_gmw_image(aoi, year),
+        filename=folder + '/gmw.tif',  # output file in outputs folder
+        aoi=aoi,
+        scale=30  # 30m resolution
     )
 
-    # Return value as Python float
-    return area.getInfo().get('area')
+#############JAXA#############
 
-def jaxa_hectares_fnf4(aoi, year):
+def jaxa_dataset(year):
     '''
-
-    Returns DICTIONARY with keys 'Dense', "Non-dense" and "Total"
+    JAXA FNF4 (dense/non-dense forest) starts in 2017 - before that, only FNF3 (forest/non-forest).
     '''
-    year_string = str(year)
-
-    # Load JAXA FNF4 dataset, since year >=2017
-    dataset_jaxa = (
-        ee.ImageCollection('JAXA/ALOS/PALSAR/YEARLY/FNF4')
-        .filterDate(year_string + '-01-01', year_string + '-12-31')
-        .filterBounds(aoi)
-        .select('fnf')
-    )
+    if year >= 2017:
+        return 'FNF4'
+    else:
+        return 'FNF3'
 
-    fnf = dataset_jaxa.first().clip(aoi)
+def jaxa_hectares_from_areas(areas, year):
+    '''
+    Picks the jaxa_hectares result out of land_cover_areas output. No earth engine calls.
+    Returns DICTIONARY with keys 'Dense', "Non-dense" and "Total" from 2017, or the forest area as a number before that.
+    '''
+    hectares = areas['hectares']
+    if jaxa_dataset(year) == 'FNF4':
+        return {
+            "Dense": hectares[1],
+            "Non-dense": hectares[2],
+            "Total": hectares[1] + hectares[2]
+        }
+    else:
+        return hectares[1]
 
-    # Pixel area in hectares
-    pixel_area_ha = ee.Image.pixelArea().divide(10000)
+def jaxa_percent_from_areas(areas, year):
+    '''
+    Picks the jaxa_percent result out of land_cover_areas output, rounded to 2 decimals. No earth engine calls.
+    '''
+    retVal = jaxa_hectares_from_areas(areas, year)
+    # Percent of the pixel-based aoi area (see parse_land_cover_areas) - the geometry area is slightly too large for 25 m pixels.
+    # Only JAXA does this (write_csv says so on its rows); every other percentage of the report is of the geometry area.
+    aoi_hectares = areas.get('pixel_hectares') or areas['aoi_hectares']
+    if type(retVal) is dict:
+        return {key: round((value / aoi_hectares) * 100, 2) for key, value in retVal.items()}
+    else:
+        return round((retVal / aoi_hectares) * 100, 2)
 
-    # Calculate Dense forest (band 1)
-    dense_mask = fnf.eq(1)
-    dense_area = pixel_area_ha.updateMask(dense_mask).reduceRegion(
-        reducer=ee.Reducer.sum(),
-        geometry=aoi,
-        scale=25,
-        maxPixels=1e12
-    ).get('area').getInfo()
-
-    # Calculate Non-dense forest (band 2)
-    nondense_mask = fnf.eq(2)
-    nondense_area = pixel_area_ha.updateMask(nondense_mask).reduceRegion(
-        reducer=ee.Reducer.sum(),
-        geometry=aoi,
-        scale=25,
-        maxPixels=1e12
-    ).get('area').getInfo()
+def jaxa_hectares_fnf3(aoi, year, preview=False):
+    return jaxa_hectares_from_areas(land_cover_areas(aoi, 'FNF3', year, preview_scale(preview)), year)
 
-    total_ha = dense_area + nondense_area
+def jaxa_hectares_fnf4(aoi, year, preview=False):
+    '''
 
-    return {
-        "Dense": dense_area,
-        "Non-dense": nondense_area,
-        "Total": total_ha
-    }
+    Returns DICTIONARY with keys 'Dense', "Non-dense" and "Total"
+    '''
+    return jaxa_hectares_from_areas(land_cover_areas(aoi, 'FNF4', year, preview_scale(preview)), year)
 
 #Wrapper function for above fnf3 and fnf4
-def jaxa_hectares(aoi, year):
-    if year >= 2017:
-        return jaxa_hectares_fnf4(aoi,year)
-    else:
-        return jaxa_hectares_fnf3(aoi,year)
+def jaxa_hectares(aoi, year, preview=False):
+    return jaxa_hectares_from_areas(land_cover_areas(aoi, jaxa_dataset(year), year, preview_scale(preview)), year)
 
-def jaxa_percent(aoi, year):
-    retVal = jaxa_hectares(aoi, year)
-    # This can either turn an integer or a dictionary - check the type!
-    #TODO - aoi.geometry() is going to be SLIGHTLY too large. for 100% accuracy, use pixel size mask.
-    if type(retVal) is dict:
-        return {
-            "Dense": round((retVal['Dense'] / (aoi.geometry().area(1).getInfo() / 10000)) * 100, 2),
-            "Non-dense": round((retVal['Non-dense'] / (aoi.geometry().area(1).getInfo() / 10000)) * 100, 2),
-            "Total": round((retVal['Total'] / (aoi.geometry().area(1).getInfo() / 10000)) * 100, 2)
-        }
+def jaxa_percent(aoi, year, preview=False):
+    # Same cached reduction as jaxa_hectares - this doesn't go back to earth engine.
+    return jaxa_percent_from_areas(land_cover_areas(aoi, jaxa_dataset(year), year, preview_scale(preview)), year)
 
-    else:
-        return round((retVal / (aoi.geometry().area(1).getInfo() / 10000)) * 100, 2)
+# Class values that count as forest in each JAXA dataset
+JAXA_FOREST_CLASSES = {
+    'FNF3': [1],  # forest
+    'FNF4': [1, 2]  # dense and non-dense forest
+}
 
-def export_jaxa_tif_fnf3(aoi, year, folder):
-    year_string = str(year)
-
-    # Load JAXA FNF3 dataset
-    dataset_jaxa = (
-        ee.ImageCollection('JAXA/ALOS/PALSAR/YEARLY/FNF')
-        .filterDate(f'{year_string}-01-01', f'{year_string}-12-31')
-        .filterBounds(aoi)
-        .select('fnf')  # single band FNF3
-    )
+def get_jaxa_forest_image(aoi, year):
+    '''
+    Returns the JAXA class map for the year, clipped to the aoi and masked to forest only (see JAXA_FOREST_CLASSES).
+    '''
+    dataset = jaxa_dataset(year)
+    fnf_img = get_land_cover_image(aoi, dataset, year)
 
-    # Clip the image to AOI
-    fnf_img = dataset_jaxa.first().clip(aoi)
+    forest_mask = fnf_img.remap(JAXA_FOREST_CLASSES[dataset], [1] * len(JAXA_FOREST_CLASSES[dataset]), 0)
 
-    # Optional: mask to only forest pixels (1 and 2)
-    forest_mask = fnf_img.eq(1)
+    return fnf_img.updateMask(forest_mask)  # mask non-forest pixels
 
-    # Export using geemap
-    geemap.ee_export_image(
-        fnf_img.updateMask(forest_mask),  # mask non-forest pixels
+def export_jaxa_tif_fnf3(aoi, year, folder):
+    # Export in tiles
+    Export.export_image(
+        get_jaxa_forest_image(aoi, year),
         filename=folder + '/jaxa_fnf3.tif',  # export path
-        scale=25,  # JAXA resolution ~25m
-        region=aoi.geometry(),
-        file_per_band=False
+        aoi=aoi,
+        scale=25  # JAXA resolution ~25m
     )
 
 def export_jaxa_tif_fnf4(aoi, year, folder):
-    year_string = str(year)
-
-    #
-    dataset_jaxa = (
-        ee.ImageCollection('JAXA/ALOS/PALSAR/YEARLY/FNF4')
-        .filterDate(f'{year_string}-01-01', f'{year_string}-12-31')
-        .filterBounds(aoi)
-        .select('fnf')  # single band FNF3
-    )
-
-    fnf_img = dataset_jaxa.first().clip(aoi)
-
-    # SOMETHING IS MISSING HERE!
-    geemap.ee_export_image(
-        fnf_img,  # only mangrove pixels
+    Export.export_image(
+        get_jaxa_forest_image(aoi, year),  # dense and non-dense forest pixels, like the fnf3 export
         filename=folder + '/jaxa_fnf4.tif',  # output file in outputs folder
-        scale=25,  # 30m resolution
-        region=aoi.geometry(),
-        file_per_band=True
+        aoi=aoi,
+        scale=25  # JAXA resolution ~25m
     )
 
 #Wrapper function for fnf3 and fnf4 exports
@@ -219,59 +255,213 @@ def export_jaxa_tif(aoi, year, folder):
     else:
         export_jaxa_tif_fnf3(aoi,year, folder)
 
+###########TIME SERIES#############
+
+# Classes counted in the GMW and JAXA time series - mangroves, and forest (see JAXA_FOREST_CLASSES)
+SERIES_CLASSES = {
+    'GMW': [1],
+    'FNF3': JAXA_FOREST_CLASSES['FNF3'],
+    'FNF4': JAXA_FOREST_CLASSES['FNF4']
+}
+
+def land_cover_series_ee(aoi, dataset, start_date=None, end_date=None, tile_scale=1, scale=None):
+    '''
+    Hectares of SERIES_CLASSES[dataset] in the aoi for EVERY year of the dataset (optionally only start_date up to end_date),
+    from ONE reduction - nothing is fetched here. Each year becomes one band of a single image, and that image is reduced once.
+    Returns an ee.Dictionary of year (as a string) -> hectares.
+    '''
+    collection = ee.ImageCollection(LAND_COVER_DATASETS[dataset]['collection']).filterBounds(Context.get_aoi(aoi))
+    if start_date is not None:
+        collection = collection.filterDate(start_date, end_date)
+
+    classes = SERIES_CLASSES[dataset]
+    pixel_area_ha = Context.pixel_area_ha(aoi)
+    years = ee.List(collection.aggregate_array('system:time_start').map(lambda time: ee.Date(time).get('year'))).distinct().sort()
+
+    def year_band(year):
+        # Mosaic in case a year comes in more than one image
+        class_map = collection.filter(ee.Filter.calendarRange(year, year, 'year')).mosaic().select([0])
+        return pixel_area_ha.updateMask(class_map.remap(classes, [1] * len(classes), 0))
+
+    stack = ee.ImageCollection(years.map(year_band)).toBands().rename(years.map(lambda year: ee.Number(year).format('%d')))
+
+    return stack.reduceRegion(
+        reducer=ee.Reducer.sum(),
+        geometry=Context.get_aoi(aoi),
+        scale=scale or LAND_COVER_DATASETS[dataset]['scale'],
+        maxPixels=1e13,
+        tileScale=tile_scale
+    )
+
+def baseline_series_ee(aoi, tile_scale=1, scale=None):
+    '''
+    GMW mangrove and JAXA forest area for every available year, as ONE ee.Dictionary - nothing is fetched here.
+    JAXA is FNF3 before 2017 and FNF4 from 2017 on, same as jaxa_dataset. Use parse_baseline_series on the fetched result.
+    '''
+    return ee.Dictionary({
+        'gmw': land_cover_series_ee(aoi, 'GMW', tile_scale=tile_scale, scale=scale),
+        'jaxa_fnf3': land_cover_series_ee(aoi, 'FNF3', '1900-01-01', '2017-01-01', tile_scale, scale),
+        'jaxa_fnf4': land_cover_series_ee(aoi, 'FNF4', '2017-01-01', '2100-01-01', tile_scale, scale),
+        'area_m2': Context.area_m2_ee(aoi)
+    })
+
+def parse_baseline_series(series_info):
+    '''
+    Turns the fetched result of baseline_series_ee into {'gmw': year -> hectares, 'jaxa': year -> hectares, 'aoi_hectares'}, years in order.
+    '''
+    jaxa = {}
+    jaxa.update(series_info['jaxa_fnf3'])
+    jaxa.update(series_info['jaxa_fnf4'])
+    return {
+        'gmw': {int(year): hectares or 0.0 for year, hectares in sorted(series_info['gmw'].items())},
+        'jaxa': {int(year): hectares or 0.0 for year, hectares in sorted(jaxa.items())},
+        'aoi_hectares': series_info['area_m2'] / 10000
+    }
+
+def series_trend(series):
+    '''
+    Trend of a year -> hectares series. No earth engine calls.
+    Output: a dictionary with the first/last year and hectares, the least squares 'slope_ha_per_year',
+    and the 'annual_change_percent' - the compound yearly rate that takes the first year to the last (None if it can't be worked out).
+    '''
+    years = sorted(series)
+    if len(years) < 2:
+        return None
+
+    first_year, last_year = years[0], years[-1]
+    mean_year = sum(years) / len(years)
+    mean_hectares = sum(series[year] for year in years) / len(years)
+    slope = (sum((year - mean_year) * (series[year] - mean_hectares) for year in years)
+             / sum((year - mean_year) ** 2 for year in years))
+
+    annual_change = None
+    if series[first_year] > 0:
+        annual_change = ((series[last_year] / series[first_year]) ** (1 / (last_year - first_year)) - 1) * 100
+
+    return {
+        'first_year': first_year,
+        'last_year': last_year,
+        'first_hectares': series[first_year],
+        'last_hectares': series[last_year],
+        'slope_ha_per_year': slope,
+        'annual_change_percent': annual_change
+    }
+
+def baseline_series_from_info(series_info):
+    '''
+    The baseline time series as it goes into the report: for 'gmw' and 'jaxa', the year -> 'hectares' series and its 'trend'.
+    '''
+    series = parse_baseline_series(series_info)
+    return {
+        name: {'hectares': series[name], 'trend': series_trend(series[name])}
+        for name in ['gmw', 'jaxa']
+    }
+
+def baseline_series_key(aoi, scale=None):
+    return Cache.make_key(aoi, 'GMW,JAXA', None, 'class', scale, 'toBands.sum')
+
+def baseline_series(aoi, preview=False):
+    '''
+    GMW mangrove and JAXA forest hectares for every year the datasets have (GMW 1996-2020, JAXA 2007-2023), with trends.
+    All of it comes back from one request. See baseline_series_from_info for the layout.
+    '''
+    scale = preview_scale(preview)
+    return baseline_series_from_info(Cache.fetch(baseline_series_key(aoi, scale), baseline_series_ee(aoi, scale=scale)))
+
 #####################MURRAY#####################
 
-def murray_hectares_year_range(aoi, year_start, year_end):
+MURRAY_ID = 'JCU/Murray/GIC/global_tidal_wetland_change/2019'
+
+def murray_loss_by_year_ee(aoi, tile_scale=1, scale=None):
+    '''
+    Murray loss area per loss year, from ONE grouped reduction over the aoi - nothing is fetched here.
+    Returns an ee.List of {'lossYear': ..., 'sum': hectares} - use parse_murray_loss_by_year on the fetched result.
+    '''
     # Load dataset
-    murray_dataset = ee.Image('JCU/Murray/GIC/global_tidal_wetland_change/2019').clip(aoi)  # Don't clip
+    murray_dataset = get_murray_image(aoi)
 
     # Select relevant bands
     lossBand = murray_dataset.select('loss');
     lossYear = murray_dataset.select('lossYear');
 
-    # Define mask for range of years we desire
-    # Note - 2000 subtracted since the key in Murray counts only the last 2 digits of year - for example,
-    year_start_murray = year_start - 2000
-    year_end_murray = year_end - 2000
-    time_loss_mask = lossYear.gte(year_start_murray).And(lossYear.lte(year_end_murray));
+    # Calculation pixel area in hectares, only where there was loss
+    loss_area = Context.pixel_area_ha(aoi).updateMask(lossBand.eq(1))
 
-    periodLoss = lossBand.eq(1)
-    periodLoss = periodLoss.updateMask(time_loss_mask);
+    # Sum loss area per lossYear - every year at once instead of one reduction per window.
+    area = loss_area.addBands(lossYear).reduceRegion(
+        reducer=ee.Reducer.sum().group(groupField=1, groupName='lossYear'),
+        geometry=Context.get_aoi(aoi),
+        scale=scale or 10,  #
+        maxPixels=1e13,
+        tileScale=tile_scale
+    )
 
-    # simplify for easy calculation
+    return ee.List(area.get('groups'))
 
-    # Calculation pixel area in hectares
-    pixel_area_ha = ee.Image.pixelArea().divide(10000)
+def parse_murray_loss_by_year(groups):
+    '''
+    Turns the fetched result of murray_loss_by_year_ee into a dictionary of year -> hectares lost, with every year 1999-2019 present.
+    '''
+    loss_by_year = {year: 0.0 for year in range(1999, 2020)}
+    for group in groups:
+        # Note - Murray counts only the last 2 digits of year, so 2000 is added back
+        year = int(group['lossYear']) + 2000
+        loss_by_year[year] = loss_by_year.get(year, 0.0) + group['sum']
+    return loss_by_year
+
+def get_murray_image(aoi):
+    '''
+    Returns the Murray tidal wetland change image clipped to the aoi. Built once per context.
+    '''
+    return Context.build(aoi, 'murray', lambda: ee.Image(MURRAY_ID).clip(Context.get_aoi(aoi)))
 
-    area_img_year = pixel_area_ha.updateMask(periodLoss)
+def get_murray_loss_year_image(aoi):
+    '''
+    Returns Murray loss year (years since 2000, like the dataset's lossYear band) clipped to the aoi, masked to pixels where there was loss.
+    '''
+    murray_dataset = get_murray_image(aoi)
+    return murray_dataset.select('lossYear').updateMask(murray_dataset.select('loss').eq(1))
 
-    # Get total area - reduce over geometry
+def murray_loss_key(aoi, scale=None):
+    return Cache.make_key(aoi, MURRAY_ID, None, 'loss,lossYear', scale or 10, 'sum.group(lossYear)')
 
-    area = area_img_year.reduceRegion(
-        reducer=ee.Reducer.sum(),
-        geometry=aoi,
-        scale=10,  #
-        maxPixels=1e13,
-    )
+def murray_loss_by_year(aoi, scale=None):
+    '''
+    Returns a dictionary of year -> hectares of Murray loss in the aoi (annual loss curve, 1999-2019).
+    Fetched once per aoi (and scale), then cached.
+    '''
+    return parse_murray_loss_by_year(Cache.fetch(murray_loss_key(aoi, scale), murray_loss_by_year_ee(aoi, scale=scale)))
 
-    return ee.Number(area.get('area')).getInfo()
+def murray_loss_in_range(loss_by_year, year_start, year_end):
+    '''
+    Sums a loss curve from murray_loss_by_year between year_start and year_end (inclusive). No earth engine calls.
+    '''
+    return sum(hectares for year, hectares in loss_by_year.items() if year_start <= year <= year_end)
 
-def murray_hectares(aoi, year):
+def murray_hectares_year_range(aoi, year_start, year_end, preview=False):
+    return murray_loss_in_range(murray_loss_by_year(aoi, preview_scale(preview)), year_start, year_end)
+
+def murray_hectares_from_loss(loss_by_year, year):
     '''
-    Input start year and aoi, and function returns 2 pieces of info in a dictionary
-    OUTPUT: a dictionary containing 2 pieces of info: loss overall, and loss over last 10 years.
+    Builds the murray_hectares dictionary out of a loss curve from murray_loss_by_year. No earth engine calls.
     '''
-    total = murray_hectares_year_range(aoi,1999,2019)
-    ten_year = murray_hectares_year_range(aoi,year-9,year)
     return {
-        'ten_year_loss' : ten_year,
-        'total' : total
+        'ten_year_loss' : murray_loss_in_range(loss_by_year, year - 9, year),
+        'total' : murray_loss_in_range(loss_by_year, 1999, 2019)
     }
 
-def murray_percent(aoi, year):
-    Hectares = murray_hectares(aoi, year)
+def murray_hectares(aoi, year, preview=False):
+    '''
+    Input start year and aoi, and function returns 2 pieces of info in a dictionary
+    OUTPUT: a dictionary containing 2 pieces of info: loss overall, and loss over last 10 years.
+    preview=True gives a quick estimate at PREVIEW_SCALE.
+    '''
+    return murray_hectares_from_loss(murray_loss_by_year(aoi, preview_scale(preview)), year)
+
+def murray_percent(aoi, year, preview=False):
+    Hectares = murray_hectares(aoi, year, preview)
     return {
-        'ten_year_loss_percent' : (Hectares['ten_year_loss'] / (aoi.geometry().area(1).getInfo()/10000))*100,
-        'total_loss_percent' : (Hectares['total'] / (aoi.geometry().area(1).getInfo()/10000))*100
+        'ten_year_loss_percent' : (Hectares['ten_year_loss'] / (aoi_area_m2(aoi)/10000))*100,
+        'total_loss_percent' : (Hectares['total'] / (aoi_area_m2(aoi)/10000))*100
     }
 
@@ -0,0 +1,181 @@
+import argparse
+import csv
+import json
+import os
+import threading
+import Main_script, Workers, Trace
+
+# Columns of summary.csv, one row per site.
+SUMMARY_COLUMNS = ['site', 'filepath', 'start_year', 'sedimentation', 'status', 'error'] + Main_script.REPORT_COLUMNS
+
+def read_manifest(manifest_path):
+    '''
+    Reads a manifest CSV with columns filepath, start_year, sedimentation and (optionally) name - one row per site.
+    Relative filepaths are taken from the manifest's own folder.
+    '''
+    folder = os.path.dirname(os.path.abspath(manifest_path))
+    sites = []
+    with open(manifest_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            filepath = row['filepath']
+            if not os.path.isabs(filepath):
+                filepath = os.path.join(folder, filepath)
+            sites.append({
+                'name': row.get('name') or os.path.splitext(os.path.basename(filepath))[0],
+                'filepath': filepath,
+                'start_year': int(row['start_year']),
+                'sedimentation': float(row['sedimentation'])
+            })
+    return sites
+
+def find_sites(folder, start_year, sedimentation):
+    '''
+    Finds every .shp and .kml file under folder. They all get the same start_year and sedimentation.
+    '''
+    sites = []
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.lower().endswith(('.shp', '.kml')):
+                sites.append({
+                    'name': os.path.splitext(filename)[0],
+                    'filepath': os.path.join(root, filename),
+                    'start_year': start_year,
+                    'sedimentation': sedimentation
+                })
+    return sites
+
+def get_sites(source, start_year=None, sedimentation=None):
+    '''
+    source is either a manifest .csv, or a folder of shapefiles (then start_year and sedimentation are needed).
+    Site names are made unique, since each one becomes its own output folder.
+    '''
+    if os.path.isdir(source):
+        if start_year is None or sedimentation is None:
+            raise ValueError("A folder of sites needs start_year and sedimentation - or use a manifest csv")
+        sites = find_sites(source, start_year, sedimentation)
+    else:
+        sites = read_manifest(source)
+
+    seen = {}
+    for site in sites:
+        name = site['name']
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            site['name'] = name + '_' + str(seen[name])
+    return sites
+
+def summarize(site, report):
+    '''
+    Flattens one site's report (from Main_script.get_report) into a row of summary.csv.
+    A report with failed sections (see Main_script.build_report) is 'partial' - rerunning the batch tries it again.
+    '''
+    failed = report.get('failed', {})
+    row = {
+        'site': site['name'],
+        'filepath': site['filepath'],
+        'start_year': site['start_year'],
+        'sedimentation': site['sedimentation'],
+        'status': 'partial' if failed else 'done',
+        'error': '; '.join(section + ': ' + error for section, error in failed.items())
+    }
+    row.update(Main_script.summarize_report(report))
+    return row
+
+def read_progress(progress_path):
+    '''
+    Returns site name -> latest summary row, from the progress file of an earlier (possibly crashed) run.
+    '''
+    progress = {}
+    if os.path.exists(progress_path):
+        with open(progress_path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                # A crash mid-write can leave half a line at the end - that site just runs again.
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                progress[row['site']] = row
+    return progress
+
+def run_batch(source, output_folder, start_year=None, sedimentation=None, max_sites=4, max_workers=None, trace=False, prepare=False):
+    '''
+    Runs get_csv for every site in source (a manifest csv, or a folder of .shp/.kml files), max_sites at a time.
+    Each site gets its own output_folder/<site>/output.csv, and output_folder/summary.csv gets one row per site.
+    Finished sites are logged to output_folder/batch_progress.jsonl as they complete - rerunning after a crash
+    skips them and only runs what's left (failed and partial sites are tried again, from their checkpoints - see Main_script.get_csv).
+    max_workers and prepare (clean and simplify every boundary first - see Main_script.convert_to_ee) are passed through to get_csv for each site.
+    trace=True traces the whole batch as one run (see Trace.py) into output_folder - every event is labelled with its site.
+    Output: the summary rows, in site order.
+    '''
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    sites = get_sites(source, start_year, sedimentation)
+    progress_path = os.path.join(output_folder, 'batch_progress.jsonl')
+    progress = read_progress(progress_path)
+    progress_lock = threading.Lock()
+
+    def run_site(site):
+        try:
+            report = Main_script.get_csv(site['filepath'], site['start_year'], site['sedimentation'],
+                                         os.path.join(output_folder, site['name']), max_workers=max_workers, site=site['name'],
+                                         prepare=prepare)
+            row = summarize(site, report)
+        except Exception as error:
+            row = {
+                'site': site['name'],
+                'filepath': site['filepath'],
+                'start_year': site['start_year'],
+                'sedimentation': site['sedimentation'],
+                'status': 'failed',
+                'error': str(error)
+            }
+
+        # Log straight away, so a crash later on doesn't lose this site.
+        with progress_lock:
+            with open(progress_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(row) + '\n')
+                f.flush()
+            progress[site['name']] = row
+        return row
+
+    tasks = {}
+    for site in sites:
+        if progress.get(site['name'], {}).get('status') != 'done':
+            tasks[site['name']] = lambda site=site: run_site(site)
+
+    if trace:
+        Trace.start()
+    try:
+        Workers.run_tasks(tasks, max_sites)
+    finally:
+        if trace:
+            Main_script.finish_trace(output_folder)
+
+    rows = [progress[site['name']] for site in sites if site['name'] in progress]
+    write_summary(rows, os.path.join(output_folder, 'summary.csv'))
+    return rows
+
+def write_summary(rows, summary_path):
+    with open(summary_path, mode='w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+if __name__ == '__main__':
+    import ee
+
+    parser = argparse.ArgumentParser(description="Run get_csv over a folder or manifest of project sites.")
+    parser.add_argument('source', help="manifest .csv (filepath,start_year,sedimentation[,name]) or a folder of .shp/.kml files")
+    parser.add_argument('output_folder')
+    parser.add_argument('--start-year', type=int, help="start year for every site (folder sources only)")
+    parser.add_argument('--sedimentation', type=float, help="sedimentation in cm/year for every site (folder sources only)")
+    parser.add_argument('--max-sites', type=int, default=4, help="most sites running at the same time")
+    parser.add_argument('--trace', action='store_true', help="trace every earth engine request into the output folder")
+    parser.add_argument('--prepare', action='store_true', help="clean and simplify every boundary before measuring it")
+    args = parser.parse_args()
+
+    ee.Initialize()
+    run_batch(args.source, args.output_folder, args.start_year, args.sedimentation, args.max_sites, trace=args.trace, prepare=args.prepare)
@@ -0,0 +1,436 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Benchmarks every metric and the full report: earth engine round trips, wall time and peak memory for each.
+# Runs against a recording (see FakeEE.py), so it needs no earth engine account and always sees the same responses:
+#   python Benchmark.py record site.shp 2024 0.5 recording.json    (once, with a real earth engine session)
+#   python Benchmark.py run recording.json --check                   (anywhere - CI too)
+# --check fails (exit code 1) when any scenario makes more round trips than benchmark_baseline.json says it used to.
+# Round trips are what a change is judged on: wall time and memory depend on the machine, round trips don't.
+#   python Benchmark.py imports --check                              (startup: import time and what gets imported)
+# fails when importing the analysis path pulls in any of HEAVY_MODULES, or IMPORT_MODULE_TOLERANCE more modules than import_baseline.json.
+#   python Benchmark.py synthesize benchmark_recording.json         (a made-up recording, no earth engine - see synthesize)
+# tests/test_benchmark.py runs "run benchmark_recording.json --check" with pytest.
+#
+# Project modules are imported inside the functions - FakeEE.install() has to come before them.
+
+# Next to this file, wherever it's run from.
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(FOLDER, 'benchmark_baseline.json')
+RESULTS_FILE = 'benchmark_results.json'
+
+# A made-up recording (see synthesize) committed with the code, so the benchmark - and --check - run anywhere, CI included.
+# benchmark_baseline.json holds the round trips it takes. A recording of a real site works the same way.
+SYNTHETIC_RECORDING_FILE = os.path.join(FOLDER, 'benchmark_recording.json')
+
+# The made-up site of synthesize: a ~1200 ha coastal aoi.
+SYNTHETIC_SITE = {'filepath': 'synthetic', 'start_year': 2024, 'sedimentation': 0.5}
+SYNTHETIC_AREA_M2 = 1.2e7
+SYNTHETIC_BOUNDS = [39.2, -6.9, 39.25, -6.85]
+
+# Columns of the printed results table, in order.
+RESULT_COLUMNS = ['scenario', 'round_trips', 'cache_hits', 'wall_s', 'peak_mb', 'status']
+
+# Height used by the inundation scenario, in meters.
+INUNDATION_HEIGHT_M = 1.0
+
+# Modules the analysis path must not import at startup - map widgets and dataframes, only needed for exports and notebooks.
+HEAVY_MODULES = ['geemap', 'geopandas', 'pandas', 'ipyleaflet', 'ipywidgets', 'matplotlib', 'fiona', 'folium']
+
+# Entry points whose startup is measured.
+IMPORT_TARGETS = ['Main_script', 'Batch']
+
+IMPORT_BASELINE_FILE = os.path.join(FOLDER, 'import_baseline.json')
+
+# How many more modules than the baseline an import may pull in before imports --check fails. Module counts, unlike
+# import times, are the same on every machine and every run - a new dependency shows up as a jump of dozens.
+IMPORT_MODULE_TOLERANCE = 10
+
+# Run in a fresh interpreter for every measurement. ee is imported before the clock starts, so the numbers are
+# the project's own - the same with FakeEE as with the real ee.
+IMPORT_SCRIPT = '''
+import json, sys, time
+sys.path.insert(0, {folder!r})
+if {fake_ee!r}:
+    import FakeEE
+    FakeEE.install()
+import ee
+before = set(sys.modules)
+begin = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - begin
+modules = sorted(name for name, loaded in list(sys.modules.items()) if not getattr(loaded, 'is_fake', False))
+print(json.dumps({{'import_s': elapsed, 'modules': modules, 'added': len(set(sys.modules) - before)}}))
+'''
+
+def measure_import(module, fake_ee=False, repeat=5):
+    '''
+    Imports module in a fresh python, repeat times. fake_ee=True puts FakeEE in place of ee and geemap first
+    (where ee isn't installed).
+    Output: {'module', 'import_s' (the fastest run), 'modules' (how many the import added, leaving out ee's own),
+    'heavy_modules' (any of HEAVY_MODULES)}.
+    '''
+    folder = os.path.dirname(os.path.abspath(__file__))
+    script = IMPORT_SCRIPT.format(folder=folder, fake_ee=fake_ee, module=module)
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    return {
+        'module': module,
+        'import_s': round(min(run['import_s'] for run in runs), 4),
+        'modules': runs[0]['added'],
+        'heavy_modules': [name for name in HEAVY_MODULES if name in runs[0]['modules']]
+    }
+
+def compare_imports(results, baseline):
+    '''
+    Imports that pull in a heavy module, or more than IMPORT_MODULE_TOLERANCE modules beyond baseline (module -> module count).
+    Import times are only printed - they swing too much from run to run and machine to machine to fail a check on.
+    Output: a list of messages, empty when nothing got worse.
+    '''
+    regressions = []
+    for result in results:
+        if result['heavy_modules']:
+            regressions.append(result['module'] + ' imports ' + ', '.join(result['heavy_modules']) + ' at startup')
+        if result['module'] in baseline and result['modules'] > baseline[result['module']] + IMPORT_MODULE_TOLERANCE:
+            regressions.append(result['module'] + ': imports ' + str(result['modules']) + ' modules, was ' + str(baseline[result['module']]))
+    return regressions
+
+def write_synthetic_boundary(filepath):
+    '''
+    A shapefile of the SYNTHETIC_BOUNDS rectangle (no .prj - EPSG:4326), for get_csv to read when there's no real site file.
+    Requests are labelled without the geometry (see Cache.key_label), so it answers from any recording.
+    '''
+    import shapefile
+
+    x0, y0, x1, y1 = SYNTHETIC_BOUNDS
+    with shapefile.Writer(filepath, shapeType=shapefile.POLYGON) as writer:
+        writer.field('name', 'C')
+        writer.poly([[(x0, y0), (x0, y1), (x1, y1), (x1, y0), (x0, y0)]])
+        writer.record(SYNTHETIC_SITE['filepath'])
+
+def get_scenarios(aoi, site, folder, filepath=None):
+    '''
+    Scenario name -> function running it. Every one starts from an empty cache.
+    folder is a scratch folder for anything written to disk. filepath is the site's .shp or .kml, for get_csv -
+    a rectangle of SYNTHETIC_BOUNDS when there's none (see write_synthetic_boundary).
+    '''
+    import Main_script, Baseline, SLR, PP, Export
+
+    start_year = site['start_year']
+    sedimentation = site['sedimentation']
+
+    def get_csv():
+        # The real entry point, end to end: reading the file, checkpoints, output.csv and the results store
+        boundary = filepath
+        if boundary is None:
+            boundary = os.path.join(folder, 'synthetic.shp')
+            write_synthetic_boundary(boundary)
+        Main_script.get_csv(boundary, start_year, sedimentation, os.path.join(folder, 'get_csv'))
+
+    return {
+        'get_csv': get_csv,
+        'get_report_preview': lambda: Main_script.get_report(aoi, start_year, sedimentation, preview=True),
+        'get_report_sequential': lambda: Main_script.get_report_sequential(aoi, start_year, sedimentation),
+        'get_slr_dictionary': lambda: SLR.get_slr_dictionary(aoi, start_year),
+        'gmw_hectares': lambda: Baseline.gmw_hectares(aoi, start_year),
+        'jaxa_percent': lambda: Baseline.jaxa_percent(aoi, start_year),
+        'murray_hectares': lambda: Baseline.murray_hectares(aoi, start_year),
+        'get_elevation_data': lambda: SLR.get_elevation_data(aoi),
+        'area_inundated_percent': lambda: SLR.area_inundated_percent(aoi, INUNDATION_HEIGHT_M),
+        'scenario_grid': lambda: SLR.scenario_grid(aoi, start_year, [0.0, 0.25, 0.5, 1.0]),
+        'protected_planet_areas': lambda: PP.protected_planet_areas(aoi),
+        # Tiles only - replayed downloads aren't real GeoTIFFs, so they can't be stitched together.
+        'export_dem_tiles': lambda: Export.export_image(SLR.get_elevation_map(aoi), os.path.join(folder, 'dem.tif'), aoi, 30, mosaic=False)
+    }
+
+def run_scenario(name, scenario):
+    '''
+    Runs one scenario from an empty (memory only) cache, traced.
+    Output: a dictionary - round trips (getInfo requests actually sent, plus downloads), cache hits,
+    wall time, peak python memory, and the trace summary by metric (see Trace.summarize).
+    '''
+    import Cache, Store, Trace
+
+    # Nothing from a benchmark run is kept on disk
+    Cache.configure(path=None)
+    Cache.clear(memory_only=True)
+    Store.configure(path=None)
+
+    Trace.start()
+    tracemalloc.start()
+    begin = time.perf_counter()
+    status = 'ok'
+    error = None
+    try:
+        scenario()
+    except Exception as exception:
+        status = 'failed'
+        error = str(exception)
+    wall_s = time.perf_counter() - begin
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    events = Trace.stop()
+
+    return {
+        'scenario': name,
+        'round_trips': sum(1 for event in events if (event['kind'] == 'getInfo' and not event['shared']) or event['kind'] == 'export'),
+        'cache_hits': sum(1 for event in events if event['kind'] == 'cache_hit'),
+        'wall_s': round(wall_s, 3),
+        'peak_mb': round(peak / 1e6, 2),
+        'status': status,
+        'error': error,
+        'metrics': Trace.summarize(events)
+    }
+
+def run_scenarios(aoi, site, only=None, filepath=None):
+    '''
+    Runs every scenario (or just the ones named in only). Output: one result per scenario (see run_scenario), in order.
+    '''
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for name, scenario in get_scenarios(aoi, site, folder, filepath).items():
+            if only and name not in only:
+                continue
+            results.append(run_scenario(name, scenario))
+    return results
+
+def record(filepath, start_year, sedimentation, recording_path, only=None):
+    '''
+    Runs the scenarios against the real earth engine for the site in filepath, saving every response to recording_path.
+    Needs ee.Initialize() first.
+    '''
+    import FakeEE, Main_script
+
+    site = {'filepath': os.path.basename(filepath), 'start_year': start_year, 'sedimentation': sedimentation}
+    recording = FakeEE.record(FakeEE.new_recording(site))
+    aoi = Main_script.convert_to_ee(filepath)
+    try:
+        results = run_scenarios(aoi, site, only, filepath)
+    finally:
+        import Scheduler
+        Scheduler.set_backend()
+    FakeEE.save(recording, recording_path)
+    return results
+
+def synthetic_slr_mm(prefix, year, band):
+    '''
+    Made-up SLR in mm for an IPCC AR6 scenario prefix ('ssp370'...), year and quantile band: rising by decade,
+    higher for SSP5-8.5 and the upper quantiles.
+    '''
+    import SLR
+
+    quantile = float(band.rsplit('quantile_', 1)[1].replace('_', '.'))
+    scenario_index = list(SLR.SLR_SCENARIOS.values()).index(prefix)
+    return (100.0 + 8 * (year - 2020)) * (1 + 0.15 * scenario_index) * (0.55 + 0.6 * quantile)
+
+def synthetic_response(label):
+    '''
+    A made-up response for a request label (see Cache.key_label), shaped like earth engine's - for synthesize.
+    Numbers are plausible for SYNTHETIC_SITE rather than real, and the same every time.
+    '''
+    # Planner's pieces of a split reduction ('<label>|part 1 of 4') get the whole answer divided between them
+    label, _, part = label.partition('|')
+    parts = int(part.split()[-1]) if part else 1
+    parts_of = lambda value: value / parts
+
+    request = json.loads(label)
+    dataset = request['dataset']
+    reducer = request['reducer'] or ''
+    pixel_hectares = SYNTHETIC_AREA_M2 / 10000 * 0.998
+
+    if dataset == 'geometry' and reducer == 'bounds':
+        x0, y0, x1, y1 = SYNTHETIC_BOUNDS
+        return {'type': 'Polygon', 'coordinates': [[[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]]}
+    if dataset == 'geometry':
+        return SYNTHETIC_AREA_M2
+
+    if dataset == 'IPCC/AR6/SLP':
+        import SLR
+        # Every scenario, decade and quantile band, in mm
+        values = {}
+        for prefix in SLR.SLR_SCENARIOS.values():
+            for year in SLR.get_decade_years(request['year']):
+                for name, band in request['band']:
+                    values[prefix + '_' + str(year) + '_' + name] = synthetic_slr_mm(prefix, year, band)
+        return values
+    if dataset.startswith('IPCC/AR6/SLP/'):
+        # One year's median, in meters (see SLR.get_nasa_slr_ee) - the same number as in the stacked image
+        prefix, year = dataset.rsplit('/', 1)[1].split('_')
+        return synthetic_slr_mm(prefix, int(year), request['band']) / 1000
+
+    if dataset == 'COPERNICUS/DEM/GLO30' and reducer.startswith('sum.group'):
+        # 1 cm bins from -0.5 to 4 m, more area low down
+        groups = [{'bin': elevation_bin, 'sum': parts_of(pixel_hectares * 2 * (450 - index) / (450 * 451))}
+                  for index, elevation_bin in enumerate(range(-50, 400))]
+        return {'groups': groups, 'total': parts_of(pixel_hectares)}
+    if dataset == 'COPERNICUS/DEM/GLO30':
+        return {'DEM_mean': 1.1, 'DEM_min': -0.5, 'DEM_max': 4.0}
+
+    if dataset.startswith('JCU/Murray'):
+        return [{'lossYear': year, 'sum': parts_of(1.5 + 0.1 * year)} for year in range(1, 20)]
+
+    if dataset.startswith('WCMC/WDPA'):
+        return {'groups': [{'pp_code': 203, 'sum': parts_of(300.0)}, {'pp_code': 701, 'sum': parts_of(45.5)}],
+                'area_m2': SYNTHETIC_AREA_M2}
+
+    if request['band'] == 'class':
+        # GMW: mangroves. JAXA: dense and non-dense forest, non-forest, water
+        shares = {1: 0.35} if 'GMW' in dataset else {1: 0.2, 2: 0.1, 3: 0.6, 4: 0.1}
+        areas = {'groups': [{'class': code, 'sum': parts_of(pixel_hectares * share)} for code, share in shares.items()],
+                 'area_m2': SYNTHETIC_AREA_M2}
+        # Only JAXA's percentages need the pixel area (see Baseline.land_cover_areas_ee)
+        if 'GMW' not in dataset:
+            areas['pixel_hectares'] = parts_of(pixel_hectares)
+        return areas
+
+    raise KeyError("No synthetic response for " + label)
+
+def synthesize(recording_path, only=None):
+    '''
+    Makes a recording without earth engine: the scenarios run against FakeEE, every request answered by synthetic_response.
+    Output: the results of the run (see run_scenario).
+    '''
+    import FakeEE
+    FakeEE.install()
+    import ee, Scheduler
+
+    recording = FakeEE.record(FakeEE.new_recording(dict(SYNTHETIC_SITE)), respond=synthetic_response)
+    try:
+        results = run_scenarios(ee.FeatureCollection('benchmark site'), SYNTHETIC_SITE, only)
+    finally:
+        Scheduler.set_backend()
+    # No latency in a made-up recording
+    recording['latency'] = {label: 0.0 for label in recording['latency']}
+    FakeEE.save(recording, recording_path)
+    return results
+
+def replay(recording_path, latency=0.0, only=None):
+    '''
+    Runs the scenarios against the recording in recording_path - no earth engine involved.
+    latency: seconds every round trip takes, or 'recorded' (see FakeEE.replay).
+    '''
+    import FakeEE
+    FakeEE.install()
+    import ee
+
+    recording = FakeEE.load(recording_path)
+    FakeEE.replay(recording, latency)
+    # Labels leave out the geometry, so any (fake) aoi answers with the recorded site's responses.
+    aoi = ee.FeatureCollection('benchmark site')
+    return run_scenarios(aoi, recording['site'], only)
+
+def compare(results, baseline):
+    '''
+    Scenarios making more round trips than in baseline (scenario -> round trips, see write_baseline), failing,
+    or missing from it - a scenario nobody has a baseline for can't be checked.
+    Output: a list of messages, empty when nothing got worse.
+    '''
+    regressions = []
+    for result in results:
+        if result['status'] != 'ok':
+            regressions.append(result['scenario'] + ' failed: ' + str(result['error']))
+        elif result['scenario'] not in baseline:
+            regressions.append(result['scenario'] + ': no baseline (run with --update-baseline)')
+        elif result['round_trips'] > baseline[result['scenario']]:
+            regressions.append(result['scenario'] + ': ' + str(result['round_trips']) + ' round trips, was '
+                               + str(baseline[result['scenario']]))
+    return regressions
+
+def read_baseline(baseline_path):
+    if not os.path.exists(baseline_path):
+        return {}
+    with open(baseline_path, encoding='utf-8') as f:
+        return json.load(f)
+
+def write_baseline(results, baseline_path):
+    with open(baseline_path, 'w', encoding='utf-8') as f:
+        json.dump({result['scenario']: result['round_trips'] for result in results if result['status'] == 'ok'}, f, indent=1, sort_keys=True)
+
+def format_results(results):
+    '''
+    The results as a plain text table, for printing.
+    '''
+    table = [RESULT_COLUMNS] + [[result[column] for column in RESULT_COLUMNS] for result in results]
+    widths = [max(len(str(line[index])) for line in table) for index in range(len(RESULT_COLUMNS))]
+    return '\n'.join('  '.join(str(value).ljust(width) for value, width in zip(line, widths)) for line in table)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark round trips, wall time and peak memory of every metric and the full report.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help="run against the real earth engine and save every response")
+    record_parser.add_argument('filepath', help="project .shp or .kml")
+    record_parser.add_argument('start_year', type=int)
+    record_parser.add_argument('sedimentation', type=float)
+    record_parser.add_argument('recording', help="where to save the recording (.json)")
+
+    synthesize_parser = commands.add_parser('synthesize', help="make up a recording, without earth engine")
+    synthesize_parser.add_argument('recording', nargs='?', default=SYNTHETIC_RECORDING_FILE, help="where to save the recording (.json)")
+
+    run_parser = commands.add_parser('run', help="replay a recording")
+    run_parser.add_argument('recording')
+    run_parser.add_argument('--latency', default='0', help="seconds per round trip, or 'recorded'")
+    run_parser.add_argument('--baseline', default=BASELINE_FILE, help="round trips per scenario to compare against")
+    run_parser.add_argument('--check', action='store_true', help="exit with an error if any scenario makes more round trips than the baseline")
+    run_parser.add_argument('--update-baseline', action='store_true', help="save these round trips as the new baseline")
+
+    for command_parser in [record_parser, synthesize_parser, run_parser]:
+        command_parser.add_argument('--only', nargs='+', help="scenarios to run (default: all)")
+        command_parser.add_argument('--output', default=RESULTS_FILE, help="where to write the full results (.json)")
+
+    imports_parser = commands.add_parser('imports', help="measure what the entry points import, and how long it takes")
+    imports_parser.add_argument('--fake-ee', action='store_true', help="use FakeEE instead of ee and geemap (where ee isn't installed)")
+    imports_parser.add_argument('--baseline', default=IMPORT_BASELINE_FILE, help="modules imported per entry point to compare against")
+    imports_parser.add_argument('--check', action='store_true', help="exit with an error if startup got heavier than the baseline")
+    imports_parser.add_argument('--update-baseline', action='store_true', help="save these module counts as the new baseline")
+    args = parser.parse_args()
+
+    if args.command == 'imports':
+        results = [measure_import(module, args.fake_ee) for module in IMPORT_TARGETS]
+        for result in results:
+            print(result['module'] + ': ' + str(result['import_s']) + ' s, ' + str(result['modules']) + ' modules'
+                  + (', heavy: ' + ', '.join(result['heavy_modules']) if result['heavy_modules'] else ''))
+        regressions = compare_imports(results, read_baseline(args.baseline))
+        if args.update_baseline:
+            with open(args.baseline, 'w', encoding='utf-8') as f:
+                json.dump({result['module']: result['modules'] for result in results}, f, indent=1, sort_keys=True)
+        if regressions:
+            print('\n'.join(['', 'Worse than ' + args.baseline + ':'] + regressions))
+            if args.check:
+                sys.exit(1)
+        sys.exit(0)
+
+    if args.command == 'record':
+        import ee
+        ee.Initialize()
+        results = record(args.filepath, args.start_year, args.sedimentation, args.recording, args.only)
+    elif args.command == 'synthesize':
+        results = synthesize(args.recording, args.only)
+    else:
+        latency = args.latency if args.latency == 'recorded' else float(args.latency)
+        results = replay(args.recording, latency, args.only)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1, default=str)
+    print(format_results(results))
+
+    if args.command == 'run':
+        if args.update_baseline:
+            write_baseline(results, args.baseline)
+        elif args.check and not os.path.exists(args.baseline):
+            print('\nNo baseline at ' + args.baseline + ' - nothing to check against (run with --update-baseline first)')
+            sys.exit(1)
+        regressions = compare(results, read_baseline(args.baseline))
+        if regressions:
+            print('\n'.join(['', 'Worse than ' + args.baseline + ':'] + regressions))
+            if args.check:
+                sys.exit(1)
@@ -0,0 +1,242 @@
+import ee
+import Scheduler
+import Trace
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Settings - change these with configure().
+settings = {
+    # Where the cache lives on disk. None = memory only (nothing survives the session).
+    'path': os.path.join(os.path.expanduser('~'), '.calyx_cache', 'results.sqlite'),
+    # How long a result stays good, in seconds (30 days).
+    'default_ttl': 30 * 24 * 60 * 60,
+    # Once the cache file holds more than this many bytes of results, the least recently used ones are dropped.
+    'max_bytes': 200 * 1024 * 1024
+}
+
+# Datasets that change more often than default_ttl, by dataset id prefix -> ttl in seconds.
+# WDPA is republished monthly, so its results are only trusted for a week.
+DATASET_TTL = {
+    'WCMC/WDPA': 7 * 24 * 60 * 60
+}
+
+# Results that have already been fetched this session, keyed by make_key -> (value, expires).
+_memory = {}
+_lock = threading.Lock()
+
+# Cache key -> the same parts minus the geometry (see key_label).
+_key_labels = {}
+
+# Returned by lookup when there is nothing cached (None is a valid earth engine result).
+MISSING = object()
+
+def configure(path=MISSING, default_ttl=None, max_bytes=None):
+    '''
+    Changes cache settings. path=None turns off the on-disk cache.
+    '''
+    if path is not MISSING:
+        settings['path'] = path
+    if default_ttl is not None:
+        settings['default_ttl'] = default_ttl
+    if max_bytes is not None:
+        settings['max_bytes'] = max_bytes
+
+def geometry_hash(aoi):
+    '''
+    Returns a hash of the aoi geometry. Serializing an ee object happens locally, so this never talks to earth engine.
+    aoi can also be a context (see Context.py) - its hash is kept in it, so a big geometry is only serialized once per run.
+    '''
+    if isinstance(aoi, dict):
+        if 'geometry_hash' not in aoi['fetched']:
+            aoi['fetched']['geometry_hash'] = geometry_hash(aoi['aoi'])
+        return aoi['fetched']['geometry_hash']
+    return hashlib.sha256(aoi.geometry().serialize().encode('utf-8')).hexdigest()
+
+def make_key(aoi, dataset, year=None, band=None, scale=None, reducer=None):
+    '''
+    Builds a cache key out of everything an earth engine result depends on:
+    the aoi geometry, the dataset id, and the year, band, scale and reducer used on it.
+    '''
+    parts = {
+        'geometry': geometry_hash(aoi),
+        'dataset': dataset,
+        'year': year,
+        'band': band,
+        'scale': scale,
+        'reducer': reducer
+    }
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+    # The dataset stays readable at the front of the key, so its ttl can be looked up.
+    key = dataset + '|' + digest
+    Trace.describe_key(key, parts)
+    _key_labels[key] = json.dumps({name: value for name, value in parts.items() if name != 'geometry'}, sort_keys=True, default=str)
+    return key
+
+def key_label(key):
+    '''
+    What a key asks for, without the geometry: readable, and the same whatever library serialized the aoi.
+    Keys built on top of a make_key key (like Planner's '<key>|part 1 of 4') get that key's label plus the rest.
+    None for keys that weren't made by make_key this session.
+    '''
+    if key in _key_labels:
+        return _key_labels[key]
+    if '|' in key:
+        base, rest = key.rsplit('|', 1)
+        label = key_label(base)
+        if label is not None:
+            return label + '|' + rest
+    return None
+
+def get_ttl(key):
+    dataset = key.split('|')[0]
+    for prefix, ttl in DATASET_TTL.items():
+        if dataset.startswith(prefix):
+            return ttl
+    return settings['default_ttl']
+
+def _connect():
+    folder = os.path.dirname(settings['path'])
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    connection = sqlite3.connect(settings['path'], timeout=30)
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS results ('
+        'key TEXT PRIMARY KEY, value TEXT, size INTEGER, expires REAL, accessed REAL)'
+    )
+    connection.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+    return connection
+
+def lookup(key):
+    '''
+    Returns the cached value for key, or MISSING if it isn't cached (or has expired).
+    '''
+    now = time.time()
+
+    with _lock:
+        if key in _memory:
+            value, expires = _memory[key]
+            if expires > now:
+                return value
+            del _memory[key]
+
+    if settings['path'] is None:
+        return MISSING
+
+    with _lock:
+        connection = _connect()
+        try:
+            row = connection.execute('SELECT value, expires FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return MISSING
+            if row[1] <= now:
+                connection.execute('DELETE FROM results WHERE key = ?', (key,))
+                connection.commit()
+                return MISSING
+            connection.execute('UPDATE results SET accessed = ? WHERE key = ?', (now, key))
+            connection.commit()
+        finally:
+            connection.close()
+
+        value = json.loads(row[0])
+        _memory[key] = (value, row[1])
+        return value
+
+def store(key, value):
+    '''
+    Saves value (anything json can hold - usually a getInfo() result) under key, and returns it.
+    '''
+    now = time.time()
+    expires = now + get_ttl(key)
+
+    with _lock:
+        _memory[key] = (value, expires)
+
+        if settings['path'] is not None:
+            text = json.dumps(value)
+            connection = _connect()
+            try:
+                connection.execute(
+                    'INSERT OR REPLACE INTO results (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)',
+                    (key, text, len(text), expires, now)
+                )
+                _evict(connection, now, key)
+                connection.commit()
+            finally:
+                connection.close()
+
+    return value
+
+def _evict(connection, now, keep_key):
+    # Expired results first, then least recently used until the cache fits in max_bytes. The result just stored always stays.
+    connection.execute('DELETE FROM results WHERE expires <= ?', (now,))
+    total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+    if total <= settings['max_bytes']:
+        return
+
+    for key, size in connection.execute('SELECT key, size FROM results WHERE key != ? ORDER BY accessed', (keep_key,)).fetchall():
+        connection.execute('DELETE FROM results WHERE key = ?', (key,))
+        total -= size
+        if total <= settings['max_bytes']:
+            break
+
+def fetch(key, ee_object):
+    '''
+    Returns the cached result for key if there is one - otherwise fetches ee_object (through the Scheduler), caches the result and returns it.
+    '''
+    value = lookup(key)
+    if value is MISSING:
+        with Trace.span('getInfo', keys=[key], ee_object=ee_object) as event:
+            value = Scheduler.evaluate(ee_object, key_label(key))
+            Trace.set_payload(event, value)
+        value = store(key, value)
+    else:
+        Trace.record('cache_hit', keys=[key])
+    return value
+
+def fetch_many(requests):
+    '''
+    Like fetch, for many results at once.
+    Input: a dictionary of name -> (key, ee object)
+    Output: a dictionary of name -> result. Everything not already cached comes back in ONE request.
+    '''
+    results = {}
+    missing = {}
+    for name, (key, ee_object) in requests.items():
+        value = lookup(key)
+        if value is MISSING:
+            missing[name] = (key, ee_object)
+        else:
+            results[name] = value
+
+    if results:
+        Trace.record('cache_hit', names=list(results), keys=[requests[name][0] for name in results])
+
+    if missing:
+        request = ee.Dictionary({name: ee_object for name, (key, ee_object) in missing.items()})
+        with Trace.span('getInfo', names=list(missing), keys=[key for key, ee_object in missing.values()], ee_object=request) as event:
+            info = Scheduler.evaluate(request, {name: key_label(key) for name, (key, ee_object) in missing.items()})
+            Trace.set_payload(event, info)
+        for name, (key, ee_object) in missing.items():
+            results[name] = store(key, info[name])
+
+    return results
+
+def clear(memory_only=False):
+    '''
+    Forgets everything cached - this session, and on disk unless memory_only=True.
+    '''
+    with _lock:
+        _memory.clear()
+        if not memory_only and settings['path'] is not None and os.path.exists(settings['path']):
+            connection = _connect()
+            try:
+                connection.execute('DELETE FROM results')
+                connection.commit()
+            finally:
+                connection.close()
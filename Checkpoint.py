@@ -0,0 +1,73 @@
+import json
+import os
+import shutil
+import time
+
+# Checkpoints of a get_csv run: every metric is saved into <folder>/.checkpoints as soon as it's fetched (or marked failed),
+# one file per metric. If the run dies or a metric times out, running it again only fetches what isn't checkpointed yet,
+# and output.csv is put together from the checkpoints - see Main_script.get_report_checkpointed.
+# Each checkpoint keeps the cache key of its metric (see Cache.make_key), so a rerun with a different aoi, year or
+# scale never picks up the wrong numbers. Once every metric is in and output.csv is written, the checkpoints are removed.
+
+FOLDER_NAME = '.checkpoints'
+
+def checkpoint_folder(folder):
+    return os.path.join(folder, FOLDER_NAME)
+
+def checkpoint_path(folder, name):
+    return os.path.join(checkpoint_folder(folder), name + '.json')
+
+def write(folder, name, key, value=None, error=None, reduction_settings=None):
+    '''
+    Saves one metric: its fetched value, or error when it failed. reduction_settings is its plan (see Planner.plan_requests).
+    Written to a side file first - a checkpoint cut off halfway must never look finished.
+    '''
+    if not os.path.exists(checkpoint_folder(folder)):
+        os.makedirs(checkpoint_folder(folder), exist_ok=True)
+
+    checkpoint = {
+        'name': name,
+        'key': key,
+        'status': 'failed' if error is not None else 'done',
+        'value': value,
+        'error': None if error is None else str(error),
+        'reduction_settings': reduction_settings,
+        'time': time.time()
+    }
+    path = checkpoint_path(folder, name)
+    with open(path + '.partial', 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.partial', path)
+
+def read(folder):
+    '''
+    Every checkpoint in folder: metric name -> checkpoint (see write). Unreadable files are skipped - that metric just runs again.
+    '''
+    checkpoints = {}
+    if not os.path.exists(checkpoint_folder(folder)):
+        return checkpoints
+
+    for filename in sorted(os.listdir(checkpoint_folder(folder))):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(checkpoint_folder(folder), filename), encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except ValueError:
+            continue
+        checkpoints[checkpoint['name']] = checkpoint
+    return checkpoints
+
+def read_done(folder, keys):
+    '''
+    The checkpoints that can be used as they are: finished, and made with the same key (keys: metric name -> cache key).
+    '''
+    return {name: checkpoint for name, checkpoint in read(folder).items()
+            if checkpoint['status'] == 'done' and keys.get(name) == checkpoint['key']}
+
+def clear(folder):
+    '''
+    Removes every checkpoint in folder.
+    '''
+    if os.path.exists(checkpoint_folder(folder)):
+        shutil.rmtree(checkpoint_folder(folder))
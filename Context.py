@@ -0,0 +1,73 @@
+import ee
+
+# A context holds everything worked out from one aoi during a run - dataset images, the DEM mosaic, pixel area,
+# the area denominators - so each is built once and shared, instead of rebuilt by every metric function.
+# Every function in Baseline, SLR and PP that takes an aoi also takes a context: make one with get_context(aoi)
+# at the start of a run (Main_script does) and pass it around in place of the aoi.
+# A context is a plain dictionary - {'aoi': the featureCollection, 'built': name -> ee object, 'fetched': name -> python value}.
+
+def get_context(aoi):
+    '''
+    Returns a context for aoi - or aoi itself when it already is one, so functions can call this on whatever they were given.
+    '''
+    if is_context(aoi):
+        return aoi
+    return {'aoi': aoi, 'built': {}, 'fetched': {}}
+
+def is_context(aoi):
+    return isinstance(aoi, dict) and 'built' in aoi
+
+def get_aoi(aoi):
+    '''
+    The featureCollection behind a context (or aoi itself when it's not one) - for earth engine calls that need the real thing.
+    '''
+    if is_context(aoi):
+        return aoi['aoi']
+    return aoi
+
+def build(aoi, name, builder):
+    '''
+    Returns the ee object called name in the context, calling builder() the first time only.
+    Nothing is fetched - earth engine only sees it once, however many requests it goes into.
+    '''
+    built = get_context(aoi)['built']
+    if name not in built:
+        built[name] = builder()
+    return built[name]
+
+def fetch(aoi, name, fetcher):
+    '''
+    Same as build, for python values (fetcher() goes to the cache or earth engine the first time only).
+    '''
+    fetched = get_context(aoi)['fetched']
+    if name not in fetched:
+        fetched[name] = fetcher()
+    return fetched[name]
+
+def pixel_area_ha(aoi):
+    '''
+    Area of every pixel in hectares (ee.Image.pixelArea() / 10000).
+    '''
+    return build(aoi, 'pixel_area_ha', lambda: ee.Image.pixelArea().divide(10000))
+
+def area_m2_ee(aoi):
+    '''
+    Geometry area of the aoi in square meters, as an ee.Number.
+    '''
+    return build(aoi, 'area_m2', lambda: get_aoi(aoi).geometry().area(1))
+
+def pixel_hectares_ee(aoi, scale, tile_scale=1):
+    '''
+    Pixel-based area of the aoi in hectares at scale (meters), as an ee.Number - the area of every pixel whose centre is in the aoi.
+    This is the denominator for percentages of pixel counts: the geometry area is slightly off from what the pixels cover.
+    '''
+    def builder():
+        return ee.Number(pixel_area_ha(aoi).reduceRegion(
+            reducer=ee.Reducer.sum(),
+            geometry=get_aoi(aoi),
+            scale=scale,
+            maxPixels=1e13,
+            tileScale=tile_scale
+        ).get('area'))
+
+    return build(aoi, ('pixel_hectares', scale, tile_scale), builder)
@@ -0,0 +1,204 @@
+import ee
+import hashlib
+import json
+import math
+import os
+import shutil
+import urllib.request
+import Cache, Scheduler, Workers, Context, Trace
+
+# Earth engine refuses synchronous downloads over 48 MB (50331648 bytes) or 32768 pixels on a side.
+# Tiles are planned to stay well under both - the GeoTIFF comes back slightly bigger than the raw pixels.
+MAX_TILE_BYTES = 32 * 1024 * 1024
+MAX_TILE_PIXELS = 10000
+
+# Meters per degree at the equator - how earth engine turns a scale in meters into degrees for EPSG:4326.
+METERS_PER_DEGREE = 111319.49
+
+def bounds_key(aoi):
+    return Cache.make_key(aoi, 'geometry', None, None, None, 'bounds')
+
+def get_bounds(aoi):
+    '''
+    Returns the bounding box of the aoi (or context) as [xmin, ymin, xmax, ymax] in degrees. Cached.
+    '''
+    ring = Cache.fetch(bounds_key(aoi), Context.get_aoi(aoi).geometry().bounds())['coordinates'][0]
+    xs = [point[0] for point in ring]
+    ys = [point[1] for point in ring]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+def plan_tiles(bounds, scale, band_count=1, bytes_per_pixel=4):
+    '''
+    Splits bounds ([xmin, ymin, xmax, ymax] in degrees) into a grid of tiles that each fit under the download limit at scale (meters).
+    Every tile edge sits on the same pixel grid, so the tiles line up exactly when they're put back together.
+    Output: (crs_transform, tiles) - the shared EPSG:4326 pixel grid, and a list of tiles as {'row', 'col', 'bounds'}.
+    '''
+    pixel_size = scale / METERS_PER_DEGREE
+
+    # Snap the bounds outwards onto the pixel grid
+    x0 = math.floor(bounds[0] / pixel_size) * pixel_size
+    y0 = math.ceil(bounds[3] / pixel_size) * pixel_size
+    width = max(1, math.ceil((bounds[2] - x0) / pixel_size))
+    height = max(1, math.ceil((y0 - bounds[1]) / pixel_size))
+
+    # Most pixels a tile can hold, in bytes and in size on a side
+    max_pixels = MAX_TILE_BYTES // (band_count * bytes_per_pixel)
+    columns = max(1, math.ceil(width / MAX_TILE_PIXELS))
+    rows = max(1, math.ceil(height / MAX_TILE_PIXELS))
+    while math.ceil(width / columns) * math.ceil(height / rows) > max_pixels:
+        # Split along the longer side of the tiles first, to keep them close to square
+        if math.ceil(width / columns) >= math.ceil(height / rows):
+            columns += 1
+        else:
+            rows += 1
+
+    tile_width = math.ceil(width / columns)
+    tile_height = math.ceil(height / rows)
+
+    tiles = []
+    for row in range(rows):
+        for col in range(columns):
+            left = col * tile_width
+            top = row * tile_height
+            right = min(width, left + tile_width)
+            bottom = min(height, top + tile_height)
+            if left >= right or top >= bottom:
+                continue
+            tiles.append({
+                'row': row,
+                'col': col,
+                'bounds': [x0 + left * pixel_size, y0 - bottom * pixel_size, x0 + right * pixel_size, y0 - top * pixel_size]
+            })
+
+    crs_transform = [pixel_size, 0, x0, 0, -pixel_size, y0]
+    return crs_transform, tiles
+
+def download_tile(image, tile, crs_transform, tile_path, trace_fields=None):
+    '''
+    Downloads one tile of image as a GeoTIFF to tile_path. Does nothing if the tile was already downloaded.
+    trace_fields are passed on to Trace.span (metric, datasets, scales) - the download thread can't tell who asked for it.
+    '''
+    if os.path.exists(tile_path):
+        return tile_path
+
+    region = ee.Geometry.Rectangle(tile['bounds'], 'EPSG:4326', False)
+
+    def download():
+        url = image.getDownloadURL({
+            'region': region,
+            'crs': 'EPSG:4326',
+            'crs_transform': crs_transform,
+            'format': 'GEO_TIFF'
+        })
+        # Write to a side file first - a half-downloaded tile must never look finished.
+        partial_path = tile_path + '.partial'
+        with urllib.request.urlopen(url, timeout=600) as response, open(partial_path, 'wb') as f:
+            shutil.copyfileobj(response, f)
+        os.replace(partial_path, tile_path)
+        return tile_path
+
+    # Through the scheduler, so downloads count towards max_in_flight and get retried when earth engine is busy.
+    with Trace.span('export', names=[os.path.basename(tile_path)], **(trace_fields or {})) as event:
+        Scheduler.call(download)
+        Trace.set_payload(event, size=os.path.getsize(tile_path))
+    return tile_path
+
+def mosaic_tiles(tile_paths, filename, nodata=None):
+    '''
+    Stitches downloaded tiles back into one GeoTIFF at filename. nodata (if given) is recorded as the file's no data value.
+    The tiles share one pixel grid (see plan_tiles), so each one is copied straight into its own window of the output -
+    only one tile is ever in memory, however big the aoi is.
+    '''
+    import rasterio
+    from rasterio.transform import Affine
+    from rasterio.windows import Window
+
+    with rasterio.open(tile_paths[0]) as first:
+        profile = first.profile.copy()
+        pixel_width, pixel_height = first.transform.a, first.transform.e
+
+    # The output covers every tile
+    extents = []
+    for path in tile_paths:
+        with rasterio.open(path) as source:
+            extents.append(source.bounds)
+    left = min(extent.left for extent in extents)
+    top = max(extent.top for extent in extents)
+    width = int(round((max(extent.right for extent in extents) - left) / pixel_width))
+    height = int(round((min(extent.bottom for extent in extents) - top) / pixel_height))
+
+    profile.update(driver='GTiff', height=height, width=width, transform=Affine(pixel_width, 0, left, 0, pixel_height, top),
+                   compress='deflate', tiled=True, blockxsize=256, blockysize=256, bigtiff='IF_SAFER')
+    if nodata is not None:
+        profile.update(nodata=nodata)
+
+    with rasterio.open(filename, 'w', **profile) as destination:
+        for path in tile_paths:
+            with rasterio.open(path) as source:
+                col_off = int(round((source.transform.c - left) / pixel_width))
+                row_off = int(round((source.transform.f - top) / pixel_height))
+                destination.write(source.read(), window=Window(col_off, row_off, source.width, source.height))
+
+def tile_fingerprint(image, crs_transform, tiles):
+    '''
+    Hash of everything a tile's pixels depend on: the image expression (datasets, aoi, heights...) and the tile plan.
+    Serializing happens locally - no earth engine call.
+    '''
+    plan = json.dumps({'crs_transform': crs_transform, 'tiles': tiles}, sort_keys=True)
+    return hashlib.sha256((image.serialize() + plan).encode('utf-8')).hexdigest()
+
+def prepare_tile_folder(tile_folder, fingerprint):
+    '''
+    Makes sure tile_folder only holds tiles of this export. Tiles left by an export of something else (another image, aoi,
+    scale or height under the same filename) are thrown away - its manifest.json doesn't have this fingerprint.
+    '''
+    manifest_path = os.path.join(tile_folder, 'manifest.json')
+    if os.path.exists(tile_folder):
+        try:
+            with open(manifest_path, encoding='utf-8') as f:
+                matches = json.load(f).get('fingerprint') == fingerprint
+        except (OSError, ValueError):
+            matches = False
+        if matches:
+            return
+        shutil.rmtree(tile_folder)
+
+    os.makedirs(tile_folder)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'fingerprint': fingerprint}, f)
+
+def export_image(image, filename, aoi, scale, band_count=1, bytes_per_pixel=4, max_workers=Workers.DEFAULT_MAX_WORKERS,
+                 mosaic=True, nodata=None):
+    '''
+    Exports image over the aoi as one GeoTIFF at filename, at full resolution (scale in meters) no matter how big the aoi is.
+    The aoi is cut into tiles that fit under earth engine's download limit (see plan_tiles), the tiles are downloaded
+    max_workers at a time into a <filename>_tiles folder, then put back together into one file.
+    If some tiles fail, the ones that worked are kept - running the export again only downloads the rest. Kept tiles are only
+    reused by the exact same export (same image and tile plan - see tile_fingerprint), never mixed into a different one.
+    mosaic=False keeps the tiles as they are (one aligned set of GeoTIFFs) instead of stitching them together.
+    Output: filename, or the list of tile paths when mosaic=False.
+    '''
+    crs_transform, tiles = plan_tiles(get_bounds(aoi), scale, band_count, bytes_per_pixel)
+    trace_fields = {'metric': Trace.caller(), 'datasets': [os.path.basename(filename)], 'scales': [scale]}
+
+    tile_folder = os.path.splitext(filename)[0] + '_tiles'
+    prepare_tile_folder(tile_folder, tile_fingerprint(image, crs_transform, tiles))
+
+    tasks = {}
+    for tile in tiles:
+        tile_path = os.path.join(tile_folder, 'tile_' + str(tile['row']) + '_' + str(tile['col']) + '.tif')
+        tasks[tile_path] = lambda tile=tile, tile_path=tile_path: download_tile(image, tile, crs_transform, tile_path, trace_fields)
+
+    results, errors = Workers.run_tasks(tasks, max_workers)
+    if errors:
+        raise RuntimeError(str(len(errors)) + ' of ' + str(len(tiles)) + ' tiles failed to download (run the export again to retry them): '
+                           + '; '.join(os.path.basename(path) + ' - ' + str(error) for path, error in errors.items()))
+
+    if not mosaic:
+        return list(results.values())
+
+    mosaic_tiles(list(results.values()), filename, nodata)
+
+    # Only thrown away once the mosaic is safely written
+    shutil.rmtree(tile_folder)
+    return filename
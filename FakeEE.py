@@ -0,0 +1,187 @@
+import base64
+import copy
+import hashlib
+import json
+import sys
+import threading
+import time
+import types
+
+# A stand-in for earth engine, to measure and regression-test the code without an account:
+# - record: run with the real earth engine, keeping every response (see record / save),
+# - replay: install() a fake ee (and geemap) module, then answer every request from a recording, with whatever latency you like.
+# Responses are kept by label - what the request asked for (Cache.key_label: dataset, year, band, scale, reducer), not how
+# it was batched. So a change that batches requests differently still replays, and shows up as more or fewer round trips.
+# A recording belongs to one aoi - labels leave the geometry out.
+#
+# Only requests made through the Cache can be replayed (they're the only ones with a label) - that's all of Baseline, SLR,
+# PP and Main_script. Export downloads don't need a recording: they get made-up tile bytes (see settings).
+
+settings = {
+    # Size of every made-up tile download, in bytes.
+    'tile_bytes': 64 * 1024,
+    # Seconds every download takes.
+    'download_latency': 0.0
+}
+
+# Long arguments (like an aoi's geojson) are replaced by their hash in fake expressions, so those stay small.
+MAX_ARGUMENT_CHARS = 200
+
+class FakeObject:
+    '''
+    Any ee object. Every attribute and call makes a new one, remembering the expression that built it -
+    serialize() gives that back, so identical computations are still recognised as identical (Scheduler.request_key).
+    '''
+    def __init__(self, expression):
+        self._expression = expression
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return FakeObject(self._expression + '.' + name)
+
+    def __call__(self, *args, **kwargs):
+        arguments = [describe(value) for value in args] + [name + '=' + describe(value) for name, value in kwargs.items()]
+        return FakeObject(self._expression + '(' + ', '.join(arguments) + ')')
+
+    def __repr__(self):
+        return '<fake ' + self._expression[:80] + '>'
+
+    def serialize(self):
+        return self._expression
+
+    def getInfo(self):
+        import Scheduler
+        return Scheduler.evaluate(self)
+
+    def getDownloadURL(self, params=None):
+        # A data: url - urllib "downloads" it without any network.
+        time.sleep(settings['download_latency'])
+        return 'data:application/octet-stream;base64,' + base64.b64encode(b'\0' * settings['tile_bytes']).decode('ascii')
+
+def describe(value):
+    '''
+    Text for one argument of a fake call - the same text for the same argument, every run.
+    '''
+    if isinstance(value, FakeObject):
+        text = value.serialize()
+    elif callable(value):
+        # A function mapped over a collection - it never runs on the fake, only its name counts.
+        text = getattr(value, '__qualname__', 'function')
+    elif isinstance(value, dict):
+        text = '{' + ', '.join(describe(key) + ': ' + describe(item) for key, item in value.items()) + '}'
+    elif isinstance(value, (list, tuple)):
+        text = '[' + ', '.join(describe(item) for item in value) + ']'
+    else:
+        text = repr(value)
+
+    if len(text) > MAX_ARGUMENT_CHARS:
+        return 'sha256:' + hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+    return text
+
+def fake_module(name):
+    '''
+    A module where every attribute is a FakeObject (ee.Image, ee.Reducer, geemap.shp_to_ee...).
+    '''
+    module = types.ModuleType(name)
+    module.__getattr__ = lambda attribute: FakeObject(name + '.' + attribute)
+    return module
+
+def install():
+    '''
+    Puts the fake ee and geemap modules in place. Call this BEFORE importing Main_script, Baseline, SLR, PP or Cache.
+    '''
+    for name in ['ee', 'geemap']:
+        module = sys.modules.get(name)
+        if module is not None and not getattr(module, 'is_fake', False) and 'Cache' in sys.modules:
+            raise RuntimeError("The real " + name + " is already in use - call FakeEE.install() before importing the project modules")
+        module = fake_module(name)
+        module.is_fake = True
+        sys.modules[name] = module
+
+def new_recording(site=None):
+    '''
+    An empty recording. site is anything worth keeping with it (start year, the aoi's geojson...).
+    '''
+    return {'site': site or {}, 'responses': {}, 'latency': {}}
+
+def record(recording, respond=None):
+    '''
+    Makes every request (with the real earth engine) also save its response into recording, by label.
+    respond(label) -> response answers instead of earth engine, for a made-up recording (see Benchmark.synthetic_response) -
+    batched requests call it once per label in the batch.
+    Output: recording - save it with save.
+    '''
+    import Scheduler
+    lock = threading.Lock()
+
+    def evaluate(ee_object, label):
+        if respond is None:
+            return ee_object.getInfo()
+        if isinstance(label, dict):
+            return {name: respond(name_label) for name, name_label in label.items()}
+        return respond(label)
+
+    def backend(ee_object):
+        label = Scheduler.current_label()
+        begin = time.perf_counter()
+        value = evaluate(ee_object, label)
+        elapsed = time.perf_counter() - begin
+
+        with lock:
+            if isinstance(label, dict):
+                for name, name_label in label.items():
+                    if name_label is not None:
+                        recording['responses'][name_label] = value[name]
+                        recording['latency'][name_label] = elapsed
+            elif label is not None:
+                recording['responses'][label] = value
+                recording['latency'][label] = elapsed
+        return value
+
+    Scheduler.set_backend(backend)
+    return recording
+
+def save(recording, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(recording, f, indent=1)
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def replay(recording, latency=0.0):
+    '''
+    Answers every request from recording instead of earth engine (with install() there is no earth engine at all).
+    latency: seconds every round trip takes, or 'recorded' for as long as it took when it was recorded.
+    Output: a dictionary of counters - 'round_trips' and 'results' (results in them) - updated as requests come in.
+    '''
+    import Scheduler
+    lock = threading.Lock()
+    counters = {'round_trips': 0, 'results': 0}
+
+    def backend(ee_object):
+        label = Scheduler.current_label()
+        if label is None:
+            raise KeyError("Request has no label, so it can't be replayed - only requests made through Cache can be")
+
+        labels = label if isinstance(label, dict) else {None: label}
+        missing = [name_label for name_label in labels.values() if name_label not in recording['responses']]
+        if missing:
+            raise KeyError("Not in the recording: " + '; '.join(str(name_label) for name_label in missing))
+
+        with lock:
+            counters['round_trips'] += 1
+            counters['results'] += len(labels)
+
+        if latency == 'recorded':
+            time.sleep(max(recording['latency'].get(name_label, 0.0) for name_label in labels.values()))
+        else:
+            time.sleep(latency)
+
+        # Copies, so nothing the caller does to a result changes the recording.
+        values = {name: copy.deepcopy(recording['responses'][name_label]) for name, name_label in labels.items()}
+        return values if isinstance(label, dict) else values[None]
+
+    Scheduler.set_backend(backend)
+    return counters
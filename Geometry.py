@@ -0,0 +1,359 @@
+import hashlib
+import json
+import os
+import warnings
+import Cache
+
+# Prepares project boundaries before they go to earth engine. Surveyed boundaries can have hundreds of thousands of vertices,
+# and every earth engine request carries the whole geometry - so it's cleaned and simplified once, here, on this computer.
+
+# Vertices closer than this to the simplified outline can be dropped, in meters.
+DEFAULT_TOLERANCE_M = 1.0
+
+# Polygon parts and holes smaller than this are slivers (digitizing leftovers) and are removed, in m2.
+DEFAULT_MIN_PART_M2 = 10.0
+
+# Coordinates are rounded to this many degrees (about 1 cm) - the extra digits only make the request bigger.
+COORDINATE_PRECISION_DEG = 1e-7
+
+# Warn when preparing changes the project's area by more than this percent.
+MAX_AREA_DELTA_PERCENT = 0.5
+
+# Bump this when prepare() changes, so geometries prepared the old way aren't reused from the cache.
+PREPARE_VERSION = 1
+
+def file_hash(filepath):
+    '''
+    Hash of a vector file's contents - for a shapefile that includes its .shx/.dbf/.prj/.cpg side files.
+    '''
+    base, extension = os.path.splitext(filepath)
+    paths = [filepath]
+    if extension.lower() == '.shp':
+        for side in ['.shx', '.dbf', '.prj', '.cpg']:
+            for candidate in [base + side, base + side.upper()]:
+                if os.path.exists(candidate):
+                    paths.append(candidate)
+                    break
+
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+# KML tags are matched by their local name, whatever namespace the file uses: OGC KML 2.2 (http://www.opengis.net/kml/2.2),
+# Google's older http://earth.google.com/kml/2.0 - 2.2, or none at all.
+def kml_tag(element):
+    return element.tag.rsplit('}', 1)[-1]
+
+def kml_children(element, name):
+    return [child for child in element if kml_tag(child) == name]
+
+def kml_child(element, *path):
+    '''
+    The first element down path (local tag names, one per level) under element, or None.
+    '''
+    for name in path:
+        children = kml_children(element, name) if element is not None else []
+        element = children[0] if children else None
+    return element
+
+def kml_text(element, name):
+    child = kml_child(element, name)
+    return child.text if child is not None else None
+
+def read_file(filepath):
+    '''
+    Reads a .shp or .kml - light readers (pyshp, and ElementTree for .kml), so this doesn't need geopandas or gdal.
+    Output: a dictionary with the file's 'crs' (a pyproj CRS, None when a shapefile has no .prj) and its 'features',
+    a list of {'properties': ..., 'geometry': shapely geometry or None}.
+    '''
+    extension = filepath.lower()
+    if extension.endswith('.shp'):
+        return read_shapefile(filepath)
+    elif extension.endswith('.kml'):
+        return read_kml(filepath)
+    else:
+        raise ValueError("Unsupported file type - must be .shp or .kml")
+
+def read_shapefile(filepath):
+    import shapefile
+    import pyproj
+    from shapely.geometry import shape
+
+    base = os.path.splitext(filepath)[0]
+    crs = None
+    encoding = 'utf-8'
+    for side in ['.prj', '.PRJ']:
+        if os.path.exists(base + side):
+            with open(base + side, encoding='utf-8', errors='replace') as f:
+                crs = pyproj.CRS.from_wkt(f.read())
+            break
+    for side in ['.cpg', '.CPG']:
+        if os.path.exists(base + side):
+            with open(base + side, encoding='ascii', errors='replace') as f:
+                encoding = f.read().strip() or encoding
+            break
+
+    features = []
+    with shapefile.Reader(filepath, encoding=encoding) as reader:
+        for shape_record in reader.iterShapeRecords():
+            geometry = None
+            if shape_record.shape.shapeType != shapefile.NULL:
+                geometry = shape(shape_record.shape.__geo_interface__)
+            # Empty fields are null, the way gdal (and so geopandas) reads them
+            properties = {name: None if value == '' else value for name, value in shape_record.record.as_dict().items()}
+            features.append({'properties': properties, 'geometry': geometry})
+    return {'crs': crs, 'features': features}
+
+def read_kml(filepath):
+    '''
+    Every Placemark of a .kml, with its Name and Description. KML is always longitude/latitude (EPSG:4326). Altitudes are dropped.
+    Raises ValueError when no placemark has a polygon - a project boundary with nothing to measure is always a mistake
+    (a file of points or lines, or a format this doesn't read).
+    '''
+    import xml.etree.ElementTree as ElementTree
+    import pyproj
+
+    features = []
+    for placemark in ElementTree.parse(filepath).getroot().iter():
+        if kml_tag(placemark) != 'Placemark':
+            continue
+        geometries = []
+        for element in placemark:
+            geometries.extend(kml_geometries(element))
+        features.append({
+            'properties': {
+                'Name': kml_text(placemark, 'name'),
+                'Description': kml_text(placemark, 'description')
+            },
+            'geometry': combine_geometries(geometries)
+        })
+
+    if not any(has_polygon(feature['geometry']) for feature in features):
+        raise ValueError("No polygons in " + filepath + " (" + str(len(features)) + " placemarks) - the project boundary has to be a polygon")
+    return {'crs': pyproj.CRS.from_epsg(4326), 'features': features}
+
+def has_polygon(geometry):
+    if geometry is None:
+        return False
+    if geometry.geom_type == 'GeometryCollection':
+        return any(has_polygon(part) for part in geometry.geoms)
+    return geometry.geom_type in ('Polygon', 'MultiPolygon')
+
+def kml_coordinates(element):
+    text = kml_text(element, 'coordinates') or ''
+    return [tuple(float(value) for value in point.split(',')[:2]) for point in text.split()]
+
+def kml_geometries(element):
+    '''
+    The shapely geometries in one KML geometry element (MultiGeometry gives all of its parts).
+    '''
+    from shapely.geometry import Point, LineString, Polygon
+
+    tag = kml_tag(element)
+    if tag == 'Point':
+        return [Point(kml_coordinates(element)[0])]
+    if tag == 'LineString':
+        return [LineString(kml_coordinates(element))]
+    if tag == 'Polygon':
+        outer = kml_child(element, 'outerBoundaryIs', 'LinearRing')
+        inner = [ring for boundary in kml_children(element, 'innerBoundaryIs') for ring in kml_children(boundary, 'LinearRing')]
+        return [Polygon(kml_coordinates(outer), [kml_coordinates(ring) for ring in inner])]
+    if tag == 'MultiGeometry':
+        return [geometry for child in element for geometry in kml_geometries(child)]
+    return []
+
+def combine_geometries(geometries):
+    '''
+    One geometry out of several: polygons make a MultiPolygon (likewise lines and points), anything mixed a GeometryCollection.
+    '''
+    from shapely.geometry import MultiPoint, MultiLineString, MultiPolygon, GeometryCollection
+
+    if not geometries:
+        return None
+    if len(geometries) == 1:
+        return geometries[0]
+
+    types = set(geometry.geom_type for geometry in geometries)
+    for single, multiple in [('Polygon', MultiPolygon), ('LineString', MultiLineString), ('Point', MultiPoint)]:
+        if types == {single}:
+            return multiple(geometries)
+    return GeometryCollection(geometries)
+
+def reproject(geometries, crs_from, crs_to):
+    '''
+    geometries (a list or array of shapely geometries, None allowed) from one crs to another. Output: an array of geometries.
+    '''
+    import numpy as np
+    import pyproj
+    import shapely
+
+    geometries = np.asarray(geometries, dtype=object)
+    if pyproj.CRS(crs_from) == pyproj.CRS(crs_to):
+        return geometries
+
+    transformer = pyproj.Transformer.from_crs(crs_from, crs_to, always_xy=True)
+    return shapely.transform(geometries, lambda coordinates: np.column_stack(transformer.transform(coordinates[:, 0], coordinates[:, 1])))
+
+def estimate_utm_crs(geometries):
+    '''
+    The UTM zone in the middle of geometries (EPSG:4326) - where lengths and areas come out in meters with little distortion.
+    '''
+    import pyproj
+    import shapely
+    from pyproj.aoi import AreaOfInterest
+    from pyproj.database import query_utm_crs_info
+
+    xmin, ymin, xmax, ymax = shapely.total_bounds(geometries)
+    x_center = (xmin + xmax) / 2
+    y_center = (ymin + ymax) / 2
+    zones = query_utm_crs_info(datum_name='WGS 84', area_of_interest=AreaOfInterest(x_center, y_center, x_center, y_center))
+    if not zones:
+        raise RuntimeError("No UTM zone found for the project's bounds")
+    return pyproj.CRS.from_epsg(zones[0].code)
+
+def remove_slivers(geometry, min_part_m2):
+    '''
+    Drops polygon parts and holes smaller than min_part_m2 (geometry in a meter based crs).
+    The biggest part always stays, so a feature never disappears. Anything that isn't a polygon is left alone.
+    Output: (geometry, parts removed, holes removed)
+    '''
+    from shapely.geometry import Polygon, MultiPolygon
+
+    if geometry is None or geometry.is_empty:
+        return geometry, 0, 0
+
+    parts = [part for part in getattr(geometry, 'geoms', [geometry]) if part.geom_type == 'Polygon']
+    if not parts:
+        return geometry, 0, 0
+
+    largest = max(parts, key=lambda part: part.area)
+    kept = []
+    parts_removed = 0
+    holes_removed = 0
+    for part in parts:
+        if part is not largest and part.area < min_part_m2:
+            parts_removed += 1
+            continue
+        holes = [ring for ring in part.interiors if Polygon(ring).area >= min_part_m2]
+        holes_removed += len(part.interiors) - len(holes)
+        kept.append(Polygon(part.exterior, holes))
+
+    if len(kept) == 1:
+        return kept[0], parts_removed, holes_removed
+    return MultiPolygon(kept), parts_removed, holes_removed
+
+def to_geojson(features, geometries):
+    '''
+    GeoJSON FeatureCollection of features with geometries (EPSG:4326), as earth engine takes it (planar edges, like geemap.shp_to_ee).
+    '''
+    from shapely.geometry import mapping
+
+    collection = {'type': 'FeatureCollection', 'features': []}
+    for index, (feature, geometry) in enumerate(zip(features, geometries)):
+        collection['features'].append({
+            'id': str(index),
+            'type': 'Feature',
+            'properties': feature['properties'],
+            'geometry': None if geometry is None else mapping(geometry)
+        })
+    # Through json and back, so dates and such become plain strings and tuples become lists
+    geojson = json.loads(json.dumps(collection, default=str))
+    for feature in geojson['features']:
+        if feature['geometry'] is not None and feature['geometry']['type'] != 'Point':
+            feature['geometry']['geodesic'] = False
+    return geojson
+
+def read_geojson(filepath):
+    '''
+    Reads a .shp or .kml as drawn - no cleaning or simplifying (prepare_file does that) - reprojected to EPSG:4326
+    (assumed when the file has no crs). Output: a GeoJSON FeatureCollection, ready for ee.FeatureCollection.
+    '''
+    data = read_file(filepath)
+    features = data['features']
+    geometries = reproject([feature['geometry'] for feature in features], data['crs'] or 'EPSG:4326', 'EPSG:4326')
+    return to_geojson(features, geometries)
+
+def prepare(data, tolerance_m=DEFAULT_TOLERANCE_M, min_part_m2=DEFAULT_MIN_PART_M2):
+    '''
+    Cleans up project boundaries (data from read_file):
+    - reprojects to EPSG:4326 (assumed when the file has no crs),
+    - repairs invalid polygons, removes slivers (see remove_slivers) and simplifies within tolerance_m,
+    - rounds coordinates to COORDINATE_PRECISION_DEG.
+    Sliver removal and simplifying happen in the local UTM zone, so both tolerances really are meters.
+    Output: (geojson, stats) - the prepared FeatureCollection, and a dictionary of vertex, payload and area numbers before and after.
+    '''
+    import numpy as np
+    import shapely
+
+    features = data['features']
+    crs_in = data['crs'].to_string() if data['crs'] is not None else None
+    geometries = reproject([feature['geometry'] for feature in features], data['crs'] or 'EPSG:4326', 'EPSG:4326')
+    original_geojson = to_geojson(features, geometries)
+
+    utm = estimate_utm_crs(geometries)
+    projected = reproject(geometries, 'EPSG:4326', utm)
+    area_before = float(np.nansum(shapely.area(projected)))
+
+    repaired = shapely.make_valid(projected)
+    cleaned = []
+    parts_removed = 0
+    holes_removed = 0
+    for geometry in repaired:
+        geometry, parts, holes = remove_slivers(geometry, min_part_m2)
+        cleaned.append(geometry)
+        parts_removed += parts
+        holes_removed += holes
+    simplified = shapely.simplify(shapely.make_valid(np.asarray(cleaned, dtype=object)), tolerance_m, preserve_topology=True)
+    area_after = float(np.nansum(shapely.area(simplified)))
+
+    prepared = shapely.set_precision(reproject(simplified, utm, 'EPSG:4326'), COORDINATE_PRECISION_DEG)
+    geojson = to_geojson(features, prepared)
+
+    stats = {
+        'crs_in': crs_in,
+        'features': len(features),
+        'tolerance_m': tolerance_m,
+        'min_part_m2': min_part_m2,
+        'vertices_before': int(shapely.get_num_coordinates(geometries).sum()),
+        'vertices_after': int(shapely.get_num_coordinates(prepared).sum()),
+        'payload_bytes_before': len(json.dumps(original_geojson)),
+        'payload_bytes_after': len(json.dumps(geojson)),
+        'parts_removed': parts_removed,
+        'holes_removed': holes_removed,
+        'area_m2_before': area_before,
+        'area_m2_after': area_after,
+        'area_delta_m2': area_after - area_before,
+        'area_delta_percent': ((area_after - area_before) / area_before) * 100 if area_before else 0.0
+    }
+    return geojson, stats
+
+def prepared_key(filepath, tolerance_m, min_part_m2):
+    parts = [file_hash(filepath), tolerance_m, min_part_m2, COORDINATE_PRECISION_DEG, PREPARE_VERSION]
+    return 'prepared_geometry|' + hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+def prepare_file(filepath, tolerance_m=DEFAULT_TOLERANCE_M, min_part_m2=DEFAULT_MIN_PART_M2):
+    '''
+    Reads and prepares a .shp or .kml (see prepare). Cached by the file's contents, so an unchanged file is only prepared once.
+    Output: (geojson, stats)
+    '''
+    key = prepared_key(filepath, tolerance_m, min_part_m2)
+    prepared = Cache.lookup(key)
+    if prepared is Cache.MISSING:
+        geojson, stats = prepare(read_file(filepath), tolerance_m, min_part_m2)
+        prepared = Cache.store(key, {'geojson': geojson, 'stats': stats})
+
+    stats = prepared['stats']
+    if abs(stats['area_delta_percent']) > MAX_AREA_DELTA_PERCENT:
+        warnings.warn("Preparing " + filepath + " changed its area by " + str(round(stats['area_delta_percent'], 3))
+                      + "% - lower tolerance_m / min_part_m2 if that's too much")
+    return prepared['geojson'], stats
+
+def write_stats(stats, folder):
+    '''
+    Saves the stats of prepare_file as folder/geometry_stats.json, next to output.csv.
+    '''
+    with open(os.path.join(folder, 'geometry_stats.json'), 'w', encoding='utf-8') as f:
+        json.dump(stats, f, indent=2)
@@ -0,0 +1,175 @@
+import json
+import math
+import os
+import SLR
+
+# Everything get_report needs comes from one of two backends:
+# - earth engine: Main_script.get_report_info, which builds the requests of get_report_requests and fetches them,
+# - local: this file, which works the same numbers out of a folder made by Main_script.export_project_layers, without talking to earth engine at all.
+# A backend is any function backend(aoi, start_year) -> dictionary of metric name -> raw result, in the same shape
+# earth engine gives back for get_report_requests. Main_script.build_report turns that into the report either way.
+
+# Metrics that aren't rasters in the layer stack (a single SLR pixel, a vector intersection).
+# export_project_layers fetches them once and keeps them in the band manifest under 'values'.
+VALUE_METRICS = ['slr', 'slr_ssp370', 'slr_ssp585', 'protected_planet']
+
+# Radius of a sphere with the same surface area as the WGS84 ellipsoid, in meters - used for pixel areas.
+EARTH_RADIUS_M = 6371007.181
+
+def read_manifest(folder):
+    '''
+    Reads folder/project_layers_bands.json, written by Main_script.export_project_layers.
+    '''
+    with open(os.path.join(folder, 'project_layers_bands.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+def get_layer_paths(folder, manifest):
+    '''
+    The GeoTIFFs holding the layer stack - one file, or every tile when it was exported with mosaic=False.
+    '''
+    files = manifest['file']
+    if isinstance(files, str):
+        files = [files]
+    return [os.path.join(folder, path) for path in files]
+
+def pixel_area_m2(transform, row_start, rows):
+    '''
+    Area in m2 of one pixel on each of rows row_start...row_start+rows of an EPSG:4326 grid, as a column (rows x 1) numpy array.
+    Pixels only change size with latitude, so one number per row is enough.
+    '''
+    import numpy as np
+
+    top = transform.f + transform.e * (row_start + np.arange(rows))
+    bottom = top + transform.e
+    width = math.radians(abs(transform.a))
+    area = EARTH_RADIUS_M ** 2 * width * np.abs(np.sin(np.radians(top)) - np.sin(np.radians(bottom)))
+    return area[:, np.newaxis]
+
+def add_groups(totals, values, weights):
+    '''
+    Adds weights into totals (value -> sum), grouped by the integer values - numpy's answer to Reducer.sum().group().
+    '''
+    import numpy as np
+
+    if values.size == 0:
+        return
+    groups, inverse = np.unique(values, return_inverse=True)
+    sums = np.bincount(inverse, weights=weights)
+    for group, total in zip(groups.tolist(), sums.tolist()):
+        totals[group] = totals.get(group, 0.0) + total
+
+def reduce_layers(folder, manifest, bin_size=SLR.ELEVATION_BIN_M):
+    '''
+    One pass over the layer stack, a block at a time (memory stays flat however big the aoi is).
+    Output: a dictionary of running totals - pixel counts, elevation stats, and hectares per class / loss year / elevation bin.
+    '''
+    import numpy as np
+    import rasterio
+
+    bands = {band['band']: band['index'] for band in manifest['bands']}
+    nodata = manifest['nodata']
+
+    totals = {
+        'area_m2': 0.0,
+        'pixels': 0,
+        'elevation_sum': 0.0,
+        'elevation_min': None,
+        'elevation_max': None,
+        'gmw': {},
+        'jaxa': {},
+        'murray': {},
+        'elevation_bins': {}
+    }
+
+    for path in get_layer_paths(folder, manifest):
+        with rasterio.open(path) as source:
+            for _, window in source.block_windows(1):
+                data = source.read([bands['elevation'], bands['gmw'], bands['jaxa'], bands['murray_loss_year']], window=window)
+                elevation, gmw, jaxa, loss_year = data
+                area_ha = np.broadcast_to(pixel_area_m2(source.transform, window.row_off, window.height), elevation.shape) / 10000
+
+                # The DEM covers the whole aoi, so its footprint IS the aoi.
+                inside = elevation != nodata
+                if not inside.any():
+                    continue
+
+                totals['area_m2'] += float(area_ha[inside].sum()) * 10000
+                totals['pixels'] += int(inside.sum())
+                totals['elevation_sum'] += float(elevation[inside].sum(dtype=np.float64))
+                low = float(elevation[inside].min())
+                high = float(elevation[inside].max())
+                totals['elevation_min'] = low if totals['elevation_min'] is None else min(totals['elevation_min'], low)
+                totals['elevation_max'] = high if totals['elevation_max'] is None else max(totals['elevation_max'], high)
+
+                # Same binning as SLR.get_elevation_histogram_ee
+                add_groups(totals['elevation_bins'], SLR.elevation_bins_array(elevation[inside], bin_size), area_ha[inside])
+
+                for name, layer in (('gmw', gmw), ('jaxa', jaxa), ('murray', loss_year)):
+                    valid = layer != nodata
+                    add_groups(totals[name], layer[valid].astype(np.int64), area_ha[valid])
+
+    return totals
+
+def get_report_info(folder, start_year, bin_size=SLR.ELEVATION_BIN_M):
+    '''
+    The local backend: every metric of get_report_requests worked out from a folder made by Main_script.export_project_layers,
+    in the same shape earth engine would have returned it - pass it to Main_script.build_report.
+    start_year has to match the year the layers were exported for (the report looks at start_year - 1).
+    '''
+    manifest = read_manifest(folder)
+    if manifest['year'] != start_year - 1:
+        raise ValueError("Layers in " + folder + " are for " + str(manifest['year']) + ", but start year " + str(start_year)
+                         + " needs " + str(start_year - 1))
+
+    missing = [name for name in VALUE_METRICS if name not in manifest.get('values', {})]
+    if missing:
+        raise ValueError("Band manifest has no values for " + ', '.join(missing) + " - export the layers again")
+
+    totals = reduce_layers(folder, manifest, bin_size)
+    if totals['pixels'] == 0:
+        raise ValueError("No elevation data in " + folder + " - nothing to measure")
+
+    def groups(name, group_name):
+        return [{group_name: value, 'sum': hectares} for value, hectares in sorted(totals[name].items())]
+
+    info = {
+        'area_m2': totals['area_m2'],
+        'murray': groups('murray', 'lossYear'),
+        'gmw': {'groups': groups('gmw', 'class'), 'area_m2': totals['area_m2']},
+        'jaxa': {'groups': groups('jaxa', 'class'), 'area_m2': totals['area_m2']},
+        'elevation': {
+            'DEM_mean': totals['elevation_sum'] / totals['pixels'],
+            'DEM_min': totals['elevation_min'],
+            'DEM_max': totals['elevation_max']
+        },
+        'elevation_histogram': {'groups': groups('elevation_bins', 'bin'), 'total': totals['area_m2'] / 10000}
+    }
+    info.update(manifest['values'])
+    return info
+
+def backend(folder, bin_size=SLR.ELEVATION_BIN_M):
+    '''
+    Returns a backend for Main_script.get_report that reads folder instead of asking earth engine. The aoi it is given is ignored.
+    '''
+    return lambda aoi, start_year: get_report_info(folder, start_year, bin_size)
+
+def compare_reports(expected, actual, rel_tol=0.02, abs_tol=0.01, path='report'):
+    '''
+    Checks two reports (e.g. earth engine vs local) agree number by number, within rel_tol (relative) or abs_tol (absolute).
+    Output: a list of (path, expected, actual) for everything that differs - empty means they match.
+    '''
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        differences = []
+        for key in expected:
+            if key not in actual:
+                differences.append((path + '.' + str(key), expected[key], None))
+            else:
+                differences.extend(compare_reports(expected[key], actual[key], rel_tol, abs_tol, path + '.' + str(key)))
+        return differences
+
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)):
+        if math.isclose(expected, actual, rel_tol=rel_tol, abs_tol=abs_tol):
+            return []
+        return [(path, expected, actual)]
+
+    return [] if expected == actual else [(path, expected, actual)]
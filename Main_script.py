@@ -1,140 +1,791 @@
-import geemap
 import ee
 import csv
-import PP, Baseline, SLR
+import PP, Baseline, SLR, Cache, Workers, Export, LocalBackend, Geometry, Planner, Context, Trace, Checkpoint, Store
 import os
+import json
 
 # Main tools!
-def convert_to_ee(filepath):
+def convert_to_ee(filepath, prepare=False, tolerance_m=Geometry.DEFAULT_TOLERANCE_M, min_part_m2=Geometry.DEFAULT_MIN_PART_M2, stats_folder=None):
     """
     Loads a vector file into earth engine as a feature collection/image.
     Supports .shp and .kml. .kml files are untested.
+    prepare=True cleans and simplifies the boundary first (see Geometry.prepare) - tolerance_m and min_part_m2 in meters.
+    That changes the geometry a little, so the numbers (and every cache key) too - it's opt-in, and get_csv records it (see geometry_settings).
+    stats_folder saves the vertex, payload and area change numbers there as geometry_stats.json (prepared boundaries only).
     """
 
-    filepath = filepath.lower()
+    if prepare:
+        geojson, stats = Geometry.prepare_file(filepath, tolerance_m, min_part_m2)
+        if stats_folder is not None:
+            Geometry.write_stats(stats, stats_folder)
+        return ee.FeatureCollection(geojson)
 
-    if filepath.endswith('.shp'):
-        return geemap.shp_to_ee(filepath)
-    elif filepath.endswith('.kml'):
-        return geemap.kml_to_ee(filepath)
+    # The same light readers as the prepared path - geemap (and geopandas behind it) is slow to import, and not needed here.
+    return ee.FeatureCollection(Geometry.read_geojson(filepath))
+
+
+def geometry_settings(prepare, tolerance_m=Geometry.DEFAULT_TOLERANCE_M, min_part_m2=Geometry.DEFAULT_MIN_PART_M2):
+    '''
+    How convert_to_ee loaded the boundary, kept in the report as 'geometry' - write_csv and the results store record it,
+    so a run can be reproduced with the same geometry.
+    '''
+    if not prepare:
+        return {'prepare': False, 'tolerance_m': None, 'min_part_m2': None}
+    return {'prepare': True, 'tolerance_m': tolerance_m, 'min_part_m2': min_part_m2}
+
+def get_inundation_year(start_year):
+    '''
+    The SLR year used for the inundation rows of get_csv: 100 years after the first decade following start_year.
+    '''
+    return (((start_year // 10) + 1) * 10) + 100
+
+def get_report_reductions(aoi, start_year, protected_planet_method='raster', include_series=False, scale=None):
+    '''
+    The metrics of get_report_requests that reduce pixels over the aoi - the ones that get slow or run out of memory on big aois.
+    Output: metric name -> {'key': cache key, 'build': function(aoi, tile_scale) -> ee object, 'scale' and 'bands' (how many pixels
+    it reads), and 'merge' (how results of parts of the aoi add back up, see Planner.fetch_split)}.
+    scale runs every reduction at that scale instead of its dataset's native one (e.g. Baseline.PREVIEW_SCALE).
+    '''
+    eval_year = start_year - 1
+    jaxa_dataset = Baseline.jaxa_dataset(eval_year)
+
+    reductions = {
+        'murray': {
+            'key': Baseline.murray_loss_key(aoi, scale),
+            'build': lambda part, tile_scale: Baseline.murray_loss_by_year_ee(part, tile_scale, scale),
+            'scale': scale or 10
+        },
+        'gmw': {
+            'key': Baseline.land_cover_key(aoi, 'GMW', eval_year, scale),
+            'build': lambda part, tile_scale: Baseline.land_cover_areas_ee(part, 'GMW', eval_year, tile_scale, scale),
+            'scale': scale or Baseline.LAND_COVER_DATASETS['GMW']['scale']
+        },
+        'jaxa': {
+            'key': Baseline.land_cover_key(aoi, jaxa_dataset, eval_year, scale),
+            'build': lambda part, tile_scale: Baseline.land_cover_areas_ee(part, jaxa_dataset, eval_year, tile_scale, scale),
+            'scale': scale or Baseline.LAND_COVER_DATASETS[jaxa_dataset]['scale']
+        },
+        'elevation': {
+            'key': SLR.elevation_data_key(aoi, scale),
+            'build': lambda part, tile_scale: SLR.get_elevation_data_ee(part, tile_scale, scale),
+            'scale': scale or 30,
+            'merge': Planner.merge_elevation_stats
+        },
+        'elevation_histogram': {
+            'key': SLR.elevation_histogram_key(aoi, scale=scale),
+            'build': lambda part, tile_scale: SLR.get_elevation_histogram_ee(part, tile_scale=tile_scale, scale=scale),
+            'scale': scale or 30,
+            'bands': 2  # histogram and total area
+        }
+    }
+    if protected_planet_method == 'raster':
+        reductions['protected_planet'] = {
+            'key': PP.protected_planet_areas_key(aoi, scale),
+            'build': lambda part, tile_scale: PP.protected_planet_areas_ee(part, tile_scale, scale),
+            'scale': scale or PP.PROTECTED_SCALE
+        }
+    if include_series:
+        reductions['baseline_series'] = {
+            'key': Baseline.baseline_series_key(aoi, scale),
+            'build': lambda part, tile_scale: Baseline.baseline_series_ee(part, tile_scale, scale),
+            'scale': scale or 25,
+            'bands': 30  # about one band per year of GMW and JAXA
+        }
+    return reductions
+
+def get_report_requests(aoi, start_year, protected_planet_method='raster', include_series=False, scale=None):
+    '''
+    Every metric get_csv needs, as a dictionary of metric name -> (cache key, server-side ee object).
+    Nothing in here talks to earth engine yet. The metrics don't depend on each other, so they can be fetched in any order.
+    include_series=True adds the GMW/JAXA time series (see Baseline.baseline_series).
+    scale overrides the scale of every pixel reduction (see get_report_reductions) - SLR is one 25 km pixel either way.
+    Reductions are built as they always were (tileScale 1, whole aoi) - get_report_info plans them for big aois.
+    aoi can be a context (see Context.py) - otherwise one is made here, so every image and denominator goes in once.
+    '''
+    aoi = Context.get_context(aoi)
+    eval_year = start_year - 1
+
+    # SLR for the inundation rows - same year get_csv has always used.
+    inundation_year = get_inundation_year(start_year)
+
+    requests = {
+        'area_m2': (Baseline.aoi_area_key(aoi), Context.area_m2_ee(aoi)),
+        'slr': (SLR.slr_quantiles_key(aoi, eval_year), SLR.get_slr_quantiles_ee(aoi, eval_year)),
+        'slr_ssp370': (SLR.nasa_slr_key(aoi, inundation_year, "SSP3-7.0"), SLR.get_nasa_slr_ee(aoi, inundation_year, "SSP3-7.0")),
+        'slr_ssp585': (SLR.nasa_slr_key(aoi, inundation_year, "SSP5-8.5"), SLR.get_nasa_slr_ee(aoi, inundation_year, "SSP5-8.5")),
+    }
+    if protected_planet_method != 'raster':
+        requests['protected_planet'] = PP.protected_planet_request(aoi, protected_planet_method)
+
+    for name, reduction in get_report_reductions(aoi, start_year, protected_planet_method, include_series, scale).items():
+        requests[name] = (reduction['key'], reduction['build'](aoi, 1))
+    return requests
+
+def fetch_concurrently(requests, max_workers=Workers.DEFAULT_MAX_WORKERS):
+    '''
+    Fetches every request from get_report_requests on its own, at most max_workers at a time.
+    Output: (info, errors) - name -> result for the metrics that worked, and name -> exception for the ones that didn't.
+    '''
+    tasks = {}
+    for name, (key, ee_object) in requests.items():
+        # Default arguments pin key/ee_object to this metric - the loop variables change before the task runs.
+        tasks[name] = lambda key=key, ee_object=ee_object: Cache.fetch(key, ee_object)
+
+    return Workers.run_tasks(tasks, max_workers)
+
+def get_report_info(aoi, start_year, max_workers=None, protected_planet_method='raster', include_series=False, plan=True, scale=None,
+                    names=None):
+    '''
+    The earth engine backend: fetches every request from get_report_requests.
+    Builds every metric as ONE server-side ee.Dictionary, and fetches all of it with a single getInfo() call.
+    Metrics already in the result cache (see Cache.py) are not fetched again.
+    With max_workers set, each metric is fetched as its own request instead, max_workers at a time (see fetch_concurrently).
+    plan=True (default) sizes every reduction for the aoi first (see Planner.py) - a higher tileScale for big aois,
+    and reductions too big for one request are split into parts that are fetched side by side and added back up.
+    scale overrides the scale of every pixel reduction (see get_report_reductions).
+    names, if given, only fetches those metrics of get_report_requests (see get_report_checkpointed).
+    Output: metric name -> raw result - pass it to build_report. 'reduction_settings' holds the plan each reduction ran with.
+    '''
+    # Shared by the requests and the plan - the whole aoi's reductions are built once.
+    aoi = Context.get_context(aoi)
+    requests = get_report_requests(aoi, start_year, protected_planet_method, include_series, scale)
+    if names is not None:
+        requests = {name: request for name, request in requests.items() if name in names}
+
+    split_requests = {}
+    plans = None
+    if plan:
+        # The aoi area is needed up front to plan - it's cached, and part of the report anyway.
+        reductions = get_report_reductions(aoi, start_year, protected_planet_method, include_series, scale)
+        if names is not None:
+            reductions = {name: reduction for name, reduction in reductions.items() if name in names}
+        planned, split_requests, plans = Planner.plan_requests(aoi, reductions, Baseline.aoi_area_m2(aoi))
+        requests.update(planned)
+        for name in split_requests:
+            del requests[name]
+
+    if max_workers is None:
+        # The one and only round trip! Anything already in the cache is left out of it - on a warm rerun there is no round trip at all.
+        info = Cache.fetch_many(requests)
     else:
-        raise ValueError("Unsupported file type - must be .shp or .kml")
+        info, errors = fetch_concurrently(requests, max_workers)
+        if errors:
+            raise RuntimeError('Metrics failed: ' + '; '.join(name + ' - ' + str(error) for name, error in errors.items()))
+
+    if split_requests:
+        info.update(Planner.fetch_split(split_requests, reductions, max_workers or Workers.DEFAULT_MAX_WORKERS))
+
+    info['reduction_settings'] = plans
+    return info
+
+def get_report(aoi, start_year, sedimentation, max_workers=None, backend=None, protected_planet_method='raster', include_series=False,
+               preview=False):
+    '''
+    Gets every metric in get_csv from earth engine (see get_report_info) and turns them into the report.
+    backend=LocalBackend.backend(folder) works them out from exported layers instead - no earth engine session needed, aoi can be None.
+    preview=True reduces everything at Baseline.PREVIEW_SCALE - a quick estimate, see get_report_with_preview.
+    Inputs: aoi (featureCollection), start_year and sedimentation as passed into get_csv.
+    Output: a dictionary of python values - pass it to write_csv.
+    '''
+    if backend is None:
+        info = get_report_info(aoi, start_year, max_workers, protected_planet_method, include_series,
+                               scale=Baseline.preview_scale(preview))
+    else:
+        info = backend(aoi, start_year)
+
+    return build_report(info, start_year, sedimentation)
+
+def preview_deltas(preview_report, report):
+    '''
+    How far every number of the preview moved once refined: column of REPORT_COLUMNS -> {'preview', 'refined', 'delta', 'delta_percent'}.
+    delta is refined - preview. delta_percent is relative to the preview (None when the preview is 0 or either value is missing).
+    '''
+    preview_row = summarize_report(preview_report)
+    refined_row = summarize_report(report)
+
+    deltas = {}
+    for column in REPORT_COLUMNS:
+        preview_value = preview_row[column]
+        refined_value = refined_row[column]
+        delta = None
+        delta_percent = None
+        if preview_value is not None and refined_value is not None:
+            delta = refined_value - preview_value
+            if preview_value != 0:
+                delta_percent = (delta / abs(preview_value)) * 100
+        deltas[column] = {'preview': preview_value, 'refined': refined_value, 'delta': delta, 'delta_percent': delta_percent}
+    return deltas
+
+def get_report_with_preview(aoi, start_year, sedimentation, max_workers=None, protected_planet_method='raster', include_series=False,
+                            on_refined=None):
+    '''
+    Coarse to fine: gets the whole report at Baseline.PREVIEW_SCALE (seconds, whatever the aoi), then redoes it at native resolution
+    in the background.
+    The preview always uses the raster protected planet method - protected_planet_method only applies to the refined report.
+    on_refined, if given, is called with the refined report as soon as it's ready (still on the background thread).
+    Output: (preview report, future) - future.result() waits for the refined report, which holds 'preview_deltas' (see preview_deltas).
+    '''
+    # The refined report reuses the images built for the preview.
+    aoi = Context.get_context(aoi)
+    preview_report = get_report(aoi, start_year, sedimentation, max_workers, include_series=include_series, preview=True)
+
+    def refine():
+        report = get_report(aoi, start_year, sedimentation, max_workers, protected_planet_method=protected_planet_method,
+                            include_series=include_series)
+        report['preview_deltas'] = preview_deltas(preview_report, report)
+        if on_refined is not None:
+            on_refined(report)
+        return report
+
+    return preview_report, Workers.run_in_background(refine)
+
+def get_report_checkpointed(aoi, start_year, sedimentation, folder, max_workers=None, protected_planet_method='raster',
+                            include_series=False):
+    '''
+    get_report, saving every metric into folder/.checkpoints as soon as it's fetched (see Checkpoint.py).
+    Metrics already checkpointed by an earlier run of the same aoi and settings aren't fetched again.
+    If the metrics can't all be fetched together, each one is fetched on its own (max_workers at a time), so one bad metric
+    (a protected planet timeout...) doesn't lose the others: it's checkpointed as failed, and its sections of the report
+    are marked failed instead of aborting the run (see build_report). The next run only tries the failed ones again.
+    '''
+    aoi = Context.get_context(aoi)
+    keys = {name: key for name, (key, ee_object) in get_report_requests(aoi, start_year, protected_planet_method, include_series).items()}
+
+    info = {}
+    plans = {}
+    for name, checkpoint in Checkpoint.read_done(folder, keys).items():
+        info[name] = checkpoint['value']
+        if checkpoint['reduction_settings'] is not None:
+            plans[name] = checkpoint['reduction_settings']
+
+    def fetch(names):
+        fetched = get_report_info(aoi, start_year, max_workers, protected_planet_method, include_series, names=names)
+        fetched_plans = fetched.pop('reduction_settings') or {}
+        for name in names:
+            Checkpoint.write(folder, name, keys[name], fetched[name], reduction_settings=fetched_plans.get(name))
+        info.update(fetched)
+        plans.update(fetched_plans)
+
+    missing = [name for name in keys if name not in info]
+    errors = {}
+    if missing:
+        try:
+            fetch(missing)
+        except Exception as error:
+            if len(missing) == 1:
+                errors = {missing[0]: error}
+            else:
+                # One at a time, so whatever works is kept
+                tasks = {name: lambda name=name: fetch([name]) for name in missing}
+                results, errors = Workers.run_tasks(tasks, max_workers or Workers.DEFAULT_MAX_WORKERS)
+        for name, error in errors.items():
+            Checkpoint.write(folder, name, keys[name], error=error)
+
+    info['reduction_settings'] = plans or None
+    return build_report(info, start_year, sedimentation, errors)
+
+# Sections of the report (and of output.csv) -> the metrics of get_report_requests each is worked out from.
+REPORT_SECTIONS = {
+    'area': ['area_m2'],
+    'murray': ['murray', 'area_m2'],
+    'gmw': ['gmw'],
+    'jaxa': ['jaxa'],
+    'slr': ['slr'],
+    'elevation': ['elevation'],
+    'inundation': ['slr_ssp370', 'slr_ssp585', 'elevation_histogram'],
+    'protected_planet': ['protected_planet', 'area_m2'],
+    'baseline_series': ['baseline_series']
+}
+
+def build_report(info, start_year, sedimentation, errors=None):
+    '''
+    Turns the fetched results of get_report_requests into the report dictionary write_csv uses. No earth engine calls.
+    errors: metric name -> error, for metrics that couldn't be fetched (see get_report_checkpointed). Every section of
+    REPORT_SECTIONS needing one of them is left out, and listed in report['failed'] (section -> error message) instead.
+    So is a section that can't be worked out from what was fetched (an inundation height the elevation histogram can't
+    answer...) - the rest of the report is still built.
+    '''
+    errors = errors or {}
+    report = {}
+    failed = {}
+    for section, names in REPORT_SECTIONS.items():
+        failures = [name + ' - ' + str(errors[name]) for name in names if name in errors]
+        if failures:
+            failed[section] = '; '.join(failures)
+        elif section != 'baseline_series' or 'baseline_series' in info:
+            try:
+                report.update(build_section(section, info, start_year, sedimentation))
+            except Exception as error:
+                failed[section] = str(error)
+
+    if failed:
+        report['failed'] = failed
+    if info.get('reduction_settings') is not None:
+        report['reduction_settings'] = info['reduction_settings']
+    return report
+
+def build_section(section, info, start_year, sedimentation):
+    '''
+    The entries of the report for one section of REPORT_SECTIONS, from the fetched results.
+    '''
+    eval_year = start_year - 1
+
+    # Percentages are worked out here rather than on the server, using the exact same formulas as the *_percent functions.
+    if section == 'area':
+        return {'area': round(info['area_m2'] / 10000)}
+
+    if section == 'murray':
+        aoi_ha = info['area_m2'] / 10000
+        murray_loss = Baseline.parse_murray_loss_by_year(info['murray'])
+        murray = Baseline.murray_hectares_from_loss(murray_loss, eval_year)
+        return {
+            'murray_hectares': murray,
+            'murray_loss_by_year': murray_loss,
+            'murray_percent': {
+                'ten_year_loss_percent': (murray['ten_year_loss'] / aoi_ha) * 100,
+                'total_loss_percent': (murray['total'] / aoi_ha) * 100
+            }
+        }
+
+    if section == 'gmw':
+        gmw_areas = Baseline.parse_land_cover_areas(info['gmw'], 'GMW')
+        return {'gmw_hectares': gmw_areas['hectares'][1], 'gmw_percent': gmw_areas['percent'][1]}
+
+    if section == 'jaxa':
+        jaxa_areas = Baseline.parse_land_cover_areas(info['jaxa'], Baseline.jaxa_dataset(eval_year))
+        return {
+            'jaxa_hectares': Baseline.jaxa_hectares_from_areas(jaxa_areas, eval_year),
+            'jaxa_percent': Baseline.jaxa_percent_from_areas(jaxa_areas, eval_year)
+        }
+
+    if section == 'slr':
+        slr_quantiles = SLR.parse_slr_quantiles(info['slr'], eval_year)
+        return {'slr': SLR.median_slr_dictionary(slr_quantiles), 'slr_quantiles': slr_quantiles}
+
+    if section == 'elevation':
+        return {'elevation': SLR.parse_elevation_data(info['elevation'])}
+
+    if section == 'inundation':
+        histogram = SLR.parse_elevation_histogram(info['elevation_histogram'])
+        inundation = {}
+        for scenario, name in [('SSP3-7.0', 'slr_ssp370'), ('SSP5-8.5', 'slr_ssp585')]:
+            height = SLR.calculate_inundation_height(sedimentation, info[name])
+            hectares = SLR.inundated_hectares_from_histogram(histogram, height)
+            inundation[scenario] = {'height': height, 'hectares': hectares, 'percent': (hectares / histogram['total_hectares']) * 100}
+        return {'inundation': inundation}
+
+    if section == 'protected_planet':
+        # Either method's result (see PP.protected_planet_request)
+        protected_planet = PP.parse_protected_planet_info(info['protected_planet'], info['area_m2'])
+        return {
+            'protected_planet_hectares': protected_planet['hectares'],
+            'protected_planet_percent': protected_planet['percent'],
+            'protected_planet_breakdown': {
+                'by_iucn_category': protected_planet['by_iucn_category'],
+                'by_status': protected_planet['by_status']
+            }
+        }
+
+    if section == 'baseline_series':
+        return {'baseline_series': Baseline.baseline_series_from_info(info['baseline_series'])}
+
+    raise ValueError("Unknown report section: " + str(section))
+
+def get_report_sequential(aoi, start_year, sedimentation):
+    '''
+    The original way of getting the report - every metric fetched on its own (roughly 40 getInfo() calls).
+    Much slower than get_report, but handy for checking that both give the same numbers.
+    '''
+    # Still one context, so the datasets, the DEM and the aoi area aren't rebuilt (or refetched) by every function below.
+    aoi = Context.get_context(aoi)
+    eval_year = start_year - 1
+
+    slr_dict = SLR.get_slr_dictionary(aoi, eval_year)
+
+    # Get SLR value from 100 years in future. The decades above start from eval_year, so when start_year is itself a decade
+    # (2020 -> decades 2020-2120, inundation year 2130) it isn't in there - then it's fetched on its own, like get_report does.
+    inundation_year = get_inundation_year(start_year)
+    ssp370_last_year_SLR = slr_dict["SSP3-7.0"].get(inundation_year)
+    if ssp370_last_year_SLR is None:
+        ssp370_last_year_SLR = SLR.get_nasa_slr(aoi, inundation_year, "SSP3-7.0")
+    ssp585_last_year_SLR = slr_dict["SSP5-8.5"].get(inundation_year)
+    if ssp585_last_year_SLR is None:
+        ssp585_last_year_SLR = SLR.get_nasa_slr(aoi, inundation_year, "SSP5-8.5")
+
+    # No data parsing needed for sedimentation: 1 cm/year = 1 meter/100 years! It took me way too long to realize that.
+    inundation_height_ssp370 = SLR.calculate_inundation_height(sedimentation, ssp370_last_year_SLR)
+    inundation_height_ssp585 = SLR.calculate_inundation_height(sedimentation, ssp585_last_year_SLR)
+
+    protected_planet = PP.protected_planet_areas(aoi)
 
+    return {
+        'area': round(Baseline.aoi_area_m2(aoi) / 10000),
+        'murray_hectares': Baseline.murray_hectares(aoi, eval_year),
+        'murray_percent': Baseline.murray_percent(aoi, eval_year),
+        'gmw_hectares': Baseline.gmw_hectares(aoi, eval_year),
+        'gmw_percent': Baseline.gmw_percent(aoi, eval_year),
+        'jaxa_hectares': Baseline.jaxa_hectares(aoi, eval_year),
+        'jaxa_percent': Baseline.jaxa_percent(aoi, eval_year),
+        'slr': slr_dict,
+        'elevation': SLR.get_elevation_data(aoi),
+        'inundation': {
+            'SSP3-7.0': {
+                'height': inundation_height_ssp370,
+                'hectares': SLR.area_inundated_hectares(aoi, inundation_height_ssp370),
+                'percent': SLR.area_inundated_percent(aoi, inundation_height_ssp370)
+            },
+            'SSP5-8.5': {
+                'height': inundation_height_ssp585,
+                'hectares': SLR.area_inundated_hectares(aoi, inundation_height_ssp585),
+                'percent': SLR.area_inundated_percent(aoi, inundation_height_ssp585)
+            }
+        },
+        # Finally, protected planet data.
+        'protected_planet_hectares': protected_planet['hectares'],
+        'protected_planet_percent': protected_planet['percent'],
+        'protected_planet_breakdown': {
+            'by_iucn_category': protected_planet['by_iucn_category'],
+            'by_status': protected_planet['by_status']
+        }
+    }
 
-def get_csv(filepath, start_year, sedimentation, folder):
+def get_csv(filepath, start_year, sedimentation, folder, single_request=True, max_workers=None, protected_planet_method='raster',
+            include_series=False, preview=False, trace=False, checkpoint=True, site=None, prepare=False):
+    '''
+    Makes folder/output.csv for the project shapefile.
+    single_request=True (default) fetches every metric in one round trip with get_report.
+    max_workers=N instead fetches the metrics side by side, N at a time, so the run takes about as long as the slowest metric.
+    single_request=False fetches them one by one with get_report_sequential.
+    protected_planet_method='vector' uses the exact (slow) WDPA intersection instead of the painted raster (see PP.protected_planet_areas).
+    include_series=True adds a GMW/JAXA time series section, every year the datasets have, with trends.
+    preview=True writes folder/output_preview.csv at Baseline.PREVIEW_SCALE first and returns straight away, while the native
+    resolution report is worked out in the background (see get_report_with_preview). When that's done it writes folder/output.csv as usual
+    and folder/preview_deltas.csv, how far each number moved. Output is then (preview report, future of the refined report).
+    trace=True records every earth engine request and download of the run (see Trace.py) into folder/trace.json, trace.csv,
+    trace_summary.csv and trace_timeline.json, and prints the summary table.
+    checkpoint=True (default, single_request only) saves every metric into folder/.checkpoints as it's fetched, so rerunning
+    after a crash or a timeout only fetches what's missing - metrics that still fail are marked FAILED in output.csv
+    (see get_report_checkpointed). The checkpoints are removed once every metric is in.
+    Every report is also appended to the results store as typed records (see Store.py), under site - the file's name by default.
+    prepare=True cleans and simplifies the boundary before anything is measured, and writes folder/geometry_stats.json (see convert_to_ee).
+    Either way, output.csv and the store record how the boundary was loaded.
+    '''
     #Make folder if doesn't exist yet
     if not os.path.exists(folder):
         os.makedirs(folder)
-    # Parse input data
-    aoi = convert_to_ee(filepath)
-    eval_year = start_year - 1
-    year_string = str(eval_year)
+
+    # Inside a traced batch, the batch's trace already covers this site.
+    tracing = trace and not Trace.is_enabled()
+    if tracing:
+        Trace.start()
+    try:
+        result = make_csv(filepath, start_year, sedimentation, folder, single_request, max_workers, protected_planet_method,
+                          include_series, preview, checkpoint, site, prepare)
+    except Exception:
+        if tracing:
+            finish_trace(folder)
+        raise
+
+    if tracing:
+        if preview:
+            # The refinement is still running - the trace ends with it.
+            result[1].add_done_callback(lambda future: finish_trace(folder))
+        else:
+            finish_trace(folder)
+    return result
+
+def finish_trace(folder):
+    '''
+    Stops tracing, writes the trace files into folder and prints the summary table.
+    '''
+    events = Trace.stop()
+    Trace.write(events, folder)
+    print(Trace.format_summary(events))
+
+def make_csv(filepath, start_year, sedimentation, folder, single_request=True, max_workers=None, protected_planet_method='raster',
+             include_series=False, preview=False, checkpoint=True, site=None, prepare=False):
+    '''
+    get_csv without the tracing - same inputs and output. folder has to exist.
+    '''
+    # Parse input data - one context for everything below
+    aoi = Context.get_context(convert_to_ee(filepath, prepare, stats_folder=folder))
+    site = site or os.path.splitext(os.path.basename(filepath))[0]
+    geometry = geometry_settings(prepare)
+
+    if preview:
+        def write_refined(report):
+            report['geometry'] = geometry
+            write_csv(report, start_year, folder)
+            write_reduction_settings(report, folder)
+            write_deltas_csv(report['preview_deltas'], folder)
+            Store.append_report(report, site, start_year, sedimentation, filepath)
+
+        preview_report, future = get_report_with_preview(aoi, start_year, sedimentation, max_workers, protected_planet_method,
+                                                         include_series, on_refined=write_refined)
+        preview_report['geometry'] = geometry
+        write_csv(preview_report, start_year, folder, 'output_preview.csv')
+        return preview_report, future
 
     # Call functions for csv data
-    area = round(aoi.geometry().area(1).getInfo() / 10000)
+    if single_request and checkpoint:
+        report = get_report_checkpointed(aoi, start_year, sedimentation, folder, max_workers, protected_planet_method, include_series)
+    elif single_request:
+        report = get_report(aoi, start_year, sedimentation, max_workers, protected_planet_method=protected_planet_method,
+                            include_series=include_series)
+    else:
+        report = get_report_sequential(aoi, start_year, sedimentation)
+        if include_series:
+            report['baseline_series'] = Baseline.baseline_series(aoi)
 
-    murray_hectares_dict = Baseline.murray_hectares(aoi, eval_year)
-    murray_percent_dict = Baseline.murray_percent(aoi, eval_year)
+    report['geometry'] = geometry
+    write_csv(report, start_year, folder)
+    write_reduction_settings(report, folder)
+    Store.append_report(report, site, start_year, sedimentation, filepath)
 
-    gmw_hectares = Baseline.gmw_hectares(aoi, eval_year)
-    gmw_percent = Baseline.gmw_percent(aoi, eval_year)
+    # Nothing left to pick up - a rerun starts fresh (from the result cache)
+    if checkpoint and 'failed' not in report:
+        Checkpoint.clear(folder)
+    return report
 
-    jaxa_hectares = Baseline.jaxa_hectares(aoi, eval_year)
-    jaxa_percentages = Baseline.jaxa_percent(aoi, eval_year)
+def write_reduction_settings(report, folder):
+    # Settings every reduction actually ran with, to go with the numbers
+    if 'reduction_settings' in report:
+        with open(folder + '/reduction_settings.json', 'w', encoding='utf-8') as f:
+            json.dump(report['reduction_settings'], f, indent=2)
 
-    slr_dict = SLR.get_slr_dictionary(aoi, eval_year)
+def write_deltas_csv(deltas, folder):
+    '''
+    Writes folder/preview_deltas.csv from preview_deltas - one row per metric, preview vs refined.
+    '''
+    with open(folder + '/preview_deltas.csv', mode='w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['metric', 'preview (' + str(Baseline.PREVIEW_SCALE) + ' m)', 'refined (native)', 'delta', 'delta %'])
+        for column, values in deltas.items():
+            writer.writerow([column, values['preview'], values['refined'], values['delta'],
+                             "" if values['delta_percent'] is None else round(values['delta_percent'], 2)])
 
-    elevation_dict = SLR.get_elevation_data(aoi)
+# Columns of summarize_report - the report flattened into one row (used by Batch and Zonal tables).
+REPORT_COLUMNS = [
+    'area_ha',
+    'murray_ten_year_loss_ha', 'murray_ten_year_loss_percent', 'murray_total_loss_ha', 'murray_total_loss_percent',
+    'gmw_ha', 'gmw_percent',
+    'jaxa_total_ha', 'jaxa_total_percent',
+    'elevation_mean_m', 'elevation_min_m', 'elevation_max_m',
+    'inundated_ssp370_ha', 'inundated_ssp370_percent', 'inundated_ssp585_ha', 'inundated_ssp585_percent',
+    'protected_planet_ha', 'protected_planet_percent'
+]
 
-    # Get SLR value from 100 years in future
-    ssp370_last_year_SLR = slr_dict["SSP3-7.0"][(((start_year // 10) + 1) * 10) + 100]
-    ssp585_last_year_SLR = slr_dict["SSP5-8.5"][(((start_year // 10) + 1) * 10) + 100]
+def summarize_report(report):
+    '''
+    Flattens a report (from get_report) into one row - a dictionary with the keys of REPORT_COLUMNS.
+    Columns of sections that failed (see build_report) are None.
+    '''
+    failed = report.get('failed', {})
+    row = {column: None for column in REPORT_COLUMNS}
 
-    # No data parsing needed for sedimentation: 1 cm/year = 1 meter/100 years! It took me way too long to realize that.
-    inundation_height_ssp370 = SLR.calculate_inundation_height(sedimentation, ssp370_last_year_SLR)
-    area_inundated_hectares_ssp370 = SLR.area_inundated_hectares(aoi, inundation_height_ssp370)
-    area_inundated_percent_ssp370 = SLR.area_inundated_percent(aoi, inundation_height_ssp370)
+    if 'area' not in failed:
+        row['area_ha'] = report['area']
 
-    inundation_height_ssp585 = SLR.calculate_inundation_height(sedimentation, ssp585_last_year_SLR)
-    area_inundated_hectares_ssp585 = SLR.area_inundated_hectares(aoi, inundation_height_ssp585)
-    area_inundated_percent_ssp585 = SLR.area_inundated_percent(aoi, inundation_height_ssp585)
+    if 'murray' not in failed:
+        row.update({
+            'murray_ten_year_loss_ha': report['murray_hectares']['ten_year_loss'],
+            'murray_ten_year_loss_percent': report['murray_percent']['ten_year_loss_percent'],
+            'murray_total_loss_ha': report['murray_hectares']['total'],
+            'murray_total_loss_percent': report['murray_percent']['total_loss_percent']
+        })
 
-    # Finally, protected planet data.
-    protected_planet_hectares = PP.protected_planet_hectares(aoi)
-    protected_planet_percent = PP.protected_planet_percent(aoi)
+    if 'gmw' not in failed:
+        row.update({'gmw_ha': report['gmw_hectares'], 'gmw_percent': report['gmw_percent']})
+
+    if 'jaxa' not in failed:
+        jaxa_hectares = report['jaxa_hectares']
+        jaxa_percent = report['jaxa_percent']
+        if type(jaxa_hectares) is dict:
+            jaxa_hectares = jaxa_hectares['Total']
+            jaxa_percent = jaxa_percent['Total']
+        row.update({'jaxa_total_ha': jaxa_hectares, 'jaxa_total_percent': jaxa_percent})
+
+    if 'elevation' not in failed:
+        row.update({
+            'elevation_mean_m': report['elevation']['mean'],
+            'elevation_min_m': report['elevation']['min'],
+            'elevation_max_m': report['elevation']['max']
+        })
+
+    if 'inundation' not in failed:
+        row.update({
+            'inundated_ssp370_ha': report['inundation']['SSP3-7.0']['hectares'],
+            'inundated_ssp370_percent': report['inundation']['SSP3-7.0']['percent'],
+            'inundated_ssp585_ha': report['inundation']['SSP5-8.5']['hectares'],
+            'inundated_ssp585_percent': report['inundation']['SSP5-8.5']['percent']
+        })
+
+    if 'protected_planet' not in failed:
+        row.update({
+            'protected_planet_ha': report['protected_planet_hectares'],
+            'protected_planet_percent': report['protected_planet_percent']
+        })
+    return row
+
+# JAXA percentages are of the aoi's pixels (see Baseline.jaxa_percent_from_areas) - the sheet says so next to them.
+JAXA_PERCENT_NOTE = "JAXA and inundation % are of the aoi's pixel area; Murray, GMW and protected planet % are of its geometry area."
+
+def write_csv(report, start_year, folder, filename='output.csv'):
+    '''
+    Writes folder/output.csv (or folder/filename) from a report made by get_report or get_report_sequential.
+    '''
+    eval_year = start_year - 1
+    year_string = str(eval_year)
+
+    # Sections that failed (see build_report) keep their place in the sheet, marked FAILED with the reason.
+    failed = report.get('failed', {})
+
+    def failed_row(title, section):
+        return [title, "FAILED", failed[section]]
 
     # CREATE ROWS FROM DATA COLLECTED ABOVE - MOSTLY VISUALS AND AESTHETICS OF SHEET BELOW.
 
     # BASELINE ROWS - complicated to make it look pretty - don't worry about below unless you want to change the CSV format.
     # includes Murray and GMW
-    baseline_rows = [
-        ["Baseline Spatial Analysis"],
-        ['Project Area:', area, 'ha'],
-        ['Murray tree cover loss (' + str(start_year - 10) + '-' + year_string + ')',
-         round(murray_hectares_dict['ten_year_loss'], 2),
-         'ha', str(murray_percent_dict['ten_year_loss_percent']) + "%", "Note that data cuts off at 2019."],
-        ['Murray tree cover loss (1999-2019)', round(murray_hectares_dict['total'], 2),
-         'ha', str(murray_percent_dict['total_loss_percent']) + "%"],
-        ['Area covered by forest ' + year_string + " GMW", round(gmw_hectares, 2), 'ha', str(gmw_percent) + "%"],
-    ]
+    baseline_rows = [["Baseline Spatial Analysis"]]
+
+    if 'area' in failed:
+        baseline_rows.append(failed_row('Project Area:', 'area'))
+    else:
+        baseline_rows.append(['Project Area:', report['area'], 'ha'])
+
+    # How the boundary was loaded (see convert_to_ee) - a prepared boundary gives slightly different numbers.
+    if 'geometry' in report:
+        geometry = report['geometry']
+        if geometry['prepare']:
+            baseline_rows.append(['Geometry:', 'prepared', 'tolerance ' + str(geometry['tolerance_m']) + ' m',
+                                  'parts under ' + str(geometry['min_part_m2']) + ' m2 removed'])
+        else:
+            baseline_rows.append(['Geometry:', 'as drawn'])
+
+    murray_titles = ['Murray tree cover loss (' + str(start_year - 10) + '-' + year_string + ')', 'Murray tree cover loss (1999-2019)']
+    if 'murray' in failed:
+        baseline_rows.extend(failed_row(title, 'murray') for title in murray_titles)
+    else:
+        murray_hectares_dict = report['murray_hectares']
+        murray_percent_dict = report['murray_percent']
+        baseline_rows.extend([
+            [murray_titles[0], round(murray_hectares_dict['ten_year_loss'], 2),
+             'ha', str(murray_percent_dict['ten_year_loss_percent']) + "%", "Note that data cuts off at 2019."],
+            [murray_titles[1], round(murray_hectares_dict['total'], 2),
+             'ha', str(murray_percent_dict['total_loss_percent']) + "%"]
+        ])
+
+    gmw_title = 'Area covered by forest ' + year_string + " GMW"
+    if 'gmw' in failed:
+        baseline_rows.append(failed_row(gmw_title, 'gmw'))
+    else:
+        baseline_rows.append([gmw_title, round(report['gmw_hectares'], 2), 'ha', str(report['gmw_percent']) + "%"])
 
     # initalize jaxa_rows
     jaxa_rows = None
+    jaxa_titles = ['Area covered by dense forest ' + year_string + ' JAXA', 'Area covered by sparse forest ' + year_string + ' JAXA',
+                   'Area covered by forest total ' + year_string + ' JAXA']
 
     # Make jaxa rows - some parsing must be done
-    if type(jaxa_hectares) is dict:
+    if 'jaxa' in failed:
+        jaxa_rows = [failed_row(title, 'jaxa') for title in jaxa_titles]
+    elif type(report['jaxa_hectares']) is dict:
+        jaxa_hectares = report['jaxa_hectares']
+        jaxa_percentages = report['jaxa_percent']
         jaxa_rows = [
-            ['Area covered by dense forest ' + year_string + ' JAXA', round(jaxa_hectares["Dense"], 2), "ha",
-             str(jaxa_percentages["Dense"]) + "%"],
-            ['Area covered by sparse forest ' + year_string + ' JAXA', round(jaxa_hectares["Non-dense"], 2), "ha",
-             str(jaxa_percentages["Non-dense"]) + "%"],
-            ['Area covered by forest total ' + year_string + ' JAXA', round(jaxa_hectares["Total"], 2), "ha",
-             str(jaxa_percentages["Total"]) + "%"],
+            [jaxa_titles[0], round(jaxa_hectares["Dense"], 2), "ha", str(jaxa_percentages["Dense"]) + "%", JAXA_PERCENT_NOTE],
+            [jaxa_titles[1], round(jaxa_hectares["Non-dense"], 2), "ha", str(jaxa_percentages["Non-dense"]) + "%"],
+            [jaxa_titles[2], round(jaxa_hectares["Total"], 2), "ha", str(jaxa_percentages["Total"]) + "%"],
         ]
     else:
+        # Before 2017 (FNF3), JAXA only gives one number - total forest.
         jaxa_rows = [
-            ['Area covered by dense forest ' + year_string + ' JAXA', "N/A"],
-            ['Area covered by sparse forest ' + year_string + ' JAXA', "N/A"],
-            ['Area covered by forest total ' + year_string + ' JAXA', round(jaxa_hectares["Total"], 2), "ha",
-             str(jaxa_percentages["Total"]) + "%"],
+            [jaxa_titles[0], "N/A"],
+            [jaxa_titles[1], "N/A"],
+            [jaxa_titles[2], round(report['jaxa_hectares'], 2), "ha", str(report['jaxa_percent']) + "%", JAXA_PERCENT_NOTE],
         ]
 
     # Make SLR rows
-
-    years = slr_dict["SSP3-7.0"].keys()
     slr_rows = [['SLR DATA', 'IPCC Sea Level Rise SSP3-7.0 (m)', 'IPCC SLR SSP5-8.5 (m)']]
-    for year in years:
-        row = [year, slr_dict["SSP3-7.0"][year], slr_dict["SSP5-8.5"][year]]
-        slr_rows.append(row)
+    if 'slr' in failed:
+        slr_rows.append(failed_row('SLR', 'slr'))
+    else:
+        slr_dict = report['slr']
+        for year in slr_dict["SSP3-7.0"].keys():
+            row = [year, slr_dict["SSP3-7.0"][year], slr_dict["SSP5-8.5"][year]]
+            slr_rows.append(row)
 
     # Make Elevation rows
-    elevation_rows = [
-        ["Elevation of area"],
-        ["Mean", round(elevation_dict["mean"], 2), "m"],
-        ["Min", round(elevation_dict["min"], 2), "m"],
-        ["Max", round(elevation_dict["max"], 2), "m"]
-
-    ]
+    elevation_rows = [["Elevation of area"]]
+    if 'elevation' in failed:
+        elevation_rows.extend(failed_row(title, 'elevation') for title in ["Mean", "Min", "Max"])
+    else:
+        elevation_dict = report['elevation']
+        elevation_rows.extend([
+            ["Mean", round(elevation_dict["mean"], 2), "m"],
+            ["Min", round(elevation_dict["min"], 2), "m"],
+            ["Max", round(elevation_dict["max"], 2), "m"]
+        ])
 
     # Make inundation rows
-    submergence_rows = [
-        ["Project Area lost to SLR after 100 years calculation"],
-        ["IPCC Sea Level Rise SSP3-7.0 in Area"],
-        [round(area_inundated_hectares_ssp370, 2), "ha under", inundation_height_ssp370, "m"],
-        [round(area_inundated_percent_ssp370, 2), "% inundated"],
-        ["IPCC Sea Level Rise SSP5-8.5 in Area"],
-        [round(area_inundated_hectares_ssp585, 2), "ha under", inundation_height_ssp585, "m"],
-        [round(area_inundated_percent_ssp585, 2), "% inundated"]
-    ]
+    submergence_rows = [["Project Area lost to SLR after 100 years calculation"]]
+    for scenario in ["SSP3-7.0", "SSP5-8.5"]:
+        submergence_rows.append(["IPCC Sea Level Rise " + scenario + " in Area"])
+        if 'inundation' in failed:
+            submergence_rows.append(failed_row("ha under", 'inundation'))
+            submergence_rows.append(failed_row("% inundated", 'inundation'))
+            continue
+        inundation = report['inundation'][scenario]
+        submergence_rows.append([round(inundation['hectares'], 2), "ha under", inundation['height'], "m"])
+        submergence_rows.append([round(inundation['percent'], 2), "% inundated"])
 
     # Make Protected Planet Rows
-    pp_rows = [
-        ["Protected Planet Statistics"],
-        [round(protected_planet_hectares, 2), "ha"],
-        [round(protected_planet_percent, 2), "ha"]
-    ]
+    pp_rows = [["Protected Planet Statistics"]]
+    if 'protected_planet' in failed:
+        pp_rows.extend([failed_row("ha", 'protected_planet'), failed_row("%", 'protected_planet')])
+    else:
+        pp_rows.extend([
+            [round(report['protected_planet_hectares'], 2), "ha"],
+            [round(report['protected_planet_percent'], 2), "ha"]
+        ])
+
+    # Breakdown by IUCN category and status - only the raster method has one, and only categories present are listed.
+    breakdown = report.get('protected_planet_breakdown')
+    if breakdown is not None and breakdown['by_iucn_category'] is not None:
+        for title, label, values in [('IUCN category', 'IUCN ', breakdown['by_iucn_category']),
+                                     ('designation status', '', breakdown['by_status'])]:
+            pp_rows.append(["Protected area by " + title])
+            for name, value in values.items():
+                if value['hectares'] > 0:
+                    pp_rows.append([label + name, round(value['hectares'], 2), "ha", str(round(value['percent'], 2)) + "%"])
+
+    # Time series rows - only when the report has one (get_csv with include_series=True)
+    series_rows = []
+    if 'baseline_series' in failed:
+        series_rows = [failed_row("Baseline time series", 'baseline_series')]
+    elif 'baseline_series' in report:
+        gmw_series = report['baseline_series']['gmw']
+        jaxa_series = report['baseline_series']['jaxa']
+        series_rows = [
+            ["Baseline time series", "Note that JAXA is FNF3 (forest) before 2017 and FNF4 (dense + sparse forest) after."],
+            ["Year", "GMW mangroves (ha)", "JAXA forest (ha)"]
+        ]
+        for year in sorted(set(gmw_series['hectares']) | set(jaxa_series['hectares'])):
+            gmw_value = gmw_series['hectares'].get(year)
+            jaxa_value = jaxa_series['hectares'].get(year)
+            series_rows.append([year, "" if gmw_value is None else round(gmw_value, 2), "" if jaxa_value is None else round(jaxa_value, 2)])
+
+        for name, values in [("GMW", gmw_series), ("JAXA", jaxa_series)]:
+            trend = values['trend']
+            if trend is None:
+                series_rows.append([name + " trend", "N/A"])
+                continue
+            rate = "N/A" if trend['annual_change_percent'] is None else str(round(trend['annual_change_percent'], 2)) + "%"
+            series_rows.append([name + " trend " + str(trend['first_year']) + "-" + str(trend['last_year']),
+                                round(trend['slope_ha_per_year'], 2), "ha/year", rate, "annualized change"])
 
-    with open(folder + '/output.csv', mode='w', newline='', encoding='utf-8') as f:
+    with open(folder + '/' + filename, mode='w', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
         writer.writerow([])
         writer.writerows(baseline_rows)
@@ -147,9 +798,106 @@ def get_csv(filepath, start_year, sedimentation, folder):
         writer.writerows(submergence_rows)
         writer.writerow([])
         writer.writerows(pp_rows)
+        if series_rows:
+            writer.writerow([])
+            writer.writerows(series_rows)
+
+# Value written to every band of export_project_layers where there is no data.
+PROJECT_LAYERS_NODATA = -9999
+
+def export_project_layers(aoi, year, inundation_height_m, folder, scale=30, mosaic=True):
+    '''
+    Exports DEM, submergence, GMW extent, JAXA forest and Murray loss as ONE multiband GeoTIFF (folder/project_layers.tif),
+    all resampled onto the same grid (scale in meters), instead of separate downloads.
+    A band manifest describing every band is written next to it (folder/project_layers_bands.json), along with the
+    few metrics that aren't rasters (SLR, protected planet) for a project starting year + 1 - so LocalBackend can redo the report offline.
+    mosaic=False keeps one aligned set of per-tile GeoTIFFs instead of a single file (see Export.export_image).
+    '''
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    # Built once and shared by the elevation and submergence bands, and the metrics at the end
+    aoi = Context.get_context(aoi)
+    dem_image = SLR.get_elevation_map(aoi)
+    jaxa_dataset = Baseline.jaxa_dataset(year)
+
+    bands = [
+        {
+            'band': 'elevation',
+            'image': dem_image,
+            'dataset': 'COPERNICUS/DEM/GLO30',
+            'units': 'm',
+            'description': 'Copernicus GLO-30 elevation'
+        },
+        {
+            'band': 'submergence',
+            'image': SLR.get_submergence_image(dem_image, inundation_height_m),
+            'dataset': 'COPERNICUS/DEM/GLO30',
+            'units': 'm',
+            'description': 'Elevation where at or below ' + str(inundation_height_m) + ' m (inundated), no data elsewhere'
+        },
+        {
+            'band': 'gmw',
+            'image': Baseline.get_gmw_image(aoi, year),
+            'dataset': Baseline.LAND_COVER_DATASETS['GMW']['collection'],
+            'units': 'class',
+            'description': 'GMW mangrove extent ' + str(year) + ': 1 = mangrove, no data elsewhere'
+        },
+        {
+            'band': 'jaxa',
+            'image': Baseline.get_jaxa_forest_image(aoi, year),
+            'dataset': Baseline.LAND_COVER_DATASETS[jaxa_dataset]['collection'],
+            'units': 'class',
+            'description': 'JAXA ' + jaxa_dataset + ' ' + str(year) + ' forest classes ('
+                           + ', '.join(str(code) + ' = ' + Baseline.LAND_COVER_DATASETS[jaxa_dataset]['classes'][code]
+                                       for code in Baseline.JAXA_FOREST_CLASSES[jaxa_dataset])
+                           + '), no data elsewhere'
+        },
+        {
+            'band': 'murray_loss_year',
+            'image': Baseline.get_murray_loss_year_image(aoi),
+            'dataset': 'JCU/Murray/GIC/global_tidal_wetland_change/2019',
+            'units': 'years since 2000',
+            'description': 'Murray tidal wetland loss year where there was loss, no data elsewhere'
+        }
+    ]
+
+    # One float band per layer. Masked pixels get PROJECT_LAYERS_NODATA, since a GeoTIFF can't hold a separate mask per band.
+    stack = ee.Image.cat([band['image'].toFloat().rename(band['band']) for band in bands]).unmask(PROJECT_LAYERS_NODATA)
+
+    filename = folder + '/project_layers.tif'
+    result = Export.export_image(stack, filename, aoi, scale, band_count=len(bands), mosaic=mosaic, nodata=PROJECT_LAYERS_NODATA)
+
+    # Non-raster metrics for LocalBackend - usually already in the cache from get_csv.
+    requests = get_report_requests(aoi, year + 1)
+    values = Cache.fetch_many({name: requests[name] for name in LocalBackend.VALUE_METRICS})
+
+    manifest = {
+        'file': os.path.basename(filename) if mosaic else [os.path.relpath(path, folder) for path in result],
+        'crs': 'EPSG:4326',
+        'scale_m': scale,
+        'year': year,
+        'inundation_height_m': inundation_height_m,
+        'nodata': PROJECT_LAYERS_NODATA,
+        'bands': [
+            {
+                'index': index + 1,
+                'band': band['band'],
+                'dataset': band['dataset'],
+                'units': band['units'],
+                'description': band['description']
+            }
+            for index, band in enumerate(bands)
+        ],
+        'values': values
+    }
+    with open(folder + '/project_layers_bands.json', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    return result
 
 def get_area(aoi):
     """
     Gets total area of aoi in hectares using GEOMETRY ONLY calculation
     """
-    return aoi.geometry().area(1).getInfo() / 10000
\ No newline at end of file
+    return Baseline.aoi_area_m2(aoi) / 10000
\ No newline at end of file
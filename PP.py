@@ -1,20 +1,164 @@
-import geemap
 import ee
+import Cache
+import Baseline
+import Context
 
-def protected_planet_hectares(aoi):
-    pp_dataset = ee.FeatureCollection("WCMC/WDPA/current/polygons")
+WDPA_ID = "WCMC/WDPA/current/polygons"
+
+# Resolution the protected areas are painted at for the raster method, in meters.
+PROTECTED_SCALE = 30
+
+# WDPA IUCN_CAT and STATUS values, strictest first. Anything else is counted as 'Other'.
+IUCN_CATEGORIES = ['Ia', 'Ib', 'II', 'III', 'IV', 'V', 'VI', 'Not Reported', 'Not Applicable', 'Not Assigned']
+STATUSES = ['Designated', 'Inscribed', 'Adopted', 'Established', 'Proposed', 'Not Reported']
+
+# Code for values not in the lists above. Pixel codes are iucn code * 100 + status code (codes start at 1).
+OTHER_CODE = 99
+
+def protected_planet_hectares_ee(aoi):
+    '''
+    Returns the area of the aoi inside WDPA protected areas in hectares, as an ee.Number - nothing is fetched here.
+    This is the exact (vector) method - slow, and can run out of memory where protected areas are dense.
+    '''
+    pp_dataset = ee.FeatureCollection(WDPA_ID)
+    region = Context.get_aoi(aoi)
 
     intersection = (
         pp_dataset
-        .filterBounds(aoi)
+        .filterBounds(region)
         .geometry()
-        .intersection(aoi.geometry(), ee.ErrorMargin(1))
+        .intersection(region.geometry(), ee.ErrorMargin(1))
     )
 
     area_ha = intersection.area().divide(10000)
 
-    return area_ha.getInfo()
+    return area_ha
+
+def protected_planet_key(aoi):
+    # WDPA changes monthly - Cache.DATASET_TTL gives this dataset a shorter life than the rest.
+    return Cache.make_key(aoi, WDPA_ID, None, None, None, 'intersection(ErrorMargin(1))')
+
+def get_protected_planet_image(aoi):
+    '''
+    Paints the WDPA polygons touching the aoi into an image (band 'pp_code', masked outside protected areas).
+    Each pixel holds iucn code * 100 + status code (see IUCN_CATEGORIES and STATUSES).
+    Where protected areas overlap, the strictest category wins. Built once per context.
+    '''
+    def builder():
+        iucn_codes = ee.Dictionary({category: index + 1 for index, category in enumerate(IUCN_CATEGORIES)})
+        status_codes = ee.Dictionary({status: index + 1 for index, status in enumerate(STATUSES)})
+
+        def add_code(feature):
+            iucn = ee.Number(iucn_codes.get(feature.get('IUCN_CAT'), OTHER_CODE))
+            status = ee.Number(status_codes.get(feature.get('STATUS'), OTHER_CODE))
+            return feature.set('pp_code', iucn.multiply(100).add(status))
+
+        # Painted in order, so the strictest (lowest) codes go last and end up on top
+        protected_areas = ee.FeatureCollection(WDPA_ID).filterBounds(Context.get_aoi(aoi)).map(add_code).sort('pp_code', False)
+
+        return ee.Image().int().paint(protected_areas, 'pp_code').rename('pp_code')
+
+    return Context.build(aoi, 'protected_planet', builder)
+
+def protected_planet_areas_ee(aoi, tile_scale=1, scale=None):
+    '''
+    Raster method: protected area per IUCN category and status from ONE grouped reduction - nothing is fetched here.
+    Returns an ee.Dictionary with the 'groups' ({'pp_code': ..., 'sum': hectares}) and the aoi 'area_m2'.
+    Use parse_protected_planet_areas on the fetched result.
+    '''
+    area = Context.pixel_area_ha(aoi).addBands(get_protected_planet_image(aoi)).reduceRegion(
+        reducer=ee.Reducer.sum().group(groupField=1, groupName='pp_code'),
+        geometry=Context.get_aoi(aoi),
+        scale=scale or PROTECTED_SCALE,
+        maxPixels=1e13,
+        tileScale=tile_scale
+    )
+
+    return ee.Dictionary({
+        'groups': area.get('groups'),
+        'area_m2': Context.area_m2_ee(aoi)
+    })
+
+def code_names(code):
+    '''
+    Splits a pixel code of get_protected_planet_image into its (IUCN category, status) names.
+    '''
+    iucn = code // 100
+    status = code % 100
+    iucn_name = IUCN_CATEGORIES[iucn - 1] if 1 <= iucn <= len(IUCN_CATEGORIES) else 'Other'
+    status_name = STATUSES[status - 1] if 1 <= status <= len(STATUSES) else 'Other'
+    return iucn_name, status_name
+
+def parse_protected_planet_areas(area_info):
+    '''
+    Turns the fetched result of protected_planet_areas_ee into a dictionary with the total 'hectares' and 'percent',
+    and the same broken down 'by_iucn_category' and 'by_status' (name -> {'hectares', 'percent'}).
+    '''
+    aoi_hectares = area_info['area_m2'] / 10000
+
+    total = 0.0
+    by_iucn_category = {name: 0.0 for name in IUCN_CATEGORIES + ['Other']}
+    by_status = {name: 0.0 for name in STATUSES + ['Other']}
+    for group in area_info['groups']:
+        iucn_name, status_name = code_names(int(group['pp_code']))
+        total += group['sum']
+        by_iucn_category[iucn_name] += group['sum']
+        by_status[status_name] += group['sum']
+
+    def with_percent(hectares):
+        return {name: {'hectares': value, 'percent': (value / aoi_hectares) * 100} for name, value in hectares.items()}
+
+    return {
+        'hectares': total,
+        'percent': (total / aoi_hectares) * 100,
+        'by_iucn_category': with_percent(by_iucn_category),
+        'by_status': with_percent(by_status)
+    }
+
+def parse_protected_planet_info(pp_info, area_m2):
+    '''
+    Same as parse_protected_planet_areas, for a fetched result of either method. The vector method has no breakdown.
+    '''
+    if isinstance(pp_info, dict):
+        return parse_protected_planet_areas(pp_info)
+
+    return {
+        'hectares': pp_info,
+        'percent': (pp_info / (area_m2 / 10000)) * 100,
+        'by_iucn_category': None,
+        'by_status': None
+    }
+
+def protected_planet_areas_key(aoi, scale=None):
+    return Cache.make_key(aoi, WDPA_ID, None, 'IUCN_CAT,STATUS', scale or PROTECTED_SCALE, 'paint.sum.group(pp_code)')
+
+def protected_planet_request(aoi, method='raster', scale=None):
+    '''
+    (cache key, ee object) for protected_planet_areas - method='raster' (default) or 'vector'.
+    scale overrides PROTECTED_SCALE for the raster method. The vector method has no scale, so it ignores it.
+    '''
+    if method == 'raster':
+        return protected_planet_areas_key(aoi, scale), protected_planet_areas_ee(aoi, scale=scale)
+    elif method == 'vector':
+        return protected_planet_key(aoi), protected_planet_hectares_ee(aoi)
+    else:
+        raise ValueError("method must be 'raster' or 'vector'")
+
+def protected_planet_areas(aoi, method='raster', preview=False):
+    '''
+    Hectares and percent of the aoi inside WDPA protected areas, in one round trip (see parse_protected_planet_areas).
+    method='raster' paints the protected areas at PROTECTED_SCALE and breaks the total down by IUCN category and status.
+    method='vector' is the exact polygon intersection - no breakdown, much slower.
+    preview=True paints at Baseline.PREVIEW_SCALE instead (raster method only).
+    '''
+    key, ee_object = protected_planet_request(aoi, method, Baseline.preview_scale(preview))
+    pp_info = Cache.fetch(key, ee_object)
+    if method == 'raster':
+        return parse_protected_planet_areas(pp_info)
+    return parse_protected_planet_info(pp_info, Baseline.aoi_area_m2(aoi))
+
+def protected_planet_hectares(aoi, method='raster', preview=False):
+    return protected_planet_areas(aoi, method, preview)['hectares']
 
-def protected_planet_percent(aoi):
-    pp_hectares = protected_planet_hectares(aoi)
-    return (pp_hectares / (aoi.geometry().area(1).getInfo()/10000))*100
\ No newline at end of file
+def protected_planet_percent(aoi, method='raster', preview=False):
+    return protected_planet_areas(aoi, method, preview)['percent']
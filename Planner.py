@@ -0,0 +1,172 @@
+import ee
+import math
+import Cache, Export, Workers, Context
+
+# Plans how each reduction of the report runs, from how many pixels it will touch (aoi area / scale^2):
+# - small ones run as they always have,
+# - bigger ones get a higher tileScale (earth engine works in smaller tiles, using less memory at a time),
+# - ones too big even for the highest tileScale are split into parts, each reduced as its own request (side by side) and summed.
+
+# Settings - change these with configure().
+settings = {
+    # Pixels one reduction can comfortably handle at tileScale 1. Every doubling of tileScale handles twice as many.
+    'pixels_per_tile_scale': 2.5e8,
+    # Highest tileScale earth engine allows.
+    'max_tile_scale': 16
+}
+
+def configure(pixels_per_tile_scale=None, max_tile_scale=None):
+    '''
+    Changes planner settings.
+    '''
+    if pixels_per_tile_scale is not None:
+        settings['pixels_per_tile_scale'] = pixels_per_tile_scale
+    if max_tile_scale is not None:
+        settings['max_tile_scale'] = max_tile_scale
+
+def plan_reduction(area_m2, scale, bands=1):
+    '''
+    Plans one reduction of `bands` bands at scale (meters) over an aoi of area_m2.
+    Output: a dictionary with the 'scale', 'bands', 'estimated_pixels', and the 'tile_scale' and number of 'parts' to use.
+    '''
+    pixels = (area_m2 / (scale ** 2)) * bands
+    capacity = settings['pixels_per_tile_scale']
+
+    # Smallest power of two that fits, up to max_tile_scale
+    tile_scale = 1
+    while tile_scale < settings['max_tile_scale'] and pixels > capacity * tile_scale:
+        tile_scale = min(settings['max_tile_scale'], tile_scale * 2)
+
+    parts = max(1, math.ceil(pixels / (capacity * tile_scale)))
+
+    return {
+        'scale': scale,
+        'bands': bands,
+        'estimated_pixels': pixels,
+        'tile_scale': tile_scale,
+        'parts': parts
+    }
+
+def split_aoi(aoi, parts):
+    '''
+    Cuts the aoi into at least `parts` pieces along a grid over its bounding box - each piece is a FeatureCollection,
+    so it goes into the same functions as the whole aoi. Pieces don't overlap, so summing their results gives the whole.
+    '''
+    xmin, ymin, xmax, ymax = Export.get_bounds(aoi)
+    columns = math.ceil(math.sqrt(parts))
+    rows = math.ceil(parts / columns)
+    width = (xmax - xmin) / columns
+    height = (ymax - ymin) / rows
+
+    geometry = Context.get_aoi(aoi).geometry()
+    pieces = []
+    for row in range(rows):
+        for col in range(columns):
+            cell = ee.Geometry.Rectangle([xmin + col * width, ymin + row * height, xmin + (col + 1) * width, ymin + (row + 1) * height],
+                                         'EPSG:4326', False)
+            pieces.append(ee.FeatureCollection([ee.Feature(geometry.intersection(cell, ee.ErrorMargin(1)))]))
+    return pieces
+
+def plan_requests(aoi, reductions, area_m2):
+    '''
+    Plans every reduction (name -> {'key', 'build', 'scale', 'bands', 'merge'}, see Main_script.get_report_reductions).
+    Output: (requests, split_requests, plans)
+    - requests: name -> (cache key, ee object) for reductions that fit in one request, with their tileScale,
+    - split_requests: name -> list of (cache key, ee object), one per part, for the ones that don't (see fetch_split),
+    - plans: name -> the plan from plan_reduction - the effective settings, to keep with the results.
+    '''
+    requests = {}
+    split_requests = {}
+    plans = {}
+    pieces = {}
+
+    for name, reduction in reductions.items():
+        plan = plan_reduction(area_m2, reduction['scale'], reduction.get('bands', 1))
+        plans[name] = plan
+
+        if plan['parts'] == 1:
+            requests[name] = (reduction['key'], reduction['build'](aoi, plan['tile_scale']))
+            continue
+
+        # Reductions needing the same number of parts share the same pieces
+        if plan['parts'] not in pieces:
+            pieces[plan['parts']] = split_aoi(aoi, plan['parts'])
+
+        # Each part also brings back its own area, for merges that need weights.
+        parts = pieces[plan['parts']]
+        split_requests[name] = [
+            (reduction['key'] + '|part ' + str(index + 1) + ' of ' + str(len(parts)),
+             ee.Dictionary({'value': reduction['build'](part, plan['tile_scale']), 'area_m2': part.geometry().area(1)}))
+            for index, part in enumerate(parts)
+        ]
+        plan['parts'] = len(parts)
+
+    return requests, split_requests, plans
+
+def fetch_split(split_requests, reductions, max_workers=Workers.DEFAULT_MAX_WORKERS):
+    '''
+    Fetches every part of every split reduction, max_workers at a time, and merges each reduction's parts back together
+    with its 'merge' function (merge_sums when it has none).
+    Output: name -> merged result, in the same shape as the unsplit reduction would have given.
+    '''
+    tasks = {}
+    for name, parts in split_requests.items():
+        for index, (key, ee_object) in enumerate(parts):
+            tasks[(name, index)] = lambda key=key, ee_object=ee_object: Cache.fetch(key, ee_object)
+
+    results, errors = Workers.run_tasks(tasks, max_workers)
+    if errors:
+        raise RuntimeError('Reduction parts failed: ' + '; '.join(name + ' part ' + str(index + 1) + ' - ' + str(error)
+                                                                 for (name, index), error in errors.items()))
+
+    merged = {}
+    for name, parts in split_requests.items():
+        part_results = [results[(name, index)] for index in range(len(parts))]
+        merge = reductions[name].get('merge', merge_sums)
+        merged[name] = merge([result['value'] for result in part_results], [result['area_m2'] for result in part_results])
+    return merged
+
+def merge_sums(values, areas=None):
+    '''
+    Adds up the results of several parts: numbers are summed, dictionaries key by key,
+    and lists of groups ({<group name>: ..., 'sum': ...}, from Reducer.sum().group()) group by group.
+    Missing results (None - a part with no pixels) count as nothing.
+    '''
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+
+    if all(isinstance(value, (int, float)) for value in values):
+        return sum(values)
+
+    if all(isinstance(value, dict) for value in values):
+        keys = []
+        for value in values:
+            keys.extend(key for key in value if key not in keys)
+        return {key: merge_sums([value.get(key) for value in values]) for key in keys}
+
+    if all(isinstance(value, list) for value in values):
+        totals = {}
+        group_name = None
+        for value in values:
+            for group in value:
+                group_name = [key for key in group if key != 'sum'][0]
+                totals[group[group_name]] = totals.get(group[group_name], 0.0) + group['sum']
+        return [{group_name: group, 'sum': total} for group, total in sorted(totals.items())]
+
+    raise ValueError("Can't add up part results of different types")
+
+def merge_elevation_stats(values, areas):
+    '''
+    Merges SLR.get_elevation_data_ee results of several parts: lowest min, highest max, and the mean weighted by part area.
+    '''
+    parts = [(value, area) for value, area in zip(values, areas) if value is not None and value.get('DEM_mean') is not None]
+    if not parts:
+        return {'DEM_mean': None, 'DEM_min': None, 'DEM_max': None}
+
+    total_area = sum(area for value, area in parts)
+    return {
+        'DEM_mean': sum(value['DEM_mean'] * area for value, area in parts) / total_area,
+        'DEM_min': min(value['DEM_min'] for value, area in parts),
+        'DEM_max': max(value['DEM_max'] for value, area in parts)
+    }
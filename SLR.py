@@ -1,77 +1,179 @@
-import geemap
 import ee
+import math
+from bisect import bisect_right
+import Cache, Export, Baseline, Context
 
 ##############NASA SLR##################
-def get_nasa_slr(aoi, year, scenario):
+def get_slr_image_id(year, scenario):
     '''
-
-    Returns SLR at cite in METERS
+    Returns the IPCC AR6 image id for a scenario ("SSP5-8.5" or "SSP3-7.0") and year.
     '''
 
-    # Default dataset initialization - will throw error if it stays this way due to invalid inputs.
-    dataset = None
-
     # Get year as a string
     year_string = str(year)
 
     # get dataset
     if scenario.lower() == "ssp5-8.5":
-        dataset = ee.Image('IPCC/AR6/SLP/ssp585_' + year_string).select('total_values_quantile_0_5')
+        return 'IPCC/AR6/SLP/ssp585_' + year_string
     elif scenario.lower() == "ssp3-7.0":
-        dataset = ee.Image('IPCC/AR6/SLP/ssp370_' + year_string).select('total_values_quantile_0_5')
+        return 'IPCC/AR6/SLP/ssp370_' + year_string
     else:
         raise ValueError("Inputs must either be SSP5-8.5 or SSP3-7.0")
 
+def get_nasa_slr_ee(aoi, year, scenario):
+    '''
+
+    Returns SLR at cite in METERS, as an ee.Number - nothing is fetched here.
+    '''
+
+    # Will throw error due to invalid inputs.
+    dataset = ee.Image(get_slr_image_id(year, scenario)).select('total_values_quantile_0_5')
+
     # Reduce region to nearest pixel and extracts value from said pixel
     value_mm = dataset.reduceRegion(
         reducer=ee.Reducer.first(),
-        geometry=aoi,
+        geometry=Context.get_aoi(aoi),
         scale=25000,
         maxPixels=1e13
-    ).getInfo()['total_values_quantile_0_5']
+    ).get('total_values_quantile_0_5')
 
     # Return METERS value
-    return value_mm / 1000
+    return ee.Number(value_mm).divide(1000)
 
-def get_slr_dictionary(aoi, start_year):
+def nasa_slr_key(aoi, year, scenario):
+    return Cache.make_key(aoi, get_slr_image_id(year, scenario), year, 'total_values_quantile_0_5', 25000, 'first')
+
+def get_nasa_slr(aoi, year, scenario):
     '''
-    according to AOI and project start year, returns SLR data in a dictionary with 2 keys: SSP3-7.0 and SSP5-8.5.
-    The values of these keys are also dictionaries, with keys referring to the year and values referring to the SLR at that time and scenario
-    return this dictionary of dictionaries.
 
+    Returns SLR at cite in METERS
     '''
+    return Cache.fetch(nasa_slr_key(aoi, year, scenario), get_nasa_slr_ee(aoi, year, scenario))
 
+def get_decade_years(start_year):
+    '''
+    Returns the decades get_slr_dictionary reports on: the first decade after start_year, and every decade for a century after that.
+    '''
     first_year = ((start_year // 10) + 1) * 10  # First decade after start year
     last_year = first_year + 100  # century later
-    decade_years = list(range(first_year, last_year + 1, 10))
+    return list(range(first_year, last_year + 1, 10))
+
+# Scenario names as used in the report -> prefix of the IPCC AR6 image ids
+SLR_SCENARIOS = {
+    "SSP3-7.0": "ssp370",
+    "SSP5-8.5": "ssp585"
+}
+
+# Quantile bands pulled from every IPCC AR6 image. 'median' is what the report has always used,
+# 'low' and 'high' are the likely range (17th to 83rd percentile) around it.
+SLR_QUANTILES = {
+    'low': 'total_values_quantile_0_17',
+    'median': 'total_values_quantile_0_5',
+    'high': 'total_values_quantile_0_83'
+}
+
+def get_slr_image(start_year, quantiles=None):
+    '''
+    Stacks every scenario, decade and quantile band of IPCC AR6 sea level projections into one multiband image.
+    Bands are named scenario_year_quantile, for example ssp370_2030_median.
+    '''
+    if quantiles is None:
+        quantiles = SLR_QUANTILES
 
-    slr_dict = {}
+    bands = []
+    for prefix in SLR_SCENARIOS.values():
+        for year in get_decade_years(start_year):
+            image = ee.Image('IPCC/AR6/SLP/' + prefix + '_' + str(year))
+            names = [prefix + '_' + str(year) + '_' + name for name in quantiles.keys()]
+            bands.append(image.select(list(quantiles.values()), names))
+
+    return ee.Image.cat(bands)
+
+def get_slr_quantiles_ee(aoi, start_year, quantiles=None):
+    '''
+    Reduces the whole stacked SLR image (see get_slr_image) in ONE reduceRegion - nothing is fetched here.
+    Returns an ee.Dictionary of band name -> SLR in MILLIMETERS. Use parse_slr_quantiles on the fetched result.
+    '''
+    return get_slr_image(start_year, quantiles).reduceRegion(
+        reducer=ee.Reducer.first(),
+        geometry=Context.get_aoi(aoi),
+        scale=25000,
+        maxPixels=1e13
+    )
 
-    for scenario in ["SSP3-7.0", "SSP5-8.5"]:
+def parse_slr_quantiles(values_mm, start_year, quantiles=None):
+    '''
+    Turns the fetched result of get_slr_quantiles_ee into a dictionary of dictionaries:
+    scenario -> year -> quantile name -> SLR in METERS
+    '''
+    if quantiles is None:
+        quantiles = SLR_QUANTILES
+
+    slr_dict = {}
+    for scenario, prefix in SLR_SCENARIOS.items():
         scenario_dict = {}
-        for year in decade_years:
-            slr_value = get_nasa_slr(aoi, year, scenario)
-            scenario_dict[year] = slr_value
+        for year in get_decade_years(start_year):
+            scenario_dict[year] = {
+                name: values_mm[prefix + '_' + str(year) + '_' + name] / 1000 for name in quantiles.keys()
+            }
         slr_dict[scenario] = scenario_dict
 
-    return (slr_dict)
+    return slr_dict
+
+def slr_quantiles_key(aoi, start_year, quantiles=None):
+    if quantiles is None:
+        quantiles = SLR_QUANTILES
+    return Cache.make_key(aoi, 'IPCC/AR6/SLP', start_year, sorted(quantiles.items()), 25000, 'first')
+
+def get_slr_quantiles(aoi, start_year, quantiles=None):
+    '''
+    Same layout as get_slr_dictionary, but every year holds a dictionary of quantiles ('low', 'median', 'high') in METERS.
+    Every scenario, decade and quantile comes back from a single getInfo() call.
+    '''
+    values_mm = Cache.fetch(slr_quantiles_key(aoi, start_year, quantiles), get_slr_quantiles_ee(aoi, start_year, quantiles))
+    return parse_slr_quantiles(values_mm, start_year, quantiles)
+
+def median_slr_dictionary(slr_quantiles):
+    '''
+    Takes the output of get_slr_quantiles and keeps only the median - this is the get_slr_dictionary layout.
+    '''
+    return {
+        scenario: {year: values['median'] for year, values in scenario_dict.items()}
+        for scenario, scenario_dict in slr_quantiles.items()
+    }
+
+def get_slr_dictionary(aoi, start_year):
+    '''
+    according to AOI and project start year, returns SLR data in a dictionary with 2 keys: SSP3-7.0 and SSP5-8.5.
+    The values of these keys are also dictionaries, with keys referring to the year and values referring to the SLR at that time and scenario
+    return this dictionary of dictionaries.
+
+    All 22 values come from one reduction of the stacked SLR image - see get_slr_quantiles for the uncertainty bounds too.
+    '''
+
+    return median_slr_dictionary(get_slr_quantiles(aoi, start_year))
 
 #############COPERNICUS#############
 
 def get_elevation_map(aoi):
     '''
-    Takes in AOI, returns DEM masked to aoi.
+    Takes in AOI, returns DEM masked to aoi. Built once per context.
     '''
-    copernicus_dataset = ee.ImageCollection("COPERNICUS/DEM/GLO30")
-    DEM = copernicus_dataset.select('DEM')
-    DEM_local = DEM.median().toFloat().clip(aoi)
+    def builder():
+        region = Context.get_aoi(aoi)
+        # Only the GLO-30 tiles touching the aoi - they only meet at their edges, so a mosaic gives the same DEM the old median()
+        # over the whole collection did, without earth engine looking at every tile on earth.
+        copernicus_dataset = ee.ImageCollection("COPERNICUS/DEM/GLO30").filterBounds(region)
+        DEM = copernicus_dataset.select('DEM')
+        return DEM.mosaic().toFloat().clip(region)
 
     # returns ee.Image of area of interest with DEM data inside.
-    return DEM_local
+    return Context.build(aoi, 'dem', builder)
 
-def get_elevation_data(aoi):
+def get_elevation_data_ee(aoi, tile_scale=1, scale=None):
     '''
-    Takes in AOI as input, returns a dictionary with keys "mean", "min", and "max"
+    Takes in AOI as input, returns an ee.Dictionary with keys "DEM_mean", "DEM_min", and "DEM_max" - nothing is fetched here.
+    scale overrides the native 30 m (e.g. Baseline.PREVIEW_SCALE).
     '''
 
     # get DEM clipped to aoi
@@ -82,35 +184,51 @@ def get_elevation_data(aoi):
         reducer=ee.Reducer.mean()
         .combine(ee.Reducer.min(), sharedInputs=True)
         .combine(ee.Reducer.max(), sharedInputs=True),
-        geometry=aoi,
-        scale=30,  # native resolution for GLO-30
-        maxPixels=1e13
+        geometry=Context.get_aoi(aoi),
+        scale=scale or 30,  # native resolution for GLO-30
+        maxPixels=1e13,
+        tileScale=tile_scale
     )
 
-    # GetInfo to bring values to Python
-    stats_dict = stats.getInfo()
+    return stats
 
-    # Return only mean, min, max
+def parse_elevation_data(stats_dict):
+    '''
+    Turns the fetched result of get_elevation_data_ee into a dictionary with keys "mean", "min", and "max"
+    '''
     return {
         'mean': stats_dict.get('DEM_mean'),
         'min': stats_dict.get('DEM_min'),
         'max': stats_dict.get('DEM_max')
     }
 
+def elevation_data_key(aoi, scale=None):
+    return Cache.make_key(aoi, 'COPERNICUS/DEM/GLO30', None, 'DEM', scale or 30, 'mean,min,max')
+
+def get_elevation_data(aoi, preview=False):
+    '''
+    Takes in AOI as input, returns a dictionary with keys "mean", "min", and "max"
+    preview=True gives a quick estimate at Baseline.PREVIEW_SCALE.
+    '''
+    scale = Baseline.preview_scale(preview)
+
+    # GetInfo to bring values to Python
+    return parse_elevation_data(Cache.fetch(elevation_data_key(aoi, scale), get_elevation_data_ee(aoi, scale=scale)))
+
 def export_dem_geotiff(aoi, folder_name):
     '''
     Exports a GeoTIFF of elevation
-    File will be named submergence.tif
+    File will be named DEM.tif
     '''
 
     dem_image = get_elevation_map(aoi)
 
-    geemap.ee_export_image(
+    # Large aoi's are downloaded in tiles, so this stays at full 30m resolution.
+    Export.export_image(
         dem_image,
         filename=folder_name + "/DEM.tif",
-        # FOR USERS: change line below to either 30, 50, or 100 if download fails. Bigger number = easier download.
-        scale=30,
-        region=aoi.geometry()
+        aoi=aoi,
+        scale=30
     )
 
 ##############SUBMERGED#############
@@ -122,52 +240,298 @@ def calculate_inundation_height(sedimentation, SLR):
     '''
     return (SLR - sedimentation)
 
-def area_inundated_hectares(aoi, inundation_height_m):
+def total_area_hectares_ee(aoi, tile_scale=1, scale=None):
     '''
-    Returns area in hectares of area of interest where elevation < inundation height
+    Returns the pixel-based area of the aoi in hectares (the denominator of area_inundated_percent) as an ee.Number.
+    Same object as the other 30 m denominators of the context (see Context.pixel_hectares_ee).
+    '''
+    return Context.pixel_hectares_ee(aoi, scale or 30, tile_scale)
 
-    Inputs: aoi (ee.image.Image or imageCollection), inundation_height_m
-    Output: percent of area inundated, as a float
+# Width of each elevation bin in the elevation histogram, in meters. Inundation lookups are exact to within one bin.
+ELEVATION_BIN_M = 0.01
+
+# Range of elevations the elevation histogram bins to the centimeter, in meters. Elevations outside it are clamped into one
+# overflow bin at each end - without that, a hilly aoi (0-300 m) would come back as ~30,000 one-centimeter groups, bloating
+# the request, earth engine's memory, the cache and checkpoints.
+# Heights outside the range are still answered whenever the overflow bin on that side is empty (see check_histogram_heights) -
+# only a height past the range on a side that has land beyond it can't be looked up.
+HISTOGRAM_MIN_HEIGHT_M = -5.0
+HISTOGRAM_MAX_HEIGHT_M = 20.0
+
+def histogram_bin_range(bin_size=ELEVATION_BIN_M):
+    '''
+    (lowest bin, highest bin) of the elevation histogram. The highest bin holds everything above HISTOGRAM_MAX_HEIGHT_M,
+    the lowest everything at or below HISTOGRAM_MIN_HEIGHT_M.
     '''
+    return int(round(HISTOGRAM_MIN_HEIGHT_M / bin_size)), int(round(HISTOGRAM_MAX_HEIGHT_M / bin_size)) + 1
 
-    # get DEM
-    dem_image = get_elevation_map(aoi)
+def elevation_bins_ee(dem_image, bin_size=ELEVATION_BIN_M):
+    '''
+    Numbers each DEM pixel by its elevation bin: bin k holds elevations above (k-1)*bin_size, up to and including k*bin_size.
+    So bin k is inundated, all of it, by any height of at least k*bin_size - the histogram never counts a pixel above the
+    inundation height (the old dem.lte(height) mask), and is exact whenever the height is a whole number of bins.
+    '''
+    lowest, highest = histogram_bin_range(bin_size)
+    return dem_image.divide(bin_size).ceil().max(lowest).min(highest).int().rename('bin')
 
-    # Make a mask where 1 = inundated (dem.lte = less than or equal to)
-    inundated = dem_image.lte(inundation_height_m)
+def elevation_bins_array(elevation, bin_size=ELEVATION_BIN_M):
+    '''
+    elevation_bins_ee for a numpy array of elevations (see LocalBackend.py).
+    '''
+    import numpy as np
 
-    # Calculate pixel area in hectares
-    pixel_area_ha = ee.Image.pixelArea().divide(10000)
+    lowest, highest = histogram_bin_range(bin_size)
+    return np.clip(np.ceil(np.asarray(elevation, dtype=np.float64) / bin_size), lowest, highest).astype(np.int64)
 
-    #
-    area_img_year = pixel_area_ha.updateMask(inundated)
+def elevation_histogram_reducer(bin_size=ELEVATION_BIN_M):
+    # Goes into the cache keys - results binned the old way (floor, no clamping) are never picked up.
+    return 'sum.group(bin=' + str(bin_size) + ', ceil, ' + str(HISTOGRAM_MIN_HEIGHT_M) + '..' + str(HISTOGRAM_MAX_HEIGHT_M) + ')'
 
-    # Area of inundated pixels:
-    inundated_area = area_img_year.reduceRegion(
-        reducer=ee.Reducer.sum(),
-        geometry=aoi,
-        scale=30,
-        maxPixels=1e13
+def get_elevation_histogram_ee(aoi, bin_size=ELEVATION_BIN_M, tile_scale=1, scale=None):
+    '''
+    Area-by-elevation histogram of the DEM over the aoi, as an ee.Dictionary - nothing is fetched here.
+    'groups' holds hectares per elevation bin (see elevation_bins_ee), 'total' holds the pixel-based area of the aoi.
+    Use parse_elevation_histogram on the fetched result.
+    '''
+
+    # get DEM and number each pixel by its elevation bin
+    elevation_bins = elevation_bins_ee(get_elevation_map(aoi), bin_size)
+
+    # Sum pixel area per elevation bin - one pass over the DEM.
+    histogram = Context.pixel_area_ha(aoi).addBands(elevation_bins).reduceRegion(
+        reducer=ee.Reducer.sum().group(groupField=1, groupName='bin'),
+        geometry=Context.get_aoi(aoi),
+        scale=scale or 30,
+        maxPixels=1e13,
+        tileScale=tile_scale
     )
 
-    return inundated_area.getInfo().get('area')
+    return ee.Dictionary({
+        'groups': histogram.get('groups'),
+        'total': total_area_hectares_ee(aoi, tile_scale, scale)
+    })
 
-def area_inundated_percent(aoi, inundation_height_m):
+def parse_elevation_histogram(histogram_info, bin_size=ELEVATION_BIN_M):
     '''
-    takes in area of interest and inundation/submergence height and calculates percent of area below this height.
+    Turns the fetched result of get_elevation_histogram_ee into a cumulative (hypsometric) curve:
+    a dictionary with the sorted elevation 'bins', the 'cumulative_hectares' at or below each bin, the 'bin_size', the 'total_hectares'
+    and the hectares in the two overflow bins ('below_range_hectares' at or below HISTOGRAM_MIN_HEIGHT_M, 'above_range_hectares'
+    above HISTOGRAM_MAX_HEIGHT_M).
     '''
-    hectares = area_inundated_hectares(aoi, inundation_height_m)
+    groups = sorted((int(group['bin']), group['sum']) for group in histogram_info['groups'])
+    lowest_bin, highest_bin = histogram_bin_range(bin_size)
+    sums = dict(groups)
+
+    bins = []
+    cumulative_hectares = []
+    running_total = 0
+    for elevation_bin, hectares in groups:
+        running_total += hectares
+        bins.append(elevation_bin)
+        cumulative_hectares.append(running_total)
 
-    pixel_area_ha = ee.Image.pixelArea().divide(10000)
-    total_area = pixel_area_ha.reduceRegion(
-        reducer=ee.Reducer.sum(),
-        geometry=aoi,
-        scale=30,
-        maxPixels=1e13
-    ).get('area')
+    return {
+        'bin_size': bin_size,
+        'bins': bins,
+        'cumulative_hectares': cumulative_hectares,
+        'total_hectares': histogram_info['total'],
+        'below_range_hectares': sums.get(lowest_bin, 0),
+        'above_range_hectares': sums.get(highest_bin, 0)
+    }
+
+def elevation_histogram_key(aoi, bin_size=ELEVATION_BIN_M, scale=None):
+    return Cache.make_key(aoi, 'COPERNICUS/DEM/GLO30', None, 'DEM', scale or 30, elevation_histogram_reducer(bin_size))
+
+def get_elevation_histogram(aoi, bin_size=ELEVATION_BIN_M, scale=None):
+    '''
+    Returns the hypsometric curve of the aoi (see parse_elevation_histogram). Fetched once per aoi (and scale), then cached.
+    '''
+    histogram_info = Cache.fetch(elevation_histogram_key(aoi, bin_size, scale), get_elevation_histogram_ee(aoi, bin_size, scale=scale))
+    return parse_elevation_histogram(histogram_info, bin_size)
+
+def inundated_hectares_from_histogram(histogram, inundation_height_m):
+    '''
+    Looks up the area (hectares) at or below inundation_height_m in a curve from get_elevation_histogram. No earth engine calls.
+    Pixels less than one bin below the height (in the bin it falls inside) aren't counted - the area is exact when the height
+    is a whole number of bins, and at most one bin's worth of elevation short otherwise.
+    Heights outside HISTOGRAM_MIN_HEIGHT_M..HISTOGRAM_MAX_HEIGHT_M are answered from the overflow bins when they can be,
+    and raise ValueError when they can't (see check_histogram_heights).
+    '''
+    check_histogram_heights(histogram, [inundation_height_m])
+
+    # Bin k counts as inundated when its top edge is at or below the inundation height.
+    # The tiny nudge keeps floating point from dropping a bin, e.g. 0.29 / 0.01 = 28.999999999999996
+    last_bin = math.floor(inundation_height_m / histogram['bin_size'] + 1e-9)
+    index = bisect_right(histogram['bins'], last_bin)
+    if index == 0:
+        return 0.0
+    return histogram['cumulative_hectares'][index - 1]
+
+def check_histogram_heights(histogram, inundation_heights_m):
+    '''
+    Raises ValueError if any of the heights can't be looked up in the histogram. Below HISTOGRAM_MIN_HEIGHT_M nothing is inundated
+    as long as the low overflow bin is empty, and above HISTOGRAM_MAX_HEIGHT_M everything is as long as the high one is - the
+    normal lookup already gives 0 and the total there. Past the range on a side with land in the overflow bin, the histogram
+    can't tell how much of that land is below the height.
+    '''
+    for height in inundation_heights_m:
+        if height < HISTOGRAM_MIN_HEIGHT_M and histogram['below_range_hectares'] > 0:
+            side, limit, hectares = 'below', HISTOGRAM_MIN_HEIGHT_M, histogram['below_range_hectares']
+        elif height > HISTOGRAM_MAX_HEIGHT_M and histogram['above_range_hectares'] > 0:
+            side, limit, hectares = 'above', HISTOGRAM_MAX_HEIGHT_M, histogram['above_range_hectares']
+        else:
+            continue
+        raise ValueError("Inundation height " + str(height) + " m is " + side + " the elevation histogram's range (" + str(limit) +
+                         " m), and " + str(round(hectares, 2)) + " ha of the aoi is out there too - widen SLR.HISTOGRAM_MIN_HEIGHT_M/"
+                         "HISTOGRAM_MAX_HEIGHT_M")
+
+def area_inundated_hectares(aoi, inundation_height_m, preview=False):
+    '''
+    Returns area in hectares of area of interest where elevation < inundation height
+
+    Inputs: aoi (ee.image.Image or imageCollection), inundation_height_m, preview (True for a quick estimate at Baseline.PREVIEW_SCALE)
+    Output: area inundated in hectares, as a float
+    '''
+    return inundated_hectares_from_histogram(get_elevation_histogram(aoi, scale=Baseline.preview_scale(preview)), inundation_height_m)
+
+def area_inundated_percent(aoi, inundation_height_m, preview=False):
+    '''
+    takes in area of interest and inundation/submergence height and calculates percent of area below this height.
+    '''
+    histogram = get_elevation_histogram(aoi, scale=Baseline.preview_scale(preview))
+    hectares = inundated_hectares_from_histogram(histogram, inundation_height_m)
 
     # return percentage
-    return (hectares / total_area.getInfo()) * 100
+    return (hectares / histogram['total_hectares']) * 100
+
+def sedimentation_sensitivity(aoi, SLR, sedimentation_rates):
+    '''
+    Inundation for a whole list of sedimentation rates (METERS PER HUNDRED YEARS) against one SLR value (METERS).
+    Only the first call for an aoi talks to earth engine - every row after that is a local lookup.
+    Output: a list of dictionaries with keys 'sedimentation', 'height', 'hectares' and 'percent'
+    '''
+    histogram = get_elevation_histogram(aoi)
+
+    rows = []
+    for sedimentation in sedimentation_rates:
+        height = calculate_inundation_height(sedimentation, SLR)
+        hectares = inundated_hectares_from_histogram(histogram, height)
+        rows.append({
+            'sedimentation': sedimentation,
+            'height': height,
+            'hectares': hectares,
+            'percent': (hectares / histogram['total_hectares']) * 100
+        })
+
+    return rows
+
+# Every quantile band of the IPCC AR6 images, for scenario_grid: the very likely (5-95%) and likely (17-83%) ranges and the median.
+GRID_QUANTILES = {
+    'q05': 'total_values_quantile_0_05',
+    'q17': 'total_values_quantile_0_17',
+    'q50': 'total_values_quantile_0_5',
+    'q83': 'total_values_quantile_0_83',
+    'q95': 'total_values_quantile_0_95'
+}
+
+def inundated_hectares_array(histogram, inundation_heights_m):
+    '''
+    inundated_hectares_from_histogram for a whole numpy array of heights at once - same bins, same answers, any shape.
+    Heights outside the histogram's range are handled the same way too: answered from the overflow bins, or ValueError.
+    '''
+    import numpy as np
+
+    heights = np.asarray(inundation_heights_m, dtype=float)
+    check_histogram_heights(histogram, heights[(heights < HISTOGRAM_MIN_HEIGHT_M) | (heights > HISTOGRAM_MAX_HEIGHT_M)])
+    last_bins = np.floor(heights / histogram['bin_size'] + 1e-9)
+    index = np.searchsorted(np.asarray(histogram['bins'], dtype=float), last_bins, side='right')
+
+    # A 0 in front, for heights below the lowest bin
+    cumulative = np.concatenate([[0.0], np.asarray(histogram['cumulative_hectares'], dtype=float)])
+    return cumulative[index]
+
+def scenario_grid(aoi, start_year, sedimentation_rates, quantiles=None, preview=False):
+    '''
+    Inundation for every SSP scenario, decade, SLR quantile and sedimentation rate - the probabilistic version of the report's
+    one median number per scenario.
+    Every decade and quantile of SLR (GRID_QUANTILES by default) and the aoi's elevation histogram come back from ONE request
+    (and are cached) - the whole cube is then worked out locally, with numpy, from that one elevation distribution.
+    Sedimentation rates are in cm/year, like get_csv's. Sediment builds up from the first decade: by year Y the ground has risen
+    rate * (Y - first decade) / 100 meters. So the last decade with the report's sedimentation is exactly the report's inundation.
+    preview=True uses the elevation histogram at Baseline.PREVIEW_SCALE.
+    Output: a dictionary of axes and arrays, every array shaped (scenario, decade, quantile, sedimentation):
+    'scenarios', 'years', 'quantiles', 'sedimentation' (the axes), 'slr_m' (scenario, decade, quantile), 'sediment_m' (decade, sedimentation),
+    'height_m', 'hectares' and 'percent' (the cube), and 'total_hectares'.
+    Raises ValueError when a height in the cube can't be looked up, like inundated_hectares_array.
+    '''
+    import numpy as np
+
+    if quantiles is None:
+        quantiles = GRID_QUANTILES
+    scale = Baseline.preview_scale(preview)
+
+    info = Cache.fetch_many({
+        'slr': (slr_quantiles_key(aoi, start_year, quantiles), get_slr_quantiles_ee(aoi, start_year, quantiles)),
+        'histogram': (elevation_histogram_key(aoi, scale=scale), get_elevation_histogram_ee(aoi, scale=scale))
+    })
+    slr = parse_slr_quantiles(info['slr'], start_year, quantiles)
+    histogram = parse_elevation_histogram(info['histogram'])
+
+    scenarios = list(SLR_SCENARIOS.keys())
+    years = get_decade_years(start_year)
+    names = list(quantiles.keys())
+    rates = np.asarray(sedimentation_rates, dtype=float)
+
+    slr_m = np.array([[[slr[scenario][year][name] for name in names] for year in years] for scenario in scenarios])
+
+    # cm/year * years / 100 = meters
+    sediment_m = np.outer(np.asarray(years, dtype=float) - years[0], rates) / 100
+
+    # (scenario, decade, quantile, 1) - (1, decade, 1, sedimentation)
+    height_m = slr_m[:, :, :, np.newaxis] - sediment_m[np.newaxis, :, np.newaxis, :]
+    hectares = inundated_hectares_array(histogram, height_m)
+
+    return {
+        'scenarios': scenarios,
+        'years': years,
+        'quantiles': names,
+        'sedimentation': rates,
+        'slr_m': slr_m,
+        'sediment_m': sediment_m,
+        'height_m': height_m,
+        'hectares': hectares,
+        'percent': (hectares / histogram['total_hectares']) * 100,
+        'total_hectares': histogram['total_hectares']
+    }
+
+def scenario_grid_rows(grid):
+    '''
+    The cube of scenario_grid flattened into rows (dictionaries with keys 'scenario', 'year', 'quantile', 'sedimentation',
+    'slr_m', 'height_m', 'hectares' and 'percent') - for a csv or a dataframe.
+    '''
+    rows = []
+    for s, scenario in enumerate(grid['scenarios']):
+        for y, year in enumerate(grid['years']):
+            for q, quantile in enumerate(grid['quantiles']):
+                for r, rate in enumerate(grid['sedimentation']):
+                    rows.append({
+                        'scenario': scenario,
+                        'year': year,
+                        'quantile': quantile,
+                        'sedimentation': float(rate),
+                        'slr_m': float(grid['slr_m'][s, y, q]),
+                        'height_m': float(grid['height_m'][s, y, q, r]),
+                        'hectares': float(grid['hectares'][s, y, q, r]),
+                        'percent': float(grid['percent'][s, y, q, r])
+                    })
+    return rows
+
+def get_submergence_image(dem_image, inundation_height_m):
+    '''
+    Masks a DEM (from get_elevation_map) to inundated areas - elevation at or below inundation_height_m.
+    '''
+    inundated = dem_image.lte(inundation_height_m)
+    return dem_image.updateMask(inundated)
 
 def export_submergence_geotiff(aoi, inundation_height_m, folder_name):
     '''
@@ -175,16 +539,13 @@ def export_submergence_geotiff(aoi, inundation_height_m, folder_name):
     File will be named submergence.tif
     '''
 
-    dem_image = get_elevation_map(aoi)
-
-    # Mask DEM to inundated areas, where 1 = inundated
-    inundated = dem_image.lte(inundation_height_m)
-    inundated_dem = dem_image.updateMask(inundated)
+    # Mask DEM to inundated areas
+    inundated_dem = get_submergence_image(get_elevation_map(aoi), inundation_height_m)
 
-    geemap.ee_export_image(
+    # Large aoi's are downloaded in tiles, so this stays at full 30m resolution.
+    Export.export_image(
         inundated_dem,
         filename=folder_name + "/submergence.tif",
-        # FOR USERS: change line below to scale = 50 if the submergence geotiff fails to download.
-        scale=30,
-        region=aoi.geometry()
-    )
\ No newline at end of file
+        aoi=aoi,
+        scale=30
+    )
@@ -0,0 +1,205 @@
+from concurrent.futures import Future
+import hashlib
+import random
+import re
+import threading
+import time
+import Trace
+
+# Settings - change these with configure().
+settings = {
+    # Most earth engine requests running at the same time, across every thread (batch sites, worker pools...).
+    'max_in_flight': 8,
+    # How many times a transient error is retried before giving up.
+    'max_retries': 5,
+    # Backoff before retry n is a random time between 0 and min(max_delay, base_delay * 2**n) seconds.
+    'base_delay': 1.0,
+    'max_delay': 60.0
+}
+
+# HTTP status codes that mean "try again later" (too many requests, and the server side 5xx that go away on their own).
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Phrases of error messages earth engine (or the network under it) gives when trying again later should work.
+# Matched as whole words, never as bits of an asset id, a band name or a number.
+TRANSIENT_ERRORS = [
+    'too many concurrent aggregations',
+    'too many requests',
+    'quota exceeded',
+    'rate limit exceeded',
+    'service unavailable',
+    'internal error',
+    'backend error',
+    'connection reset',
+    'connection aborted'
+]
+
+# Phrases of errors about the request itself - retrying can't fix those, whatever else the message says.
+PERMANENT_ERRORS = [
+    'not found',
+    'does not exist',
+    'invalid',
+    'user memory limit exceeded',
+    'no band named',
+    'did not match any bands',
+    'required argument',
+    'unexpected argument',
+    'permission denied',
+    'computation timed out'
+]
+
+def _phrase_pattern(phrases):
+    return re.compile(r'\b(?:' + '|'.join(re.escape(phrase) for phrase in phrases) + r')\b')
+
+_transient_pattern = _phrase_pattern(TRANSIENT_ERRORS)
+_permanent_pattern = _phrase_pattern(PERMANENT_ERRORS)
+
+# A status code in a message, like "HttpError 429", "<HttpError 503 when requesting ...>" or "HTTP Error 500: ..."
+_status_pattern = re.compile(r'\bhttp ?error:? ?(\d{3})\b|\b(?:status|code)[ :=]+(\d{3})\b')
+
+_semaphore = threading.BoundedSemaphore(settings['max_in_flight'])
+_lock = threading.Lock()
+_local = threading.local()
+
+# Requests being evaluated right now: request key -> Future shared by everyone asking for it.
+_in_flight = {}
+
+def _get_info(ee_object):
+    return ee_object.getInfo()
+
+# What actually evaluates a request. Swap it out with set_backend (e.g. for a simulated flaky backend).
+_backend = _get_info
+
+def set_backend(backend=None):
+    '''
+    Changes what evaluates requests: backend(ee_object) -> result. backend=None goes back to ee_object.getInfo().
+    '''
+    global _backend
+    _backend = backend if backend is not None else _get_info
+
+def configure(max_in_flight=None, max_retries=None, base_delay=None, max_delay=None):
+    '''
+    Changes scheduler settings. Takes effect for requests started after this call.
+    '''
+    global _semaphore
+    if max_in_flight is not None:
+        settings['max_in_flight'] = max_in_flight
+        _semaphore = threading.BoundedSemaphore(max_in_flight)
+    if max_retries is not None:
+        settings['max_retries'] = max_retries
+    if base_delay is not None:
+        settings['base_delay'] = base_delay
+    if max_delay is not None:
+        settings['max_delay'] = max_delay
+
+def status_code(error):
+    '''
+    The HTTP status of error, if it has one: from the exception itself (urllib's HTTPError.code, requests' response,
+    googleapiclient's resp), or else a status written into its message. None otherwise.
+    '''
+    for holder in [error, getattr(error, 'response', None), getattr(error, 'resp', None)]:
+        for name in ['status_code', 'status', 'code']:
+            value = getattr(holder, name, None)
+            if isinstance(value, int) and not isinstance(value, bool) and 100 <= value <= 599:
+                return value
+
+    match = _status_pattern.search(str(error).lower())
+    if match:
+        return int(match.group(1) or match.group(2))
+    return None
+
+def is_transient(error):
+    '''
+    True if error looks like earth engine being busy (worth retrying), rather than something wrong with the request.
+    Errors about the request (PERMANENT_ERRORS) are never retried; otherwise a transient HTTP status, a dropped connection
+    or one of TRANSIENT_ERRORS is.
+    '''
+    message = str(error).lower()
+    if _permanent_pattern.search(message):
+        return False
+
+    code = status_code(error)
+    if code is not None:
+        return code in TRANSIENT_STATUS_CODES
+
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return _transient_pattern.search(message) is not None
+
+def request_key(ee_object):
+    '''
+    Two requests with the same key are the same computation. Serializing happens locally - no earth engine call.
+    '''
+    return hashlib.sha256(ee_object.serialize().encode('utf-8')).hexdigest()
+
+def evaluate(ee_object, label=None):
+    '''
+    Fetches the value of ee_object (what getInfo() does) - every earth engine request should go through here.
+    - at most settings['max_in_flight'] requests run at once,
+    - transient errors are retried with jittered exponential backoff,
+    - if the exact same request is already running, this waits for that one instead of sending it again.
+    label says what is being asked, independent of how the ee object serializes (see Cache.key_label) -
+    the backend can read it with current_label(), e.g. to record or replay responses (see FakeEE.py).
+    '''
+    def run():
+        _local.label = label
+        try:
+            return _backend(ee_object)
+        finally:
+            _local.label = None
+
+    return call(run, request_key(ee_object))
+
+def current_label():
+    '''
+    Label of the request the backend is evaluating on this thread (see evaluate), or None.
+    '''
+    return getattr(_local, 'label', None)
+
+def call(function, key=None):
+    '''
+    Runs function() under the same rules as evaluate - for earth engine work that isn't a getInfo(), like downloads.
+    Calls with the same key that overlap share one run. key=None never shares.
+    '''
+    if key is None:
+        return _call_with_retry(function)
+
+    with _lock:
+        future = _in_flight.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            _in_flight[key] = future
+
+    # Someone else is already fetching this - share their answer (or their error).
+    if not owner:
+        Trace.annotate(shared=True)
+        return future.result()
+
+    try:
+        value = _call_with_retry(function)
+        future.set_result(value)
+        return value
+    except Exception as error:
+        future.set_exception(error)
+        raise
+    finally:
+        with _lock:
+            del _in_flight[key]
+
+def _call_with_retry(function):
+    attempt = 0
+    while True:
+        semaphore = _semaphore
+        with semaphore:
+            try:
+                return function()
+            except Exception as error:
+                if attempt >= settings['max_retries'] or not is_transient(error):
+                    raise
+
+        # Wait outside the semaphore, so other requests can use the slot meanwhile.
+        delay = min(settings['max_delay'], settings['base_delay'] * (2 ** attempt))
+        time.sleep(random.uniform(0, delay))
+        attempt += 1
+        Trace.add_retry()
@@ -0,0 +1,261 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Results store: every get_csv run also appends its numbers here as tidy, typed records - one row per number, with
+# site, metric, dataset, year, scenario, value, unit, scale and run time. output.csv is for people; this is for
+# portfolio tables and dashboards, which can query across every site ever run without parsing csvs or touching earth engine.
+# Reading doesn't need earth engine at all - the metric modules are only imported to turn a report into records.
+
+# Settings - change these with configure().
+settings = {
+    # Where the store lives. None = don't store anything.
+    'path': os.path.join(os.path.expanduser('~'), '.calyx_results', 'results.sqlite')
+}
+
+# Columns of every record, in order.
+RECORD_COLUMNS = ['run_id', 'site', 'metric', 'dataset', 'year', 'scenario', 'value', 'unit', 'scale', 'run_time']
+
+# Columns of every run, in order.
+RUN_COLUMNS = ['run_id', 'site', 'filepath', 'start_year', 'sedimentation', 'run_time', 'prepare', 'tolerance_m', 'min_part_m2']
+
+# Columns added to runs after it was first made -> their type. Stores made before get them on the next connect.
+ADDED_RUN_COLUMNS = {'prepare': 'INTEGER', 'tolerance_m': 'REAL', 'min_part_m2': 'REAL'}
+
+# Columns query can filter on.
+FILTER_COLUMNS = ['site', 'metric', 'dataset', 'year', 'scenario', 'unit', 'run_id']
+
+_lock = threading.Lock()
+
+# Default for configure arguments that weren't given (None turns storing off).
+MISSING = object()
+
+def configure(path=MISSING):
+    '''
+    Changes where the store lives. path=None turns storing off.
+    '''
+    if path is not MISSING:
+        settings['path'] = path
+
+def _connect():
+    folder = os.path.dirname(settings['path'])
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    connection = sqlite3.connect(settings['path'], timeout=30)
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS runs ('
+        'run_id INTEGER PRIMARY KEY AUTOINCREMENT, site TEXT NOT NULL, filepath TEXT, start_year INTEGER, sedimentation REAL, run_time REAL, '
+        'prepare INTEGER, tolerance_m REAL, min_part_m2 REAL)'
+    )
+    existing = [row[1] for row in connection.execute('PRAGMA table_info(runs)')]
+    for column, column_type in ADDED_RUN_COLUMNS.items():
+        if column not in existing:
+            connection.execute('ALTER TABLE runs ADD COLUMN ' + column + ' ' + column_type)
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS records ('
+        'run_id INTEGER NOT NULL, site TEXT NOT NULL, metric TEXT NOT NULL, dataset TEXT, year INTEGER, scenario TEXT, '
+        'value REAL, unit TEXT, scale REAL, run_time REAL)'
+    )
+    # What dashboards filter on: a site's metrics, one metric across sites and years, and the latest run of each site.
+    connection.execute('CREATE INDEX IF NOT EXISTS records_site_metric ON records (site, metric, year)')
+    connection.execute('CREATE INDEX IF NOT EXISTS records_metric_year ON records (metric, year, scenario)')
+    connection.execute('CREATE INDEX IF NOT EXISTS records_run ON records (run_id)')
+    connection.execute('CREATE INDEX IF NOT EXISTS runs_site ON runs (site, run_id)')
+    return connection
+
+def report_records(report, start_year):
+    '''
+    Every number of a report (from Main_script.get_report) as records: dictionaries with the keys of RECORD_COLUMNS,
+    minus run_id, site and run_time (append_report fills those in). Sections that failed (see Main_script.build_report) are left out.
+    '''
+    import Baseline, SLR, PP, Main_script
+
+    eval_year = start_year - 1
+    jaxa_dataset = Baseline.jaxa_dataset(eval_year)
+    failed = report.get('failed', {})
+    plans = report.get('reduction_settings') or {}
+    records = []
+
+    def scale(name, native):
+        # The scale a reduction actually ran at (preview, planner...), if the report knows it
+        return (plans.get(name) or {}).get('scale', native)
+
+    def add(metric, value, unit, dataset=None, year=eval_year, scenario=None, scale=None):
+        records.append({'metric': metric, 'dataset': dataset, 'year': year, 'scenario': scenario, 'value': value, 'unit': unit,
+                        'scale': scale})
+
+    if 'area' not in failed:
+        add('area', report['area'], 'ha', 'geometry', year=None)
+
+    if 'murray' not in failed:
+        murray_scale = scale('murray', 10)
+        add('murray_ten_year_loss', report['murray_hectares']['ten_year_loss'], 'ha', Baseline.MURRAY_ID, scale=murray_scale)
+        add('murray_ten_year_loss', report['murray_percent']['ten_year_loss_percent'], '%', Baseline.MURRAY_ID, scale=murray_scale)
+        add('murray_total_loss', report['murray_hectares']['total'], 'ha', Baseline.MURRAY_ID, scale=murray_scale)
+        add('murray_total_loss', report['murray_percent']['total_loss_percent'], '%', Baseline.MURRAY_ID, scale=murray_scale)
+        for year, hectares in report.get('murray_loss_by_year', {}).items():
+            add('murray_loss', hectares, 'ha', Baseline.MURRAY_ID, year=int(year), scale=murray_scale)
+
+    if 'gmw' not in failed:
+        gmw_id = Baseline.LAND_COVER_DATASETS['GMW']['collection']
+        gmw_scale = scale('gmw', Baseline.LAND_COVER_DATASETS['GMW']['scale'])
+        add('gmw_mangrove', report['gmw_hectares'], 'ha', gmw_id, scale=gmw_scale)
+        add('gmw_mangrove', report['gmw_percent'], '%', gmw_id, scale=gmw_scale)
+
+    if 'jaxa' not in failed:
+        jaxa_id = Baseline.LAND_COVER_DATASETS[jaxa_dataset]['collection']
+        jaxa_scale = scale('jaxa', Baseline.LAND_COVER_DATASETS[jaxa_dataset]['scale'])
+        hectares = report['jaxa_hectares']
+        percent = report['jaxa_percent']
+        # Before 2017 (FNF3) there is only the total
+        if type(hectares) is not dict:
+            hectares = {'Total': hectares}
+            percent = {'Total': percent}
+        for name, metric in [('Dense', 'jaxa_dense_forest'), ('Non-dense', 'jaxa_sparse_forest'), ('Total', 'jaxa_forest')]:
+            if name in hectares:
+                add(metric, hectares[name], 'ha', jaxa_id, scale=jaxa_scale)
+                add(metric, percent[name], '%', jaxa_id, scale=jaxa_scale)
+
+    if 'slr' not in failed:
+        # Every quantile, when the report has them (get_report does) - the median otherwise
+        quantiles = report.get('slr_quantiles') or {scenario: {year: {'median': value} for year, value in values.items()}
+                                                    for scenario, values in report['slr'].items()}
+        for scenario, years in quantiles.items():
+            for year, values in years.items():
+                for quantile, value in values.items():
+                    add('slr_' + quantile, value, 'm', 'IPCC/AR6/SLP', year=int(year), scenario=scenario, scale=25000)
+
+    if 'elevation' not in failed:
+        for name in ['mean', 'min', 'max']:
+            add('elevation_' + name, report['elevation'][name], 'm', 'COPERNICUS/DEM/GLO30', year=None, scale=scale('elevation', 30))
+
+    if 'inundation' not in failed:
+        inundation_year = Main_script.get_inundation_year(start_year)
+        inundation_scale = scale('elevation_histogram', 30)
+        for scenario, values in report['inundation'].items():
+            dataset = SLR.get_slr_image_id(inundation_year, scenario)
+            add('inundation_height', values['height'], 'm', dataset, inundation_year, scenario, 25000)
+            add('inundated', values['hectares'], 'ha', 'COPERNICUS/DEM/GLO30', inundation_year, scenario, inundation_scale)
+            add('inundated', values['percent'], '%', 'COPERNICUS/DEM/GLO30', inundation_year, scenario, inundation_scale)
+
+    if 'protected_planet' not in failed:
+        # The vector method has no breakdown, and no scale
+        breakdown = report.get('protected_planet_breakdown') or {}
+        pp_scale = scale('protected_planet', PP.PROTECTED_SCALE) if breakdown.get('by_iucn_category') is not None else None
+        add('protected_planet', report['protected_planet_hectares'], 'ha', PP.WDPA_ID, year=None, scale=pp_scale)
+        add('protected_planet', report['protected_planet_percent'], '%', PP.WDPA_ID, year=None, scale=pp_scale)
+        for title, values in [('iucn', breakdown.get('by_iucn_category')), ('status', breakdown.get('by_status'))]:
+            for name, value in (values or {}).items():
+                metric = 'protected_planet_' + title + '_' + name.lower().replace(' ', '_')
+                add(metric, value['hectares'], 'ha', PP.WDPA_ID, year=None, scale=pp_scale)
+                add(metric, value['percent'], '%', PP.WDPA_ID, year=None, scale=pp_scale)
+
+    if 'baseline_series' in report and 'baseline_series' not in failed:
+        series_scale = scale('baseline_series', None)
+        for name, metric, dataset in [('gmw', 'gmw_mangrove_series', Baseline.LAND_COVER_DATASETS['GMW']['collection']),
+                                      ('jaxa', 'jaxa_forest_series', 'JAXA/ALOS/PALSAR/YEARLY')]:
+            for year, hectares in report['baseline_series'][name]['hectares'].items():
+                add(metric, hectares, 'ha', dataset, year=int(year), scale=series_scale)
+
+    return records
+
+def append_report(report, site, start_year, sedimentation=None, filepath=None, run_time=None):
+    '''
+    Appends every number of report (see report_records) as one run of site. Nothing is replaced - older runs stay queryable,
+    and query(latest=True) picks the newest run of each site. The run keeps how the boundary was loaded (report['geometry'],
+    see Main_script.geometry_settings) - None when the report doesn't say.
+    Output: the run_id, or None when storing is off (settings['path'] is None).
+    '''
+    if settings['path'] is None:
+        return None
+
+    run_time = run_time if run_time is not None else time.time()
+    records = report_records(report, start_year)
+    geometry = report.get('geometry') or {}
+    prepare = geometry.get('prepare')
+
+    with _lock:
+        connection = _connect()
+        try:
+            cursor = connection.execute(
+                'INSERT INTO runs (site, filepath, start_year, sedimentation, run_time, prepare, tolerance_m, min_part_m2) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (site, filepath, start_year, sedimentation, run_time, None if prepare is None else int(prepare),
+                 geometry.get('tolerance_m'), geometry.get('min_part_m2'))
+            )
+            run_id = cursor.lastrowid
+            connection.executemany(
+                'INSERT INTO records (' + ', '.join(RECORD_COLUMNS) + ') VALUES (' + ', '.join('?' * len(RECORD_COLUMNS)) + ')',
+                [(run_id, site, record['metric'], record['dataset'], record['year'], record['scenario'], record['value'], record['unit'],
+                  record['scale'], run_time) for record in records]
+            )
+            connection.commit()
+        finally:
+            connection.close()
+    return run_id
+
+def _where(filters, latest):
+    clauses = []
+    parameters = []
+    for column, value in filters.items():
+        if value is None:
+            continue
+        if column not in FILTER_COLUMNS:
+            raise ValueError("Can't filter on " + str(column) + " - only on " + ', '.join(FILTER_COLUMNS))
+        if isinstance(value, (list, tuple, set)):
+            values = list(value)
+            clauses.append(column + ' IN (' + ', '.join('?' * len(values)) + ')')
+            parameters.extend(values)
+        else:
+            clauses.append(column + ' = ?')
+            parameters.append(value)
+
+    if latest:
+        clauses.append('run_id IN (SELECT MAX(run_id) FROM runs GROUP BY site)')
+    return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', parameters
+
+def query(latest=True, since=None, as_frame=False, **filters):
+    '''
+    Reads records back. Filters (site, metric, dataset, year, scenario, unit, run_id) take one value or a list of values:
+    query(metric='gmw_mangrove', unit='ha') gives every site's GMW hectares.
+    latest=True (default) only reads the newest run of each site; latest=False every run ever stored.
+    since: only runs from this time (seconds since epoch) on.
+    Output: a list of dictionaries with the keys of RECORD_COLUMNS - or a pandas DataFrame with as_frame=True.
+    '''
+    where, parameters = _where(filters, latest)
+    if since is not None:
+        where += (' AND ' if where else ' WHERE ') + 'run_time >= ?'
+        parameters.append(since)
+    sql = 'SELECT ' + ', '.join(RECORD_COLUMNS) + ' FROM records' + where + ' ORDER BY site, metric, scenario, year, unit'
+    return _read(sql, parameters, RECORD_COLUMNS, as_frame)
+
+def runs(site=None, as_frame=False):
+    '''
+    Every run stored (of site, or every site), oldest first: dictionaries with the keys of RUN_COLUMNS.
+    '''
+    where, parameters = _where({'site': site}, False)
+    return _read('SELECT ' + ', '.join(RUN_COLUMNS) + ' FROM runs' + where + ' ORDER BY run_id', parameters, RUN_COLUMNS, as_frame)
+
+def sites():
+    '''
+    Names of every site in the store.
+    '''
+    return [row['site'] for row in _read('SELECT DISTINCT site FROM runs ORDER BY site', [], ['site'])]
+
+def _read(sql, parameters, columns, as_frame=False):
+    if settings['path'] is None or not os.path.exists(settings['path']):
+        rows = []
+    else:
+        with _lock:
+            connection = _connect()
+            try:
+                rows = connection.execute(sql, parameters).fetchall()
+            finally:
+                connection.close()
+
+    if as_frame:
+        import pandas as pd
+        return pd.DataFrame(rows, columns=columns)
+    return [dict(zip(columns, row)) for row in rows]
@@ -0,0 +1,312 @@
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Opt-in tracing of every earth engine evaluation (getInfo) and download - where a run's time actually goes.
+# Off unless start() is called (get_csv(trace=True) and Batch.run_batch(trace=True) do), and close to free when off.
+# Each event records the metric that asked for it, the datasets and scales behind it (from its cache keys),
+# wall time, request and payload size, retries, and whether it was served from the cache.
+
+settings = {
+    'enabled': False
+}
+
+# Columns of trace.csv, in order.
+EVENT_COLUMNS = ['id', 'kind', 'metric', 'label', 'names', 'datasets', 'scales', 'start_s', 'wall_s', 'request_bytes', 'payload_bytes',
+                 'retries', 'shared', 'status', 'error', 'thread']
+
+# Columns of trace_summary.csv, in order.
+SUMMARY_COLUMNS = ['kind', 'metric', 'calls', 'total_s', 'mean_s', 'max_s', 'request_bytes', 'payload_bytes', 'retries', 'errors']
+
+# Frames from these modules are plumbing, not the metric asking - caller() looks past them.
+PLUMBING_MODULES = ['Trace', 'Cache', 'Scheduler', 'Workers', 'Export', 'contextlib', 'threading', 'concurrent.futures.thread', 'concurrent.futures._base']
+
+# Modules whose functions are the metrics themselves.
+METRIC_MODULES = ['Baseline', 'SLR', 'PP']
+
+_events = []
+_lock = threading.Lock()
+_local = threading.local()
+
+# Cache key -> what it was made from (see Cache.make_key), to describe events by dataset and scale.
+_keys = {}
+
+_started = 0.0
+
+def start():
+    '''
+    Starts a new trace - anything recorded before is dropped.
+    '''
+    global _started
+    with _lock:
+        _events.clear()
+        _keys.clear()
+        _started = time.perf_counter()
+        settings['enabled'] = True
+
+def stop():
+    '''
+    Stops tracing. Output: the list of events recorded (see EVENT_COLUMNS).
+    '''
+    with _lock:
+        settings['enabled'] = False
+        return list(_events)
+
+def is_enabled():
+    return settings['enabled']
+
+def get_events():
+    with _lock:
+        return list(_events)
+
+def describe_key(key, parts):
+    '''
+    Remembers what a cache key was made from (dataset, year, band, scale, reducer). Called by Cache.make_key.
+    '''
+    if settings['enabled']:
+        with _lock:
+            _keys[key] = parts
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+@contextmanager
+def label(name):
+    '''
+    Tags everything traced inside with name (a site, a task of Workers.run_tasks...). On another thread, where the stack
+    doesn't show who asked, it also stands in for the metric.
+    '''
+    if not settings['enabled']:
+        yield
+        return
+    labels = getattr(_local, 'labels', [])
+    _local.labels = labels + [str(name)]
+    try:
+        yield
+    finally:
+        _local.labels = labels
+
+def labelled(task, name):
+    '''
+    task wrapped so it runs under label(name) - task itself when tracing is off.
+    '''
+    if not settings['enabled']:
+        return task
+    if isinstance(name, tuple):
+        name = ' '.join(str(part) for part in name)
+
+    def run():
+        with label(name):
+            return task()
+    return run
+
+def caller():
+    '''
+    The metric asking: the first function on the stack outside of the plumbing modules - or if that's in one of the
+    METRIC_MODULES, the outermost function of theirs calling it (gmw_percent rather than land_cover_areas).
+    With nothing on the stack (a worker thread), the innermost label.
+    '''
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module not in PLUMBING_MODULES and frame.f_code.co_name != '<lambda>':
+            name = frame.f_code.co_name
+            while module in METRIC_MODULES and frame.f_back is not None:
+                frame = frame.f_back
+                module = frame.f_globals.get('__name__', '')
+                if module in METRIC_MODULES:
+                    name = frame.f_code.co_name
+            return name
+        frame = frame.f_back
+
+    labels = getattr(_local, 'labels', [])
+    return labels[-1] if labels else None
+
+def _size(value):
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return None
+
+@contextmanager
+def span(kind, metric=None, names=None, keys=None, ee_object=None, datasets=None, scales=None):
+    '''
+    Records one event of kind ('getInfo', 'export'...) around the code inside. Yields the event (None when tracing is off) -
+    pass it to set_payload. keys (cache keys) fill in the datasets and scales; ee_object gives the request size.
+    '''
+    if not settings['enabled']:
+        yield None
+        return
+
+    if keys:
+        described = [_keys.get(key, {'dataset': key.split('|')[0]}) for key in keys]
+        datasets = datasets or sorted(set(str(parts.get('dataset')) for parts in described))
+        scales = scales or sorted(set(parts.get('scale') for parts in described if parts.get('scale') is not None))
+
+    event = {
+        'kind': kind,
+        'metric': metric or caller(),
+        'label': ' / '.join(getattr(_local, 'labels', [])) or None,
+        'names': names or [],
+        'datasets': datasets or [],
+        'scales': scales or [],
+        'request_bytes': len(ee_object.serialize()) if ee_object is not None else None,
+        'payload_bytes': None,
+        'retries': 0,
+        'shared': False,
+        'status': 'ok',
+        'error': None,
+        'thread': threading.current_thread().name
+    }
+
+    _stack().append(event)
+    begin = time.perf_counter()
+    try:
+        yield event
+    except Exception as error:
+        event['status'] = 'error'
+        event['error'] = str(error)
+        raise
+    finally:
+        end = time.perf_counter()
+        _stack().pop()
+        event['start_s'] = begin - _started
+        event['wall_s'] = end - begin
+        _add(event)
+
+def record(kind, metric=None, names=None, keys=None):
+    '''
+    Records an instant event (like a cache hit) - no time spent.
+    '''
+    if not settings['enabled']:
+        return
+    with span(kind, metric or caller(), names, keys):
+        pass
+
+def _add(event):
+    with _lock:
+        if settings['enabled']:
+            event['id'] = len(_events) + 1
+            _events.append(event)
+
+def set_payload(event, value=None, size=None):
+    '''
+    Records the size of what came back - value's size as JSON, or size in bytes (e.g. of a downloaded file).
+    '''
+    if event is not None:
+        event['payload_bytes'] = size if size is not None else _size(value)
+
+def annotate(**fields):
+    '''
+    Sets fields on the innermost event of this thread - no-op when nothing is being traced.
+    '''
+    stack = getattr(_local, 'stack', None)
+    if settings['enabled'] and stack:
+        stack[-1].update(fields)
+
+def add_retry():
+    '''
+    Counts a retry against the innermost event of this thread. Called by Scheduler.
+    '''
+    stack = getattr(_local, 'stack', None)
+    if settings['enabled'] and stack:
+        stack[-1]['retries'] += 1
+
+def summarize(events):
+    '''
+    One row per (kind, metric) - how many calls, how long they took in total / on average / at worst, bytes, retries and errors.
+    Sorted slowest first.
+    '''
+    rows = {}
+    for event in events:
+        row = rows.setdefault((event['kind'], event['metric']), {
+            'kind': event['kind'],
+            'metric': event['metric'],
+            'calls': 0,
+            'total_s': 0.0,
+            'max_s': 0.0,
+            'request_bytes': 0,
+            'payload_bytes': 0,
+            'retries': 0,
+            'errors': 0
+        })
+        row['calls'] += 1
+        row['total_s'] += event['wall_s']
+        row['max_s'] = max(row['max_s'], event['wall_s'])
+        row['request_bytes'] += event['request_bytes'] or 0
+        row['payload_bytes'] += event['payload_bytes'] or 0
+        row['retries'] += event['retries']
+        row['errors'] += event['status'] != 'ok'
+
+    for row in rows.values():
+        row['mean_s'] = row['total_s'] / row['calls']
+    return sorted(rows.values(), key=lambda row: row['total_s'], reverse=True)
+
+def format_summary(events):
+    '''
+    The summary as a plain text table, for printing.
+    '''
+    rows = summarize(events)
+    table = [SUMMARY_COLUMNS] + [[_format(row[column]) for column in SUMMARY_COLUMNS] for row in rows]
+    widths = [max(len(str(line[index])) for line in table) for index in range(len(SUMMARY_COLUMNS))]
+    return '\n'.join('  '.join(str(value).ljust(width) for value, width in zip(line, widths)) for line in table)
+
+def _format(value):
+    if isinstance(value, float):
+        return round(value, 3)
+    return value
+
+def timeline(events):
+    '''
+    The events in Chrome's trace event format - open trace_timeline.json in chrome://tracing or ui.perfetto.dev
+    for a timeline of every request, one lane per thread.
+    '''
+    threads = {}
+    trace_events = []
+    for event in events:
+        tid = threads.setdefault(event['thread'], len(threads) + 1)
+        trace_events.append({
+            'name': str(event['metric']),
+            'cat': event['kind'],
+            'ph': 'X',
+            'ts': event['start_s'] * 1e6,
+            'dur': event['wall_s'] * 1e6,
+            'pid': 1,
+            'tid': tid,
+            'args': {column: event[column] for column in ['names', 'datasets', 'scales', 'request_bytes', 'payload_bytes', 'retries', 'status', 'error']}
+        })
+    for name, tid in threads.items():
+        trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': name}})
+    return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+def write(events, folder, timeline_file=True):
+    '''
+    Writes the trace into folder: trace.json and trace.csv (every event), trace_summary.csv (see summarize),
+    and trace_timeline.json (see timeline) unless timeline_file=False.
+    '''
+    with open(os.path.join(folder, 'trace.json'), 'w', encoding='utf-8') as f:
+        json.dump(events, f, indent=2, default=str)
+
+    with open(os.path.join(folder, 'trace.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=EVENT_COLUMNS)
+        writer.writeheader()
+        for event in events:
+            row = dict(event)
+            for column in ['names', 'datasets', 'scales']:
+                row[column] = ';'.join(str(value) for value in event[column])
+            writer.writerow({column: row.get(column) for column in EVENT_COLUMNS})
+
+    with open(os.path.join(folder, 'trace_summary.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(summarize(events))
+
+    if timeline_file:
+        with open(os.path.join(folder, 'trace_timeline.json'), 'w', encoding='utf-8') as f:
+            json.dump(timeline(events), f, default=str)
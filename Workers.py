@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+import Trace
+
+# How many earth engine requests run at once when nothing else is asked for.
+DEFAULT_MAX_WORKERS = 4
+
+def run_tasks(tasks, max_workers=DEFAULT_MAX_WORKERS):
+    '''
+    Runs independent tasks on a bounded pool of threads.
+    Input: tasks - a dictionary of name -> function taking no arguments (usually one earth engine fetch each).
+           max_workers - the most tasks running at the same time.
+    Output: (results, errors) - two dictionaries of name -> return value, and name -> exception for tasks that failed.
+            Both keep the order of tasks, no matter which task finished first.
+    A failing task never stops the others.
+    '''
+    futures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for name, task in tasks.items():
+            # Tagged with its name when tracing, since the worker thread's stack doesn't say who asked
+            futures[name] = pool.submit(Trace.labelled(task, name))
+
+    results = {}
+    errors = {}
+    for name, future in futures.items():
+        error = future.exception()
+        if error is None:
+            results[name] = future.result()
+        else:
+            errors[name] = error
+
+    return results, errors
+
+def run_in_background(task):
+    '''
+    Starts task (a function taking no arguments) on its own thread and returns straight away.
+    Output: a concurrent.futures.Future - .done() says whether it finished, .result() waits for its return value (or raises its error).
+    '''
+    pool = ThreadPoolExecutor(max_workers=1)
+    future = pool.submit(task)
+    # Lets the thread go once task is done - this doesn't wait for it.
+    pool.shutdown(wait=False)
+    return future
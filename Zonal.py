@@ -0,0 +1,198 @@
+import ee
+import csv
+import os
+import Baseline, SLR, PP, Cache, Main_script, Context
+
+# Zonal mode: every metric of get_csv for every feature (stratum, parcel...) of the project shapefile, instead of one
+# number for the whole dissolved project. Each dataset is reduced over all features at once with reduceRegions,
+# and everything (plus the normal whole-project report for the total row) comes back in ONE round trip.
+
+# Property every feature's id is copied into before reducing, so results can be matched back up.
+ZONE_PROPERTY = 'zone'
+
+def get_zones(aoi, id_field=None):
+    '''
+    Tags every feature of aoi with its id (the id_field attribute, or the earth engine feature id when id_field is None).
+    '''
+    aoi = Context.get_aoi(aoi)
+    if id_field is None:
+        return aoi.map(lambda feature: feature.set(ZONE_PROPERTY, feature.id()))
+    return aoi.map(lambda feature: feature.set(ZONE_PROPERTY, feature.get(id_field)))
+
+def reduce_zones(image, zones, reducer, scale, properties):
+    '''
+    One reduceRegions over every zone, keeping only the zone id and the reducer's outputs (no geometry comes back).
+    '''
+    return image.reduceRegions(collection=zones, reducer=reducer, scale=scale).select([ZONE_PROPERTY] + properties, None, False)
+
+def zonal_area_ee(aoi, zones):
+    # Geometry area (denominator of most percentages), and pixel-based area at the DEM's 30 m - the elevation histogram's total,
+    # so the denominator of the inundation percentages only. JAXA's pixel area is summed at its own 25 m, in zonal_land_cover_ee.
+    with_area = zones.map(lambda feature: feature.set('area_m2', feature.geometry().area(1)))
+    return reduce_zones(Context.pixel_area_ha(aoi), with_area, ee.Reducer.sum().setOutputs(['total_ha']), 30, ['area_m2', 'total_ha'])
+
+def zonal_murray_ee(aoi, zones):
+    loss_year = Baseline.get_murray_loss_year_image(aoi)
+    loss_area = Context.pixel_area_ha(aoi).updateMask(loss_year.mask())
+    return reduce_zones(loss_area.addBands(loss_year), zones, ee.Reducer.sum().group(groupField=1, groupName='lossYear'), 10, ['groups'])
+
+def zonal_land_cover_ee(aoi, zones, dataset, year):
+    '''
+    Class areas of every zone. For the datasets whose percentages need it (JAXA), each zone's pixel area at the dataset's scale
+    too, as 'pixel_hectares' - like Baseline.land_cover_areas_ee.
+    '''
+    scale = Baseline.LAND_COVER_DATASETS[dataset]['scale']
+    properties = ['groups']
+    if Baseline.LAND_COVER_DATASETS[dataset].get('pixel_hectares'):
+        zones = Context.pixel_area_ha(aoi).reduceRegions(collection=zones, reducer=ee.Reducer.sum().setOutputs(['pixel_hectares']), scale=scale)
+        properties.append('pixel_hectares')
+
+    classes = Baseline.get_land_cover_image(aoi, dataset, year).rename('class')
+    return reduce_zones(Context.pixel_area_ha(aoi).addBands(classes), zones, ee.Reducer.sum().group(groupField=1, groupName='class'),
+                        scale, properties)
+
+def zonal_elevation_ee(dem_image, zones):
+    reducer = ee.Reducer.mean().combine(ee.Reducer.min(), sharedInputs=True).combine(ee.Reducer.max(), sharedInputs=True)
+    return reduce_zones(dem_image, zones, reducer, 30, ['mean', 'min', 'max'])
+
+def zonal_elevation_histogram_ee(aoi, dem_image, zones, bin_size=SLR.ELEVATION_BIN_M):
+    # Same bins as SLR.get_elevation_histogram_ee
+    elevation_bins = SLR.elevation_bins_ee(dem_image, bin_size)
+    return reduce_zones(Context.pixel_area_ha(aoi).addBands(elevation_bins), zones, ee.Reducer.sum().group(groupField=1, groupName='bin'), 30, ['groups'])
+
+def zonal_protected_planet_ee(aoi, zones):
+    # Same painted WDPA raster as PP.protected_planet_areas_ee - one reduction for every feature.
+    return reduce_zones(Context.pixel_area_ha(aoi).addBands(PP.get_protected_planet_image(aoi)), zones,
+                        ee.Reducer.sum().group(groupField=1, groupName='pp_code'), PP.PROTECTED_SCALE, ['groups'])
+
+def zonal_key(aoi, dataset, year, band, scale, reducer, id_field):
+    return Cache.make_key(aoi, dataset, year, band, scale, 'reduceRegions(' + reducer + ') by ' + str(id_field))
+
+def get_zonal_requests(aoi, start_year, id_field=None):
+    '''
+    Every per-feature metric, as a dictionary of name -> (cache key, server-side ee object) like Main_script.get_report_requests.
+    SLR is not in here - at 25 km per pixel it's one value for the whole project, so every feature uses the project's.
+    aoi can be a context (see Context.py), to share its images with Main_script.get_report_requests.
+    '''
+    aoi = Context.get_context(aoi)
+    eval_year = start_year - 1
+    jaxa_dataset = Baseline.jaxa_dataset(eval_year)
+    zones = get_zones(aoi, id_field)
+
+    # Built once for both DEM reductions (and the whole-project ones, with a shared context)
+    dem_image = SLR.get_elevation_map(aoi)
+
+    return {
+        'zonal_area': (zonal_key(aoi, 'geometry', None, 'area', 30, 'sum', id_field), zonal_area_ee(aoi, zones)),
+        'zonal_murray': (zonal_key(aoi, 'JCU/Murray/GIC/global_tidal_wetland_change/2019', None, 'loss,lossYear', 10, 'sum.group(lossYear)', id_field),
+                         zonal_murray_ee(aoi, zones)),
+        'zonal_gmw': (zonal_key(aoi, Baseline.LAND_COVER_DATASETS['GMW']['collection'], eval_year, 'class', 30, 'sum.group(class)', id_field),
+                      zonal_land_cover_ee(aoi, zones, 'GMW', eval_year)),
+        'zonal_jaxa': (zonal_key(aoi, Baseline.LAND_COVER_DATASETS[jaxa_dataset]['collection'], eval_year, 'class', 25,
+                                 'sum.group(class),pixel_hectares', id_field),
+                       zonal_land_cover_ee(aoi, zones, jaxa_dataset, eval_year)),
+        'zonal_elevation': (zonal_key(aoi, 'COPERNICUS/DEM/GLO30', None, 'DEM', 30, 'mean,min,max', id_field), zonal_elevation_ee(dem_image, zones)),
+        'zonal_elevation_histogram': (zonal_key(aoi, 'COPERNICUS/DEM/GLO30', None, 'DEM', 30, SLR.elevation_histogram_reducer(), id_field),
+                                      zonal_elevation_histogram_ee(aoi, dem_image, zones)),
+        'zonal_protected_planet': (zonal_key(aoi, PP.WDPA_ID, None, 'IUCN_CAT,STATUS', PP.PROTECTED_SCALE, 'paint.sum.group(pp_code)', id_field),
+                                   zonal_protected_planet_ee(aoi, zones)),
+    }
+
+def parse_zones(feature_collection_info):
+    '''
+    Turns a fetched reduce_zones result into zone id -> properties. Feature ids have to be unique.
+    '''
+    zones = {}
+    for feature in feature_collection_info['features']:
+        properties = feature['properties']
+        zone = properties.get(ZONE_PROPERTY)
+        if zone in zones:
+            raise ValueError("Zone id " + str(zone) + " is used by more than one feature - pick an id_field with unique values")
+        zones[zone] = properties
+    return zones
+
+def get_zone_infos(info):
+    '''
+    Splits the fetched zonal requests into zone id -> raw results shaped like Main_script.get_report_requests,
+    so every zone goes through the exact same Main_script.build_report as the whole project.
+    '''
+    area = parse_zones(info['zonal_area'])
+    murray = parse_zones(info['zonal_murray'])
+    gmw = parse_zones(info['zonal_gmw'])
+    jaxa = parse_zones(info['zonal_jaxa'])
+    elevation = parse_zones(info['zonal_elevation'])
+    histogram = parse_zones(info['zonal_elevation_histogram'])
+    protected = parse_zones(info['zonal_protected_planet'])
+
+    zone_infos = {}
+    for zone, properties in area.items():
+        area_m2 = properties['area_m2']
+        zone_infos[zone] = {
+            'area_m2': area_m2,
+            'murray': murray[zone].get('groups') or [],
+            'gmw': {'groups': gmw[zone].get('groups') or [], 'area_m2': area_m2},
+            'jaxa': {'groups': jaxa[zone].get('groups') or [], 'area_m2': area_m2, 'pixel_hectares': jaxa[zone].get('pixel_hectares')},
+            'slr': info['slr'],
+            'slr_ssp370': info['slr_ssp370'],
+            'slr_ssp585': info['slr_ssp585'],
+            'elevation': {
+                'DEM_mean': elevation[zone].get('mean'),
+                'DEM_min': elevation[zone].get('min'),
+                'DEM_max': elevation[zone].get('max')
+            },
+            # A sliver too thin to hold a pixel centre has no pixel area - fall back on its geometry area.
+            'elevation_histogram': {'groups': histogram[zone].get('groups') or [], 'total': properties.get('total_ha') or area_m2 / 10000},
+            'protected_planet': {'groups': protected[zone].get('groups') or [], 'area_m2': area_m2}
+        }
+    return zone_infos
+
+def get_zonal_report(aoi, start_year, sedimentation, id_field=None):
+    '''
+    Every metric of get_csv for every feature of aoi, plus the whole project.
+    Output: a dictionary with 'zones' (zone id -> report, in the layout of Main_script.get_report) and 'total' (the whole-project report).
+    '''
+    # One context for the zones and the total, so every dataset image goes into the request once.
+    aoi = Context.get_context(aoi)
+    requests = Main_script.get_report_requests(aoi, start_year)
+    requests.update(get_zonal_requests(aoi, start_year, id_field))
+
+    # One round trip for every zone and the total (minus anything cached).
+    info = Cache.fetch_many(requests)
+
+    zones = {zone: Main_script.build_report(zone_info, start_year, sedimentation) for zone, zone_info in get_zone_infos(info).items()}
+    return {
+        'zones': zones,
+        'total': Main_script.build_report(info, start_year, sedimentation)
+    }
+
+def write_zonal_csv(zonal_report, folder, id_field=None):
+    '''
+    Writes folder/zonal.csv - one row per feature, then a 'TOTAL' row for the whole project.
+    The total is measured on the dissolved project, so where features overlap it is less than the sum of the rows.
+    '''
+    zone_column = id_field if id_field is not None else 'feature_id'
+    with open(os.path.join(folder, 'zonal.csv'), mode='w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=[zone_column] + Main_script.REPORT_COLUMNS)
+        writer.writeheader()
+        for zone in sorted(zonal_report['zones'], key=str):
+            row = {zone_column: zone}
+            row.update(Main_script.summarize_report(zonal_report['zones'][zone]))
+            writer.writerow(row)
+        row = {zone_column: 'TOTAL'}
+        row.update(Main_script.summarize_report(zonal_report['total']))
+        writer.writerow(row)
+
+def get_zonal_csv(filepath, start_year, sedimentation, folder, id_field=None, prepare=False):
+    '''
+    Zonal version of Main_script.get_csv: makes folder/zonal.csv with one row per feature of the shapefile (keyed by id_field),
+    and the usual folder/output.csv for the whole project. prepare=True cleans and simplifies the boundaries first (see Main_script.convert_to_ee).
+    '''
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    aoi = Main_script.convert_to_ee(filepath, prepare, stats_folder=folder)
+
+    zonal_report = get_zonal_report(aoi, start_year, sedimentation, id_field)
+    zonal_report['total']['geometry'] = Main_script.geometry_settings(prepare)
+    write_zonal_csv(zonal_report, folder, id_field)
+    Main_script.write_csv(zonal_report['total'], start_year, folder)
+    return zonal_report
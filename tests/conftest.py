@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+# The project modules live at the top of the repo, not in a package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests never talk to earth engine: the fake ee (see FakeEE.py) goes in before any project module is imported.
+import FakeEE
+FakeEE.install()
+
+import Cache
+import Scheduler
+import Store
+
+
+@pytest.fixture(autouse=True)
+def scheduler_defaults():
+    '''
+    Every test starts (and leaves) the scheduler with its usual settings and backend - and no waiting between retries.
+    '''
+    saved = dict(Scheduler.settings)
+    Scheduler.configure(base_delay=0.0, max_delay=0.0)
+    yield
+    Scheduler.set_backend(None)
+    Scheduler.configure(**saved)
+
+
+@pytest.fixture(autouse=True)
+def memory_only_cache():
+    '''
+    Nothing cached on disk or appended to the results store by tests, and nothing cached carried from one test to the next.
+    '''
+    saved_cache = Cache.settings['path']
+    saved_store = Store.settings['path']
+    Cache.configure(path=None)
+    Store.configure(path=None)
+    Cache.clear(memory_only=True)
+    yield
+    Cache.clear(memory_only=True)
+    Cache.configure(path=saved_cache)
+    Store.configure(path=saved_store)
@@ -0,0 +1,63 @@
+import pytest
+
+import Baseline
+
+# 100 ha by geometry, 99 ha of pixels at the dataset's scale
+AREAS = {'groups': [{'class': 1, 'sum': 10.0}, {'class': 2, 'sum': 3.0}], 'area_m2': 1e6, 'pixel_hectares': 99.0}
+
+
+def test_gmw_percent_is_of_the_geometry_area():
+    areas = Baseline.parse_land_cover_areas(AREAS, 'GMW')
+    assert areas['hectares'][1] == 10.0
+    assert areas['percent'][1] == 10.0
+
+
+def test_jaxa_percent_is_of_the_pixel_area():
+    areas = Baseline.parse_land_cover_areas(AREAS, 'FNF4')
+    assert Baseline.jaxa_percent_from_areas(areas, 2023) == {'Dense': 10.1, 'Non-dense': 3.03, 'Total': 13.13}
+
+
+def test_jaxa_percent_without_pixel_area():
+    areas = Baseline.parse_land_cover_areas({'groups': [{'class': 1, 'sum': 10.0}], 'area_m2': 1e6}, 'FNF3')
+    assert Baseline.jaxa_percent_from_areas(areas, 2015) == 10.0
+
+
+def test_only_jaxa_asks_for_the_pixel_area():
+    import json
+    import Cache
+    import ee
+
+    aoi = ee.FeatureCollection('site')
+    reducers = {dataset: json.loads(Cache.key_label(Baseline.land_cover_key(aoi, dataset, 2023)))['reducer']
+                for dataset in Baseline.LAND_COVER_DATASETS}
+    assert reducers == {'GMW': 'sum.group(class)', 'FNF3': 'sum.group(class),pixel_hectares', 'FNF4': 'sum.group(class),pixel_hectares'}
+
+
+def test_gmw_areas_have_no_pixel_area():
+    areas = Baseline.parse_land_cover_areas({'groups': [{'class': 1, 'sum': 10.0}], 'area_m2': 1e6}, 'GMW')
+    assert areas['pixel_hectares'] is None
+    assert areas['percent'][1] == 10.0
+
+
+def test_series_trend():
+    # Straight line, 10 ha a year, with a gap
+    trend = Baseline.series_trend({2010: 100.0, 2012: 120.0, 2011: 110.0, 2015: 150.0})
+    assert (trend['first_year'], trend['last_year'], trend['first_hectares'], trend['last_hectares']) == (2010, 2015, 100.0, 150.0)
+    assert trend['slope_ha_per_year'] == pytest.approx(10.0)
+    # 100 -> 150 over 5 years
+    assert trend['annual_change_percent'] == pytest.approx((1.5 ** 0.2 - 1) * 100)
+
+
+def test_series_trend_of_a_shrinking_series():
+    trend = Baseline.series_trend({2000: 200.0, 2010: 100.0})
+    assert trend['slope_ha_per_year'] == pytest.approx(-10.0)
+    assert trend['annual_change_percent'] == pytest.approx((0.5 ** 0.1 - 1) * 100)
+
+
+def test_series_trend_edge_cases():
+    assert Baseline.series_trend({}) is None
+    assert Baseline.series_trend({2020: 5.0}) is None
+    # Nothing to grow from
+    trend = Baseline.series_trend({2018: 0.0, 2020: 4.0})
+    assert trend['slope_ha_per_year'] == pytest.approx(2.0)
+    assert trend['annual_change_percent'] is None
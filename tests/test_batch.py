@@ -0,0 +1,118 @@
+import copy
+import csv
+
+import pytest
+
+import Batch
+import Benchmark
+import FakeEE
+import Main_script
+
+import ee
+
+
+@pytest.fixture
+def full_report():
+    # A whole report of the synthetic site, for the stand-in get_csv to hand back
+    import Scheduler
+    FakeEE.record(FakeEE.new_recording(), respond=Benchmark.synthetic_response)
+    try:
+        return Main_script.get_report(ee.FeatureCollection('batch site'), 2024, 0.5)
+    finally:
+        Scheduler.set_backend(None)
+
+
+@pytest.fixture
+def sites(tmp_path):
+    folder = tmp_path / 'sites'
+    folder.mkdir()
+    for name in ['a', 'b', 'c']:
+        (folder / (name + '.shp')).write_text('')
+    return str(folder)
+
+
+@pytest.fixture
+def get_csv(monkeypatch, full_report):
+    '''
+    Stands in for Main_script.get_csv: site name -> 'done', 'partial' (a section failed) or 'error' (raises).
+    Every call is logged in outcomes['calls'].
+    '''
+    outcomes = {'calls': []}
+
+    def fake_get_csv(filepath, start_year, sedimentation, folder, max_workers=None, site=None, prepare=False):
+        outcomes['calls'].append(site)
+        outcome = outcomes.get(site, 'done')
+        if outcome == 'error':
+            raise RuntimeError('User memory limit exceeded')
+        report = copy.deepcopy(full_report)
+        if outcome == 'partial':
+            report['failed'] = {'protected_planet': 'protected_planet - Computation timed out'}
+        return report
+
+    monkeypatch.setattr(Main_script, 'get_csv', fake_get_csv)
+    return outcomes
+
+
+def read_summary(output):
+    with open(str(output / 'summary.csv'), newline='', encoding='utf-8') as f:
+        return {row['site']: row for row in csv.DictReader(f)}
+
+
+def test_rerun_only_runs_what_didnt_finish(tmp_path, sites, get_csv):
+    output = tmp_path / 'output'
+    get_csv.update({'b': 'error', 'c': 'partial'})
+    rows = Batch.run_batch(sites, str(output), 2024, 0.5, max_sites=1)
+    assert [(row['site'], row['status']) for row in rows] == [('a', 'done'), ('b', 'failed'), ('c', 'partial')]
+    assert rows[1]['error'] == 'User memory limit exceeded'
+    assert rows[2]['error'] == 'protected_planet: protected_planet - Computation timed out'
+
+    # Second run: the failed and partial sites again, and now they work
+    get_csv.update({'calls': [], 'b': 'done', 'c': 'done'})
+    rows = Batch.run_batch(sites, str(output), 2024, 0.5, max_sites=1)
+    assert sorted(get_csv['calls']) == ['b', 'c']
+    assert [(row['site'], row['status']) for row in rows] == [('a', 'done'), ('b', 'done'), ('c', 'done')]
+    assert {site: row['status'] for site, row in read_summary(output).items()} == {'a': 'done', 'b': 'done', 'c': 'done'}
+
+    # Third run: nothing left to do
+    get_csv['calls'] = []
+    Batch.run_batch(sites, str(output), 2024, 0.5)
+    assert get_csv['calls'] == []
+
+
+def test_half_written_progress_line_is_run_again(tmp_path, sites, get_csv):
+    output = tmp_path / 'output'
+    Batch.run_batch(sites, str(output), 2024, 0.5, max_sites=1)
+
+    # A crash while logging c
+    progress = output / 'batch_progress.jsonl'
+    lines = progress.read_text(encoding='utf-8').splitlines()
+    c_line = [line for line in lines if '"site": "c"' in line][0]
+    progress.write_text('\n'.join(line for line in lines if line != c_line) + '\n' + c_line[:40], encoding='utf-8')
+    assert set(Batch.read_progress(str(progress))) == {'a', 'b'}
+
+    get_csv['calls'] = []
+    rows = Batch.run_batch(sites, str(output), 2024, 0.5)
+    assert get_csv['calls'] == ['c']
+    assert [row['status'] for row in rows] == ['done', 'done', 'done']
+
+
+def test_summary_has_the_report_numbers(tmp_path, sites, get_csv, full_report):
+    output = tmp_path / 'output'
+    Batch.run_batch(sites, str(output), 2024, 0.5)
+    row = read_summary(output)['a']
+    assert float(row['gmw_ha']) == pytest.approx(full_report['gmw_hectares'])
+    assert row['status'] == 'done' and row['error'] == ''
+
+
+def test_duplicate_site_names_get_their_own_folders(tmp_path):
+    manifest = tmp_path / 'manifest.csv'
+    manifest.write_text('filepath,start_year,sedimentation\nnorth/site.shp,2024,0.5\nsouth/site.shp,2020,0.2\n', encoding='utf-8')
+    sites = Batch.get_sites(str(manifest))
+    assert [site['name'] for site in sites] == ['site', 'site_2']
+    assert sites[1]['filepath'] == str(tmp_path / 'south' / 'site.shp')
+    assert (sites[1]['start_year'], sites[1]['sedimentation']) == (2020, 0.2)
+
+
+def test_folder_of_sites_needs_start_year_and_sedimentation(sites):
+    with pytest.raises(ValueError):
+        Batch.get_sites(sites)
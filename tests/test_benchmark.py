@@ -0,0 +1,73 @@
+import json
+import subprocess
+import sys
+
+import Benchmark
+
+
+def run_benchmark(tmp_path, *arguments):
+    command = [sys.executable, Benchmark.__file__, 'run', Benchmark.SYNTHETIC_RECORDING_FILE, '--output', str(tmp_path / 'results.json')]
+    return subprocess.run(command + list(arguments), capture_output=True, text=True)
+
+
+def test_round_trips_no_worse_than_baseline(tmp_path):
+    # What CI checks: every scenario replays, and none makes more round trips than benchmark_baseline.json.
+    result = run_benchmark(tmp_path, '--check')
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+def test_check_fails_on_more_round_trips(tmp_path):
+    baseline = Benchmark.read_baseline(Benchmark.BASELINE_FILE)
+    baseline['get_csv'] -= 1
+    (tmp_path / 'baseline.json').write_text(json.dumps(baseline))
+
+    result = run_benchmark(tmp_path, '--check', '--baseline', str(tmp_path / 'baseline.json'))
+    assert result.returncode == 1
+    assert 'get_csv: ' + str(baseline['get_csv'] + 1) + ' round trips, was ' + str(baseline['get_csv']) in result.stdout
+
+
+def test_check_fails_without_baseline(tmp_path):
+    result = run_benchmark(tmp_path, '--check', '--baseline', str(tmp_path / 'missing.json'))
+    assert result.returncode == 1
+    assert 'No baseline' in result.stdout
+
+
+def test_scenario_without_baseline_is_a_regression():
+    results = [{'scenario': 'new_metric', 'status': 'ok', 'round_trips': 1, 'error': None}]
+    assert Benchmark.compare(results, {}) == ['new_metric: no baseline (run with --update-baseline)']
+
+
+def test_startup_imports_nothing_heavy():
+    for module in Benchmark.IMPORT_TARGETS:
+        assert Benchmark.measure_import(module, fake_ee=True, repeat=1)['heavy_modules'] == []
+
+
+def test_startup_no_heavier_than_baseline():
+    results = [Benchmark.measure_import(module, fake_ee=True, repeat=1) for module in Benchmark.IMPORT_TARGETS]
+    assert Benchmark.compare_imports(results, Benchmark.read_baseline(Benchmark.IMPORT_BASELINE_FILE)) == []
+
+
+def test_import_check_ignores_time_but_not_modules():
+    baseline = {'Main_script': 60}
+    slow = {'module': 'Main_script', 'import_s': 10.0, 'modules': 60, 'heavy_modules': []}
+    assert Benchmark.compare_imports([slow], baseline) == []
+
+    heavier = dict(slow, modules=60 + Benchmark.IMPORT_MODULE_TOLERANCE + 1)
+    assert Benchmark.compare_imports([heavier], baseline) == ['Main_script: imports 71 modules, was 60']
+
+
+def test_synthetic_single_year_slr_matches_the_stacked_image():
+    import FakeEE
+
+    responses = FakeEE.load(Benchmark.SYNTHETIC_RECORDING_FILE)['responses']
+    stacked = {}
+    single = {}
+    for label, response in responses.items():
+        request = json.loads(label)
+        if request['dataset'] == 'IPCC/AR6/SLP':
+            stacked.update(response)
+        elif request['dataset'].startswith('IPCC/AR6/SLP/'):
+            single[request['dataset'].rsplit('/', 1)[1]] = response
+    assert single
+    for name, meters in single.items():
+        assert meters == stacked[name + '_median'] / 1000
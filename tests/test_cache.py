@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+import Cache
+import Scheduler
+
+import ee
+
+DAY = 24 * 60 * 60
+
+
+class Clock:
+    '''Stands in for the time module in Cache - time only moves when the test says so.'''
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(Cache, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def disk_cache(tmp_path):
+    '''A cache file of its own for the test - the autouse fixture puts the memory-only setting back afterwards.'''
+    saved = dict(Cache.settings)
+    Cache.configure(path=str(tmp_path / 'cache.sqlite'))
+    yield
+    Cache.settings.update(saved)
+
+
+def on_disk_only(key):
+    # What a new session would find
+    Cache.clear(memory_only=True)
+    return Cache.lookup(key)
+
+
+def test_results_expire_after_the_default_ttl(clock, disk_cache):
+    Cache.store('COPERNICUS/DEM/GLO30|a', {'DEM_mean': 1.0})
+
+    clock.now += Cache.settings['default_ttl'] - 1
+    assert Cache.lookup('COPERNICUS/DEM/GLO30|a') == {'DEM_mean': 1.0}
+    assert on_disk_only('COPERNICUS/DEM/GLO30|a') == {'DEM_mean': 1.0}
+
+    clock.now += 1
+    assert Cache.lookup('COPERNICUS/DEM/GLO30|a') is Cache.MISSING
+    assert on_disk_only('COPERNICUS/DEM/GLO30|a') is Cache.MISSING
+
+
+def test_wdpa_results_expire_sooner(clock, disk_cache):
+    Cache.store('WCMC/WDPA/current/polygons|a', 300.0)
+    Cache.store('JCU/Murray/GIC/global_tidal_wetland_change/2019|a', [])
+    assert Cache.get_ttl('WCMC/WDPA/current/polygons|a') == 7 * DAY
+
+    clock.now += 7 * DAY
+    assert on_disk_only('WCMC/WDPA/current/polygons|a') is Cache.MISSING
+    assert on_disk_only('JCU/Murray/GIC/global_tidal_wetland_change/2019|a') == []
+
+
+def test_least_recently_used_is_evicted_first(clock, disk_cache):
+    value = 'x' * 100
+    size = len(json.dumps(value))
+    Cache.configure(max_bytes=size * 2)
+
+    Cache.store('dataset|old', value)
+    clock.now += 1
+    Cache.store('dataset|newer', value)
+    clock.now += 1
+    # Reading the oldest one makes it the most recently used
+    assert on_disk_only('dataset|old') == value
+    clock.now += 1
+    Cache.store('dataset|newest', value)
+
+    assert on_disk_only('dataset|newer') is Cache.MISSING
+    assert on_disk_only('dataset|old') == value
+    assert on_disk_only('dataset|newest') == value
+
+
+def test_result_just_stored_is_never_evicted(clock, disk_cache):
+    Cache.configure(max_bytes=1)
+    Cache.store('dataset|a', 'small')
+    Cache.store('dataset|b', 'too big for the cache')
+    assert on_disk_only('dataset|a') is Cache.MISSING
+    assert on_disk_only('dataset|b') == 'too big for the cache'
+
+
+def test_cached_results_are_not_fetched_again(disk_cache):
+    requests = []
+    Scheduler.set_backend(lambda ee_object: requests.append(ee_object) or None)
+
+    # None is a result like any other
+    assert Cache.fetch('dataset|a', ee.Number(1)) is None
+    Cache.clear(memory_only=True)
+    assert Cache.fetch('dataset|a', ee.Number(2)) is None
+    assert len(requests) == 1
+
+
+def test_clear_empties_the_file(disk_cache):
+    Cache.store('dataset|a', 1)
+    Cache.clear()
+    assert Cache.lookup('dataset|a') is Cache.MISSING
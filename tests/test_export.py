@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pytest
+
+import Export
+import Scheduler
+
+rasterio = pytest.importorskip('rasterio')
+
+
+def write_tile(path, data, left, top, pixel_size, nodata=None):
+    from rasterio.transform import from_origin
+    with rasterio.open(path, 'w', driver='GTiff', height=data.shape[1], width=data.shape[2], count=data.shape[0],
+                       dtype=data.dtype, crs='EPSG:4326', transform=from_origin(left, top, pixel_size, pixel_size), nodata=nodata) as f:
+        f.write(data)
+
+
+def test_mosaic_matches_merge(tmp_path):
+    from rasterio.merge import merge
+
+    # A 2 x 3 grid of uneven tiles on one pixel grid, like plan_tiles makes
+    pixel_size = 0.001
+    rng = np.random.default_rng(0)
+    paths = []
+    for row, (top, height) in enumerate([(0.0, 40), (-0.04, 25)]):
+        for col, (left, width) in enumerate([(5.0, 30), (5.03, 30), (5.06, 17)]):
+            path = str(tmp_path / ('tile_' + str(row) + '_' + str(col) + '.tif'))
+            write_tile(path, rng.random((2, height, width)).astype('float32'), left, top, pixel_size, nodata=-9999)
+            paths.append(path)
+
+    Export.mosaic_tiles(paths, str(tmp_path / 'mosaic.tif'), nodata=-9999)
+
+    sources = [rasterio.open(path) for path in paths]
+    expected, transform = merge(sources)
+    for source in sources:
+        source.close()
+    with rasterio.open(str(tmp_path / 'mosaic.tif')) as result:
+        assert result.count == 2 and result.nodata == -9999
+        assert result.transform.almost_equals(transform)
+        np.testing.assert_array_equal(result.read(), expected)
+
+
+def export_tiles(tmp_path, image):
+    import ee
+    Scheduler.set_backend(lambda ee_object: {'coordinates': [[[0, 0], [0.5, 0], [0.5, 0.5], [0, 0.5], [0, 0]]]})
+    return Export.export_image(image, str(tmp_path / 'dem.tif'), ee.FeatureCollection('site'), 30, mosaic=False)
+
+
+def test_resume_keeps_tiles_of_the_same_export(tmp_path):
+    import ee
+    image = ee.Image('COPERNICUS/DEM/GLO30').lte(1.0)
+    paths = export_tiles(tmp_path, image)
+    with open(paths[0], 'wb') as f:
+        f.write(b'kept')
+    assert export_tiles(tmp_path, image) == paths
+    with open(paths[0], 'rb') as f:
+        assert f.read() == b'kept'
+
+
+def test_stale_tiles_of_another_export_are_discarded(tmp_path):
+    import ee
+    paths = export_tiles(tmp_path, ee.Image('COPERNICUS/DEM/GLO30').lte(1.0))
+    with open(paths[0], 'wb') as f:
+        f.write(b'stale')
+
+    # Same filename, different submergence height - nothing of the first export may be reused.
+    paths = export_tiles(tmp_path, ee.Image('COPERNICUS/DEM/GLO30').lte(2.0))
+    with open(paths[0], 'rb') as f:
+        assert f.read() != b'stale'
+    assert os.path.exists(os.path.join(os.path.dirname(paths[0]), 'manifest.json'))
+
+
+def test_tile_folder_without_manifest_is_discarded(tmp_path):
+    import ee
+    folder = tmp_path / 'dem_tiles'
+    folder.mkdir()
+    (folder / 'tile_0_0.tif').write_bytes(b'from an older version')
+    paths = export_tiles(tmp_path, ee.Image('COPERNICUS/DEM/GLO30'))
+    with open(paths[0], 'rb') as f:
+        assert f.read() != b'from an older version'
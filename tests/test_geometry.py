@@ -0,0 +1,165 @@
+import pytest
+
+pytest.importorskip('shapely')
+pytest.importorskip('pyproj')
+
+import Geometry
+
+POLYGON = '''<Polygon>
+  <outerBoundaryIs><LinearRing><coordinates>39.2,-6.9,0 39.25,-6.9,0 39.25,-6.85,0 39.2,-6.85,0 39.2,-6.9,0</coordinates></LinearRing></outerBoundaryIs>
+  <innerBoundaryIs><LinearRing><coordinates>39.21,-6.89 39.22,-6.89 39.22,-6.88 39.21,-6.89</coordinates></LinearRing></innerBoundaryIs>
+</Polygon>'''
+
+KML = '''<?xml version="1.0" encoding="UTF-8"?>
+<kml{namespace}><Document><Folder>
+  <Placemark><name>Site A</name><description>Mangroves</description>{polygon}</Placemark>
+  <Placemark><name>Site B</name><MultiGeometry>{polygon}{polygon}</MultiGeometry></Placemark>
+</Folder></Document></kml>'''
+
+
+@pytest.mark.parametrize('namespace', [
+    ' xmlns="http://www.opengis.net/kml/2.2"',
+    ' xmlns="http://earth.google.com/kml/2.1"',
+    ' xmlns="http://earth.google.com/kml/2.0"',
+    ''
+])
+def test_kml_in_any_namespace(tmp_path, namespace):
+    path = tmp_path / 'site.kml'
+    path.write_text(KML.format(namespace=namespace, polygon=POLYGON), encoding='utf-8')
+
+    data = Geometry.read_file(str(path))
+    assert data['crs'].to_epsg() == 4326
+    assert [feature['properties'] for feature in data['features']] == [
+        {'Name': 'Site A', 'Description': 'Mangroves'},
+        {'Name': 'Site B', 'Description': None}
+    ]
+    site_a, site_b = [feature['geometry'] for feature in data['features']]
+    assert site_a.geom_type == 'Polygon' and len(site_a.interiors) == 1
+    assert site_b.geom_type == 'MultiPolygon' and len(site_b.geoms) == 2
+
+
+def test_kml_without_polygons_is_refused(tmp_path):
+    path = tmp_path / 'points.kml'
+    path.write_text('<kml xmlns="http://earth.google.com/kml/2.2"><Placemark><Point><coordinates>39.2,-6.9</coordinates></Point>'
+                    '</Placemark></kml>', encoding='utf-8')
+    with pytest.raises(ValueError, match='No polygons'):
+        Geometry.read_file(str(path))
+
+
+def test_kml_of_another_format_is_refused(tmp_path):
+    path = tmp_path / 'empty.kml'
+    path.write_text('<gpx><wpt lat="-6.9" lon="39.2"/></gpx>', encoding='utf-8')
+    with pytest.raises(ValueError, match='0 placemarks'):
+        Geometry.read_file(str(path))
+
+
+def write_utm_shapefile(path):
+    # A 100 m square in UTM zone 37S, with a .prj
+    shapefile = pytest.importorskip('shapefile')
+    pyproj = pytest.importorskip('pyproj')
+    with shapefile.Writer(str(path), shapeType=shapefile.POLYGON) as writer:
+        writer.field('name', 'C')
+        writer.poly([[(500000, 9240000), (500000, 9240100), (500100, 9240100), (500100, 9240000), (500000, 9240000)]])
+        writer.record('square')
+    path.with_suffix('.prj').write_text(pyproj.CRS.from_epsg(32737).to_wkt(), encoding='utf-8')
+
+
+def test_unprepared_boundary_is_read_as_drawn_in_lon_lat(tmp_path):
+    path = tmp_path / 'site.shp'
+    write_utm_shapefile(path)
+
+    geojson = Geometry.read_geojson(str(path))
+    feature, = geojson['features']
+    assert feature['properties'] == {'name': 'square'}
+    ring = feature['geometry']['coordinates'][0]
+    assert len(ring) == 5 and feature['geometry']['geodesic'] is False
+    assert all(38.9 < x < 39.1 and -6.9 < y < -6.8 for x, y in ring)
+
+
+def test_unprepared_boundary_does_not_need_geemap(tmp_path, monkeypatch):
+    import sys
+    import Main_script
+
+    path = tmp_path / 'site.shp'
+    write_utm_shapefile(path)
+    # import geemap would fail
+    monkeypatch.setitem(sys.modules, 'geemap', None)
+    Main_script.convert_to_ee(str(path))
+
+
+def utm_data(*geometries):
+    # Features in UTM zone 37S (meters), as read_file gives them
+    pyproj = pytest.importorskip('pyproj')
+    return {'crs': pyproj.CRS.from_epsg(32737),
+            'features': [{'properties': {'id': index}, 'geometry': geometry} for index, geometry in enumerate(geometries)]}
+
+
+def test_prepare_simplifies_and_removes_slivers():
+    from shapely.geometry import MultiPolygon, Polygon, shape
+
+    # A 100 m square with a point every meter along its edges, a 2 m2 hole, and a 2 m2 island
+    edge = [(500000 + i, 9240000) for i in range(100)] + [(500100, 9240000 + i) for i in range(100)] + \
+        [(500100 - i, 9240100) for i in range(100)] + [(500000, 9240100 - i) for i in range(100)]
+    hole = [(500050, 9240050), (500051, 9240050), (500051, 9240052), (500050, 9240052)]
+    island = Polygon([(500200, 9240000), (500201, 9240000), (500201, 9240002), (500200, 9240002)])
+    geojson, stats = Geometry.prepare(utm_data(MultiPolygon([Polygon(edge, [hole]), island])))
+
+    assert (stats['parts_removed'], stats['holes_removed']) == (1, 1)
+    assert stats['vertices_before'] == 400 + 1 + 5 + 5
+    assert stats['vertices_after'] == 5
+    assert stats['payload_bytes_after'] < stats['payload_bytes_before']
+    assert stats['crs_in'] == 'EPSG:32737'
+    # The hole and island were 4 m2 of 10,000
+    assert stats['area_delta_m2'] == pytest.approx(0.0, abs=5.0)
+    assert abs(stats['area_delta_percent']) < 0.05
+
+    # In lon/lat, rounded to COORDINATE_PRECISION_DEG
+    feature, = geojson['features']
+    prepared = shape(feature['geometry'])
+    assert prepared.geom_type == 'Polygon' and not prepared.interiors
+    for x, y in prepared.exterior.coords:
+        assert 38.9 < x < 39.1 and -6.9 < y < -6.8
+        assert round(x / Geometry.COORDINATE_PRECISION_DEG) * Geometry.COORDINATE_PRECISION_DEG == pytest.approx(x, abs=1e-12)
+    assert feature['properties'] == {'id': 0}
+
+
+def test_prepare_repairs_invalid_polygons():
+    from shapely.geometry import Polygon, shape
+
+    # A bow tie - two 50 x 50 m triangles meeting at a point
+    bowtie = Polygon([(500000, 9240000), (500100, 9240100), (500100, 9240000), (500000, 9240100), (500000, 9240000)])
+    assert not bowtie.is_valid
+    geojson, stats = Geometry.prepare(utm_data(bowtie), min_part_m2=1.0)
+
+    prepared = shape(geojson['features'][0]['geometry'])
+    assert prepared.is_valid
+    assert prepared.geom_type == 'MultiPolygon' and len(prepared.geoms) == 2
+    assert stats['area_m2_after'] == pytest.approx(5000.0, rel=1e-3)
+
+
+def test_the_largest_part_always_stays():
+    from shapely.geometry import Polygon
+
+    tiny = Polygon([(500000, 9240000), (500001, 9240000), (500001, 9240001)])
+    geojson, stats = Geometry.prepare(utm_data(tiny))
+    assert stats['parts_removed'] == 0
+    assert geojson['features'][0]['geometry'] is not None
+
+
+def test_prepared_file_is_cached_and_warns_on_big_area_changes(tmp_path):
+    import warnings
+    import Cache
+
+    path = tmp_path / 'site.shp'
+    write_utm_shapefile(path)
+
+    # The defaults leave a plain 100 m square as it is
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        geojson, stats = Geometry.prepare_file(str(path))
+    assert stats['area_delta_percent'] == pytest.approx(0.0, abs=0.01)
+    assert Cache.lookup(Geometry.prepared_key(str(path), Geometry.DEFAULT_TOLERANCE_M, Geometry.DEFAULT_MIN_PART_M2)) is not Cache.MISSING
+
+    # A tolerance twice the square's size cuts it down to a triangle - half the area
+    with pytest.warns(UserWarning, match='changed its area'):
+        Geometry.prepare_file(str(path), tolerance_m=200.0)
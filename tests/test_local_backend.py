@@ -0,0 +1,140 @@
+import json
+
+import numpy as np
+import pytest
+
+import LocalBackend
+import Main_script
+import SLR
+
+rasterio = pytest.importorskip('rasterio')
+pyproj = pytest.importorskip('pyproj')
+
+START_YEAR = 2024
+SEDIMENTATION = 0.3
+NODATA = Main_script.PROJECT_LAYERS_NODATA
+
+# A 60 x 80 pixel stack, about 30 m pixels, just south of the equator
+LEFT, TOP, PIXEL = 39.2, -6.8, 0.00027
+ROWS, COLUMNS = 60, 80
+
+
+def make_layers():
+    '''
+    The same fake inputs for both sides: elevation, GMW, JAXA and Murray loss year over a round aoi, no data outside it.
+    '''
+    rng = np.random.default_rng(1)
+    rows, columns = np.mgrid[0:ROWS, 0:COLUMNS]
+    inside = (rows - ROWS / 2) ** 2 / (ROWS / 2) ** 2 + (columns - COLUMNS / 2) ** 2 / (COLUMNS / 2) ** 2 <= 1
+
+    elevation = np.where(inside, rng.uniform(-0.5, 4.0, inside.shape), NODATA)
+    gmw = np.where(inside & (rng.random(inside.shape) < 0.3), 1, NODATA)
+    jaxa = np.where(inside, rng.choice([1, 2, NODATA], inside.shape), NODATA)
+    loss_year = np.where(inside & (rng.random(inside.shape) < 0.1), rng.integers(1, 20, inside.shape), NODATA)
+    return inside, [elevation, gmw, jaxa, loss_year]
+
+
+def pixel_hectares():
+    # Every pixel's area on the WGS84 ellipsoid - worked out independently of LocalBackend's spherical formula.
+    geod = pyproj.Geod(ellps='WGS84')
+    areas = []
+    for row in range(ROWS):
+        top = TOP - row * PIXEL
+        area, _ = geod.polygon_area_perimeter([LEFT, LEFT + PIXEL, LEFT + PIXEL, LEFT], [top, top, top - PIXEL, top - PIXEL])
+        areas.append(abs(area) / 10000)
+    return np.repeat(np.array(areas)[:, np.newaxis], COLUMNS, axis=1)
+
+
+def values(area_m2):
+    # The metrics export_project_layers keeps in the manifest, as earth engine returns them
+    slr = {}
+    for scenario, prefix in SLR.SLR_SCENARIOS.items():
+        for index, year in enumerate(SLR.get_decade_years(START_YEAR - 1)):
+            for name in SLR.SLR_QUANTILES:
+                slr[prefix + '_' + str(year) + '_' + name] = 100.0 + 20 * index + (50 if prefix == 'ssp585' else 0)
+    return {
+        'slr': slr,
+        'slr_ssp370': 1.1,
+        'slr_ssp585': 1.6,
+        'protected_planet': {'groups': [], 'area_m2': area_m2}
+    }
+
+
+def earth_engine_info(inside, layers, hectares):
+    '''
+    What earth engine would return for get_report_requests over the same pixels: pixel areas summed per class, loss year
+    and (ceil) elevation bin.
+    '''
+    elevation, gmw, jaxa, loss_year = layers
+    area_m2 = float(hectares[inside].sum()) * 10000
+
+    def groups(layer, name):
+        valid = layer != NODATA
+        return [{name: int(value), 'sum': float(hectares[valid & (layer == value)].sum())} for value in np.unique(layer[valid])]
+
+    bins = np.where(inside, np.ceil(elevation / SLR.ELEVATION_BIN_M), NODATA)
+    info = {
+        'area_m2': area_m2,
+        'murray': groups(loss_year, 'lossYear'),
+        'gmw': {'groups': groups(gmw, 'class'), 'area_m2': area_m2},
+        'jaxa': {'groups': groups(jaxa, 'class'), 'area_m2': area_m2, 'pixel_hectares': area_m2 / 10000},
+        'elevation': {'DEM_mean': float(elevation[inside].mean()), 'DEM_min': float(elevation[inside].min()),
+                      'DEM_max': float(elevation[inside].max())},
+        'elevation_histogram': {'groups': groups(bins, 'bin'), 'total': area_m2 / 10000}
+    }
+    info.update(values(area_m2))
+    return info
+
+
+def write_stack(folder, layers, area_m2):
+    from rasterio.transform import from_origin
+
+    with rasterio.open(str(folder / 'project_layers.tif'), 'w', driver='GTiff', height=ROWS, width=COLUMNS, count=len(layers),
+                       dtype='float32', crs='EPSG:4326', transform=from_origin(LEFT, TOP, PIXEL, PIXEL), nodata=NODATA) as f:
+        f.write(np.stack(layers).astype('float32'))
+
+    manifest = {
+        'file': 'project_layers.tif',
+        'year': START_YEAR - 1,
+        'nodata': NODATA,
+        'bands': [{'index': index + 1, 'band': band} for index, band in enumerate(['elevation', 'gmw', 'jaxa', 'murray_loss_year'])],
+        'values': values(area_m2)
+    }
+    with open(str(folder / 'project_layers_bands.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+
+def test_local_report_matches_earth_engine_report(tmp_path):
+    inside, layers = make_layers()
+    hectares = pixel_hectares()
+    info = earth_engine_info(inside, layers, hectares)
+    write_stack(tmp_path, layers, info['area_m2'])
+
+    expected = Main_script.build_report(info, START_YEAR, SEDIMENTATION)
+    actual = Main_script.get_report(None, START_YEAR, SEDIMENTATION, backend=LocalBackend.backend(str(tmp_path)))
+
+    assert 'failed' not in actual
+    assert LocalBackend.compare_reports(expected, actual, rel_tol=0.005) == []
+
+    # And inundation from the histogram against the plain elevation <= height mask the old code used
+    elevation = layers[0]
+    for scenario, values in actual['inundation'].items():
+        below = float(hectares[inside & (elevation <= values['height'])].sum())
+        bin_below = float(hectares[inside & (elevation > values['height'] - SLR.ELEVATION_BIN_M) & (elevation <= values['height'])].sum())
+        assert below - bin_below * 1.01 <= values['hectares'] <= below * 1.005
+
+
+def test_compare_reports_finds_differences():
+    expected = {'area': 100, 'gmw_percent': 10.0, 'inundation': {'SSP3-7.0': {'hectares': 5.0}}, 'jaxa_hectares': 'n/a'}
+    actual = {'area': 101, 'gmw_percent': 12.0, 'inundation': {}, 'jaxa_hectares': 'n/a'}
+    assert LocalBackend.compare_reports(expected, actual) == [
+        ('report.gmw_percent', 10.0, 12.0),
+        ('report.inundation.SSP3-7.0', {'hectares': 5.0}, None)
+    ]
+
+
+def test_wrong_year_is_refused(tmp_path):
+    inside, layers = make_layers()
+    write_stack(tmp_path, layers, 1e6)
+    with pytest.raises(ValueError, match='start year'):
+        LocalBackend.get_report_info(str(tmp_path), START_YEAR + 1)
@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+import Cache
+import Planner
+import SLR
+
+
+@pytest.fixture(autouse=True)
+def planner_defaults():
+    saved = dict(Planner.settings)
+    yield
+    Planner.settings.update(saved)
+
+
+def pixels_at(pixels, scale=30):
+    # The area of an aoi holding this many pixels at scale
+    return pixels * scale ** 2
+
+
+def test_small_reductions_run_as_they_are():
+    plan = Planner.plan_reduction(pixels_at(1e6), 30)
+    assert (plan['tile_scale'], plan['parts']) == (1, 1)
+
+
+def test_tile_scale_doubles_with_the_pixels():
+    capacity = Planner.settings['pixels_per_tile_scale']
+    assert Planner.plan_reduction(pixels_at(capacity), 30)['tile_scale'] == 1
+    assert Planner.plan_reduction(pixels_at(capacity * 1.5), 30)['tile_scale'] == 2
+    assert Planner.plan_reduction(pixels_at(capacity * 5), 30)['tile_scale'] == 8
+    # Bands count as pixels too
+    assert Planner.plan_reduction(pixels_at(capacity), 30, bands=3)['tile_scale'] == 4
+    assert all(plan['parts'] == 1 for plan in [Planner.plan_reduction(pixels_at(capacity * n), 30) for n in range(1, 17)])
+
+
+def test_split_only_past_the_highest_tile_scale():
+    Planner.configure(pixels_per_tile_scale=1000, max_tile_scale=4)
+    plan = Planner.plan_reduction(pixels_at(10000), 30)
+    assert (plan['tile_scale'], plan['parts']) == (4, 3)
+
+
+def make_pixels(count=4000):
+    rng = np.random.default_rng(2)
+    return {
+        'hectares': np.full(count, 0.09),
+        'elevation': rng.uniform(-1.0, 6.0, count),
+        'class': rng.choice([1, 2, 3, 4], count),
+        'lossYear': rng.integers(1, 20, count)
+    }
+
+
+def reduce(pixels):
+    '''
+    The report's reductions over some pixels, shaped the way earth engine returns them (sum.group, means...).
+    '''
+    hectares = pixels['hectares']
+
+    def groups(values, name):
+        return [{name: int(value), 'sum': float(hectares[values == value].sum())} for value in np.unique(values)]
+
+    area_m2 = float(hectares.sum()) * 10000
+    return {
+        'elevation_histogram': {'groups': groups(SLR.elevation_bins_array(pixels['elevation']), 'bin'), 'total': float(hectares.sum())},
+        'jaxa': {'groups': groups(pixels['class'], 'class'), 'area_m2': area_m2, 'pixel_hectares': float(hectares.sum())},
+        'murray': groups(pixels['lossYear'], 'lossYear'),
+        'elevation': {'DEM_mean': float(pixels['elevation'].mean()), 'DEM_min': float(pixels['elevation'].min()),
+                      'DEM_max': float(pixels['elevation'].max())}
+    }
+
+
+REDUCTIONS = {
+    'elevation_histogram': {},
+    'jaxa': {},
+    'murray': {},
+    'elevation': {'merge': Planner.merge_elevation_stats}
+}
+
+
+def approx(value):
+    # Sums come out in a different order, so the last digits can differ
+    if isinstance(value, dict):
+        return {key: approx(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [approx(item) for item in value]
+    if isinstance(value, float):
+        return pytest.approx(value)
+    return value
+
+
+@pytest.mark.parametrize('parts', [2, 4, 9])
+def test_split_reduction_merges_to_the_unsplit_result(parts):
+    pixels = make_pixels()
+    whole = reduce(pixels)
+
+    # Uneven pieces, like the cells of split_aoi cutting across an irregular aoi
+    edges = np.sort(np.random.default_rng(parts).choice(np.arange(1, len(pixels['hectares'])), parts - 1, replace=False))
+    pieces = [{name: values[slice(start, end)] for name, values in pixels.items()}
+              for start, end in zip(np.concatenate([[0], edges]), np.concatenate([edges, [len(pixels['hectares'])]]))]
+
+    # Every part as fetch_split gets it back: the reduction, and the part's area
+    split_requests = {}
+    for name in REDUCTIONS:
+        split_requests[name] = []
+        for index, piece in enumerate(pieces):
+            key = name + '|part ' + str(index + 1) + ' of ' + str(parts)
+            Cache.store(key, {'value': reduce(piece)[name], 'area_m2': float(piece['hectares'].sum()) * 10000})
+            split_requests[name].append((key, None))
+
+    merged = Planner.fetch_split(split_requests, REDUCTIONS)
+    assert merged['elevation_histogram']['groups'] == approx(whole['elevation_histogram']['groups'])
+    assert merged['elevation_histogram']['total'] == pytest.approx(whole['elevation_histogram']['total'])
+    assert merged['jaxa'] == approx(whole['jaxa'])
+    assert merged['murray'] == approx(whole['murray'])
+    assert merged['elevation'] == approx(whole['elevation'])
+
+    # And the numbers the report is worked out from come out the same
+    for height in [0.0, 1.23, 4.5]:
+        assert SLR.inundated_hectares_from_histogram(SLR.parse_elevation_histogram(merged['elevation_histogram']), height) == \
+            pytest.approx(SLR.inundated_hectares_from_histogram(SLR.parse_elevation_histogram(whole['elevation_histogram']), height))
+
+
+def test_parts_without_pixels_count_as_nothing():
+    assert Planner.merge_sums([None, [{'class': 1, 'sum': 2.0}], [{'class': 1, 'sum': 1.0}, {'class': 2, 'sum': 0.5}]]) == \
+        [{'class': 1, 'sum': 3.0}, {'class': 2, 'sum': 0.5}]
+    assert Planner.merge_elevation_stats([None, {'DEM_mean': 2.0, 'DEM_min': 1.0, 'DEM_max': 3.0}], [5.0, 10.0]) == \
+        {'DEM_mean': 2.0, 'DEM_min': 1.0, 'DEM_max': 3.0}
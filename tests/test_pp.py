@@ -0,0 +1,44 @@
+import pytest
+
+import PP
+
+
+@pytest.mark.parametrize('code, names', [
+    (101, ('Ia', 'Designated')),
+    (203, ('Ib', 'Adopted')),
+    (1006, ('Not Assigned', 'Not Reported')),
+    # Out of range either way, or the catch-all code
+    (1101, ('Other', 'Designated')),
+    (107, ('Ia', 'Other')),
+    (PP.OTHER_CODE, ('Other', 'Other')),
+])
+def test_code_names(code, names):
+    assert PP.code_names(code) == names
+
+
+def test_areas_by_category_and_status():
+    # 200 ha aoi: 30 ha Ib/Adopted, 10 ha Ia/Adopted, 5 ha of unknown codes
+    areas = PP.parse_protected_planet_areas({
+        'groups': [{'pp_code': 203, 'sum': 30.0}, {'pp_code': 103.0, 'sum': 10.0}, {'pp_code': PP.OTHER_CODE, 'sum': 5.0}],
+        'area_m2': 2e6
+    })
+    assert areas['hectares'] == 45.0
+    assert areas['percent'] == 22.5
+    assert areas['by_iucn_category']['Ib'] == {'hectares': 30.0, 'percent': 15.0}
+    assert areas['by_iucn_category']['Other'] == {'hectares': 5.0, 'percent': 2.5}
+    assert areas['by_iucn_category']['II'] == {'hectares': 0.0, 'percent': 0.0}
+    assert areas['by_status']['Adopted'] == {'hectares': 40.0, 'percent': 20.0}
+
+    # Every hectare is in exactly one category and one status
+    assert sum(value['hectares'] for value in areas['by_iucn_category'].values()) == areas['hectares']
+    assert sum(value['hectares'] for value in areas['by_status'].values()) == areas['hectares']
+
+
+def test_no_protected_areas():
+    areas = PP.parse_protected_planet_areas({'groups': [], 'area_m2': 1e6})
+    assert (areas['hectares'], areas['percent']) == (0.0, 0.0)
+
+
+def test_vector_method_has_no_breakdown():
+    info = PP.parse_protected_planet_info(25.0, 1e6)
+    assert (info['hectares'], info['percent'], info['by_iucn_category'], info['by_status']) == (25.0, 25.0, None, None)
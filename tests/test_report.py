@@ -0,0 +1,43 @@
+import json
+
+import Benchmark
+import Checkpoint
+import FakeEE
+import Main_script
+import SLR
+
+import ee
+
+
+def hilly_response(label):
+    # The synthetic site, with 50 ha of hills above the elevation histogram's range
+    response = Benchmark.synthetic_response(label)
+    if json.loads(label)['reducer'].startswith('sum.group(bin='):
+        response['groups'].append({'bin': SLR.histogram_bin_range()[1], 'sum': 50.0})
+        response['total'] += 50.0
+    return response
+
+
+def test_section_that_cant_be_built_is_marked_failed(tmp_path):
+    FakeEE.record(FakeEE.new_recording(), respond=hilly_response)
+    aoi = ee.FeatureCollection('report site')
+
+    # Ground sinking 25 m - an inundation height the histogram can't answer with land above its range
+    report = Main_script.get_report_checkpointed(aoi, 2024, -25.0, str(tmp_path))
+    assert list(report['failed']) == ['inundation']
+    assert 'above' in report['failed']['inundation']
+    assert 'inundation' not in report
+    assert report['gmw_hectares'] > 0 and report['slr']
+
+    # Everything that was fetched is checkpointed, so the next run makes no requests at all
+    assert all(checkpoint['status'] == 'done' for checkpoint in Checkpoint.read(str(tmp_path)).values())
+    FakeEE.replay({'responses': {}})
+    rerun = Main_script.get_report_checkpointed(aoi, 2024, 0.5, str(tmp_path))
+    assert 'failed' not in rerun and rerun['inundation']['SSP5-8.5']['hectares'] > 0
+
+
+def test_csv_marks_the_section_failed(tmp_path):
+    FakeEE.record(FakeEE.new_recording(), respond=hilly_response)
+    report = Main_script.get_report_checkpointed(ee.FeatureCollection('report site'), 2024, -25.0, str(tmp_path))
+    Main_script.write_csv(report, 2024, str(tmp_path))
+    assert 'ha under,FAILED' in (tmp_path / 'output.csv').read_text()
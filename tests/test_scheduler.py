@@ -0,0 +1,179 @@
+import threading
+import time
+import urllib.error
+
+import pytest
+
+import Scheduler
+
+
+class Request:
+    '''
+    Just enough of an ee object for the scheduler: something to serialize.
+    '''
+    def __init__(self, expression):
+        self.expression = expression
+
+    def serialize(self):
+        return self.expression
+
+
+class Flaky:
+    '''
+    A backend that fails the first `failures` calls of every request with error, then answers with the request's expression.
+    '''
+    def __init__(self, failures, error):
+        self.failures = failures
+        self.error = error
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, ee_object):
+        with self.lock:
+            count = self.calls.get(ee_object.serialize(), 0) + 1
+            self.calls[ee_object.serialize()] = count
+        if count <= self.failures:
+            raise self.error
+        return ee_object.serialize()
+
+
+@pytest.mark.parametrize('message', [
+    'Too many concurrent aggregations.',
+    'Quota exceeded for quota metric',
+    '<HttpError 429 when requesting https://earthengine.googleapis.com/v1/projects/x/value:compute returned "Too Many Requests">',
+    '<HttpError 503 when requesting https://earthengine.googleapis.com/v1/value:compute>',
+    'HTTP Error 502: Bad Gateway',
+    'An internal error has occurred (request: 1234).',
+    'Service Unavailable'
+])
+def test_transient_errors(message):
+    assert Scheduler.is_transient(Exception(message))
+
+
+@pytest.mark.parametrize('message', [
+    # Numbers that only look like status codes
+    "Image.load: Image asset 'projects/x/assets/site_429' not found.",
+    "Image.select: Pattern 'b503' did not match any bands.",
+    'Reduction of 5030000 pixels over the point (12.429, -1.503) is too large',
+    "Collection.first: Error in map(ID=internal_error_503): 'value' is required",
+    # About the request itself, even with a transient-looking phrase in it
+    'User memory limit exceeded.',
+    'Computation timed out.',
+    'Invalid JSON payload - internal error parsing geometry',
+    '<HttpError 400 when requesting https://earthengine.googleapis.com returned "Too many requests in batch">'
+])
+def test_permanent_errors(message):
+    assert not Scheduler.is_transient(Exception(message))
+
+
+def test_status_attribute():
+    assert Scheduler.is_transient(urllib.error.HTTPError('https://x', 503, 'Service Unavailable', {}, None))
+    assert not Scheduler.is_transient(urllib.error.HTTPError('https://x', 404, 'Not Found', {}, None))
+    assert Scheduler.status_code(Exception('no status here')) is None
+    assert Scheduler.is_transient(ConnectionResetError('Connection reset by peer'))
+
+
+def test_transient_errors_are_retried():
+    backend = Flaky(2, Exception('Too many concurrent aggregations.'))
+    Scheduler.set_backend(backend)
+    assert Scheduler.evaluate(Request('a')) == 'a'
+    assert backend.calls == {'a': 3}
+
+
+def test_retries_give_up_after_max_retries():
+    backend = Flaky(10, Exception('<HttpError 503 when requesting https://earthengine.googleapis.com>'))
+    Scheduler.set_backend(backend)
+    Scheduler.configure(max_retries=3)
+    with pytest.raises(Exception, match='503'):
+        Scheduler.evaluate(Request('a'))
+    assert backend.calls == {'a': 4}
+
+
+def test_permanent_errors_are_not_retried():
+    backend = Flaky(10, Exception("Image.load: Image asset 'site_429' not found."))
+    Scheduler.set_backend(backend)
+    with pytest.raises(Exception, match='not found'):
+        Scheduler.evaluate(Request('a'))
+    assert backend.calls == {'a': 1}
+
+
+def test_backoff_is_jittered_and_capped(monkeypatch):
+    delays = []
+    monkeypatch.setattr(Scheduler.time, 'sleep', delays.append)
+    monkeypatch.setattr(Scheduler.random, 'uniform', lambda low, high: high)
+    Scheduler.configure(base_delay=1.0, max_delay=5.0, max_retries=5)
+    Scheduler.set_backend(Flaky(5, Exception('Too many requests')))
+    assert Scheduler.evaluate(Request('a')) == 'a'
+    assert delays == [1.0, 2.0, 4.0, 5.0, 5.0]
+
+
+def test_identical_requests_in_flight_are_sent_once():
+    calls = []
+
+    def backend(ee_object):
+        calls.append(ee_object.serialize())
+        time.sleep(0.1)
+        return ee_object.serialize()
+
+    Scheduler.set_backend(backend)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(Scheduler.evaluate(Request('same')))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['same'] * 5
+    assert calls == ['same']
+
+
+def test_shared_request_shares_its_error():
+    def backend(ee_object):
+        time.sleep(0.1)
+        raise ValueError('Invalid geometry')
+
+    Scheduler.set_backend(backend)
+    errors = []
+
+    def run():
+        try:
+            Scheduler.evaluate(Request('same'))
+        except ValueError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+
+
+def test_max_in_flight_bounds_requests():
+    lock = threading.Lock()
+    state = {'running': 0, 'most': 0}
+
+    def backend(ee_object):
+        with lock:
+            state['running'] += 1
+            state['most'] = max(state['most'], state['running'])
+        time.sleep(0.02)
+        with lock:
+            state['running'] -= 1
+        return ee_object.serialize()
+
+    Scheduler.set_backend(backend)
+    Scheduler.configure(max_in_flight=2)
+    threads = [threading.Thread(target=Scheduler.evaluate, args=(Request(str(i)),)) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state['most'] == 2
+
+
+def test_label_reaches_the_backend():
+    labels = []
+    Scheduler.set_backend(lambda ee_object: labels.append(Scheduler.current_label()))
+    Scheduler.evaluate(Request('a'), label='{"dataset": "x"}')
+    assert labels == ['{"dataset": "x"}']
+    assert Scheduler.current_label() is None
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+import SLR
+
+
+def histogram(sums):
+    '''A parsed histogram from {bin: hectares}, the way parse_elevation_histogram gets it back from earth engine.'''
+    groups = [{'bin': elevation_bin, 'sum': hectares} for elevation_bin, hectares in sums.items()]
+    return SLR.parse_elevation_histogram({'groups': groups, 'total': sum(sums.values())})
+
+
+LOWEST, HIGHEST = SLR.histogram_bin_range()
+
+# 1 ha at 0-1 cm, 2 ha at 1-2 m
+COASTAL = histogram({0: 1.0, 200: 2.0})
+
+# The same, with 4 ha of hills above the range
+HILLY = histogram({0: 1.0, 200: 2.0, HIGHEST: 4.0})
+
+# And 8 ha of deep water below it
+DEEP = histogram({LOWEST: 8.0, 0: 1.0, 200: 2.0})
+
+
+def test_heights_inside_the_range():
+    assert SLR.inundated_hectares_from_histogram(COASTAL, 0.0) == 1.0
+    assert SLR.inundated_hectares_from_histogram(COASTAL, 1.99) == 1.0
+    assert SLR.inundated_hectares_from_histogram(COASTAL, 2.0) == 3.0
+
+
+def test_below_the_range_with_nothing_down_there_is_zero():
+    assert SLR.inundated_hectares_from_histogram(COASTAL, SLR.HISTOGRAM_MIN_HEIGHT_M - 1) == 0.0
+    assert SLR.inundated_hectares_from_histogram(HILLY, SLR.HISTOGRAM_MIN_HEIGHT_M - 1) == 0.0
+
+
+def test_above_the_range_with_nothing_up_there_is_everything():
+    assert SLR.inundated_hectares_from_histogram(COASTAL, SLR.HISTOGRAM_MAX_HEIGHT_M + 1) == 3.0
+    assert SLR.inundated_hectares_from_histogram(DEEP, SLR.HISTOGRAM_MAX_HEIGHT_M + 1) == 11.0
+
+
+def test_past_a_full_overflow_bin_raises():
+    with pytest.raises(ValueError, match='above'):
+        SLR.inundated_hectares_from_histogram(HILLY, SLR.HISTOGRAM_MAX_HEIGHT_M + 1)
+    with pytest.raises(ValueError, match='below'):
+        SLR.inundated_hectares_from_histogram(DEEP, SLR.HISTOGRAM_MIN_HEIGHT_M - 1)
+
+
+def test_array_matches_the_scalar_lookup():
+    heights = np.array([[SLR.HISTOGRAM_MIN_HEIGHT_M - 1, 0.0, 1.5], [2.0, 5.0, SLR.HISTOGRAM_MAX_HEIGHT_M + 1]])
+    expected = [[SLR.inundated_hectares_from_histogram(COASTAL, height) for height in row] for row in heights]
+    assert SLR.inundated_hectares_array(COASTAL, heights).tolist() == expected
+
+
+def test_array_raises_like_the_scalar_lookup():
+    with pytest.raises(ValueError, match='above'):
+        SLR.inundated_hectares_array(HILLY, [0.0, SLR.HISTOGRAM_MAX_HEIGHT_M + 1])
+
+
+def test_sensitivity_past_the_range(monkeypatch):
+    monkeypatch.setattr(SLR, 'get_elevation_histogram', lambda aoi: COASTAL)
+    # 1 m of SLR, with the ground sinking past the top of the range and rising past the bottom
+    rows = SLR.sedimentation_sensitivity(None, 1.0, [-SLR.HISTOGRAM_MAX_HEIGHT_M, 2 - SLR.HISTOGRAM_MIN_HEIGHT_M])
+    assert [row['hectares'] for row in rows] == [3.0, 0.0]
+
+    monkeypatch.setattr(SLR, 'get_elevation_histogram', lambda aoi: HILLY)
+    with pytest.raises(ValueError):
+        SLR.sedimentation_sensitivity(None, 1.0, [-SLR.HISTOGRAM_MAX_HEIGHT_M])
+
+
+@pytest.fixture
+def synthetic_site():
+    import Benchmark
+    import FakeEE
+    import ee
+
+    FakeEE.record(FakeEE.new_recording(), respond=Benchmark.synthetic_response)
+    return ee.FeatureCollection('grid site')
+
+
+RATES = [-1.0, 0.0, 0.5, 2.0]
+
+
+def test_scenario_grid_shape(synthetic_site):
+    grid = SLR.scenario_grid(synthetic_site, 2024, RATES)
+    shape = (len(SLR.SLR_SCENARIOS), len(SLR.get_decade_years(2024)), len(SLR.GRID_QUANTILES), len(RATES))
+    assert grid['height_m'].shape == grid['hectares'].shape == grid['percent'].shape == shape
+    assert grid['slr_m'].shape == shape[:3]
+    assert grid['sediment_m'].shape == (shape[1], shape[3])
+    assert len(SLR.scenario_grid_rows(grid)) == np.prod(shape)
+
+
+def test_scenario_grid_matches_one_at_a_time(synthetic_site):
+    grid = SLR.scenario_grid(synthetic_site, 2024, RATES)
+    slr = SLR.get_slr_quantiles(synthetic_site, 2024, SLR.GRID_QUANTILES)
+    first_year = grid['years'][0]
+
+    for s, scenario in enumerate(grid['scenarios']):
+        for y, year in enumerate(grid['years']):
+            for q, quantile in enumerate(grid['quantiles']):
+                for r, rate in enumerate(RATES):
+                    height = slr[scenario][year][quantile] - rate * (year - first_year) / 100
+                    assert grid['height_m'][s, y, q, r] == pytest.approx(height)
+                    assert grid['hectares'][s, y, q, r] == SLR.area_inundated_hectares(synthetic_site, grid['height_m'][s, y, q, r])
+
+    # Sediment starts building up from the first decade
+    assert (grid['sediment_m'][0] == 0).all()
+
+
+def test_scenario_grid_past_the_histogram(synthetic_site, monkeypatch):
+    # Ground rising 1 m a year sinks every later height below the range - nothing down there, so nothing inundated
+    grid = SLR.scenario_grid(synthetic_site, 2024, [100.0])
+    assert (grid['height_m'][:, 1:] < SLR.HISTOGRAM_MIN_HEIGHT_M).all()
+    assert (grid['hectares'][:, 1:] == 0).all()
+
+    # With land above the range, sinking ground past it can't be answered
+    histogram = SLR.parse_elevation_histogram
+    monkeypatch.setattr(SLR, 'parse_elevation_histogram', lambda info, bin_size=SLR.ELEVATION_BIN_M: dict(
+        histogram(info, bin_size), above_range_hectares=1.0))
+    with pytest.raises(ValueError, match='above'):
+        SLR.scenario_grid(synthetic_site, 2024, [-100.0])
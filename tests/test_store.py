@@ -0,0 +1,47 @@
+import sqlite3
+
+import Main_script
+import Store
+
+
+def minimal_report(geometry=None):
+    # Every section failed - only the run itself gets stored.
+    report = {'failed': {section: 'skipped' for section in Main_script.REPORT_SECTIONS}}
+    if geometry is not None:
+        report['geometry'] = geometry
+    return report
+
+
+def test_run_records_geometry_settings(tmp_path):
+    Store.configure(path=str(tmp_path / 'results.sqlite'))
+    Store.append_report(minimal_report(Main_script.geometry_settings(True)), 'prepared', 2024, 0.5)
+    Store.append_report(minimal_report(Main_script.geometry_settings(False)), 'as_drawn', 2024, 0.5)
+    Store.append_report(minimal_report(), 'unknown', 2024, 0.5)
+
+    runs = {run['site']: run for run in Store.runs()}
+    assert (runs['prepared']['prepare'], runs['prepared']['tolerance_m'], runs['prepared']['min_part_m2']) == (1, 1.0, 10.0)
+    assert (runs['as_drawn']['prepare'], runs['as_drawn']['tolerance_m']) == (0, None)
+    assert runs['unknown']['prepare'] is None
+
+
+def test_store_made_before_geometry_columns_is_upgraded(tmp_path):
+    path = str(tmp_path / 'results.sqlite')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE runs (run_id INTEGER PRIMARY KEY AUTOINCREMENT, site TEXT NOT NULL, filepath TEXT, '
+                       'start_year INTEGER, sedimentation REAL, run_time REAL)')
+    connection.execute("INSERT INTO runs (site, start_year) VALUES ('old', 2020)")
+    connection.commit()
+    connection.close()
+
+    Store.configure(path=path)
+    Store.append_report(minimal_report(Main_script.geometry_settings(True)), 'new', 2024, 0.5)
+    assert [(run['site'], run['prepare']) for run in Store.runs()] == [('old', None), ('new', 1)]
+
+
+def test_csv_says_how_the_boundary_was_loaded(tmp_path):
+    report = minimal_report(Main_script.geometry_settings(True, tolerance_m=2.0, min_part_m2=5.0))
+    Main_script.write_csv(report, 2024, str(tmp_path))
+    assert 'Geometry:,prepared,tolerance 2.0 m,parts under 5.0 m2 removed' in (tmp_path / 'output.csv').read_text()
+
+    Main_script.write_csv(minimal_report(Main_script.geometry_settings(False)), 2024, str(tmp_path))
+    assert 'Geometry:,as drawn' in (tmp_path / 'output.csv').read_text()
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import Workers
+
+
+def test_results_keep_task_order():
+    # Later tasks finish first - the results still come back in the order the tasks were given.
+    tasks = {name: (lambda delay=delay, name=name: time.sleep(delay) or name)
+             for name, delay in [('slow', 0.05), ('medium', 0.02), ('fast', 0.0)]}
+    results, errors = Workers.run_tasks(tasks, max_workers=3)
+    assert list(results) == ['slow', 'medium', 'fast']
+    assert results == {'slow': 'slow', 'medium': 'medium', 'fast': 'fast'}
+    assert errors == {}
+
+
+def test_failing_task_is_captured_and_others_still_run():
+    def fail():
+        raise RuntimeError('Computation timed out.')
+
+    results, errors = Workers.run_tasks({'a': lambda: 1, 'broken': fail, 'b': lambda: 2}, max_workers=2)
+    assert results == {'a': 1, 'b': 2}
+    assert list(errors) == ['broken']
+    assert str(errors['broken']) == 'Computation timed out.'
+
+
+def test_max_workers_bounds_concurrency():
+    lock = threading.Lock()
+    state = {'running': 0, 'most': 0}
+
+    def task():
+        with lock:
+            state['running'] += 1
+            state['most'] = max(state['most'], state['running'])
+        time.sleep(0.02)
+        with lock:
+            state['running'] -= 1
+
+    results, errors = Workers.run_tasks({str(i): task for i in range(12)}, max_workers=3)
+    assert len(results) == 12 and errors == {}
+    assert state['most'] <= 3
+
+
+def test_fetches_overlap():
+    # 8 tasks of 0.1 s on 8 workers take about as long as one, not 0.8 s.
+    begin = time.perf_counter()
+    Workers.run_tasks({str(i): lambda: time.sleep(0.1) for i in range(8)}, max_workers=8)
+    assert time.perf_counter() - begin < 0.5
+
+
+def test_run_in_background():
+    future = Workers.run_in_background(lambda: 42)
+    assert future.result(timeout=5) == 42
+
+
+def test_fetch_concurrently_with_slow_backend():
+    # Every request takes 0.1 s on the fake backend; one of them fails for good.
+    import ee
+    import Main_script
+    import Scheduler
+
+    def backend(ee_object):
+        time.sleep(0.1)
+        if 'broken' in ee_object.serialize():
+            raise RuntimeError("Image.select: Pattern 'broken' did not match any bands.")
+        return ee_object.serialize()
+
+    Scheduler.set_backend(backend)
+    requests = {name: ('test|' + name, ee.Number(name)) for name in ['a', 'b', 'broken', 'c', 'd', 'e']}
+
+    begin = time.perf_counter()
+    info, errors = Main_script.fetch_concurrently(requests, max_workers=6)
+    assert time.perf_counter() - begin < 0.4
+    assert list(info) == ['a', 'b', 'c', 'd', 'e']
+    assert info['a'] == "ee.Number('a')"
+    assert list(errors) == ['broken']
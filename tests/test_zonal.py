@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+import Benchmark
+import Cache
+import FakeEE
+import Zonal
+
+import ee
+
+# Zone 'a': 100 ha by geometry, 99 ha of 30 m pixels, 98 ha of 25 m JAXA pixels. Zone 'b': a sliver holding no pixel centre.
+ZONES = {
+    'a': {
+        'area': {'area_m2': 1e6, 'total_ha': 99.0},
+        'murray': {'groups': [{'lossYear': 10, 'sum': 2.0}]},
+        'gmw': {'groups': [{'class': 1, 'sum': 25.0}]},
+        'jaxa': {'groups': [{'class': 1, 'sum': 9.8}, {'class': 2, 'sum': 4.9}], 'pixel_hectares': 98.0},
+        'elevation': {'mean': 1.0, 'min': 0.0, 'max': 2.0},
+        'histogram': {'groups': [{'bin': 50, 'sum': 49.5}, {'bin': 200, 'sum': 49.5}]},
+        'protected': {'groups': [{'pp_code': 203, 'sum': 10.0}]}
+    },
+    'b': {
+        'area': {'area_m2': 400.0},
+        'murray': {}, 'gmw': {}, 'jaxa': {}, 'elevation': {}, 'histogram': {}, 'protected': {}
+    }
+}
+
+
+def zonal_response(label):
+    '''
+    synthetic_response, plus reduceRegions results for ZONES.
+    '''
+    request = json.loads(label.partition('|')[0])
+    reducer = request['reducer'] or ''
+    if not reducer.startswith('reduceRegions('):
+        return Benchmark.synthetic_response(label)
+
+    dataset = request['dataset']
+    if dataset == 'geometry':
+        part = 'area'
+    elif dataset.startswith('JCU/Murray'):
+        part = 'murray'
+    elif 'GMW' in dataset:
+        part = 'gmw'
+    elif dataset.startswith('JAXA'):
+        part = 'jaxa'
+    elif dataset.startswith('WCMC/WDPA'):
+        part = 'protected'
+    elif 'mean,min,max' in reducer:
+        part = 'elevation'
+    else:
+        part = 'histogram'
+    return {'type': 'FeatureCollection', 'features': [{'type': 'Feature', 'geometry': None, 'properties': dict(zone[part], zone=name)}
+                                                      for name, zone in ZONES.items()]}
+
+
+@pytest.fixture
+def zonal_report():
+    FakeEE.record(FakeEE.new_recording(), respond=zonal_response)
+    return Zonal.get_zonal_report(ee.FeatureCollection('zonal site'), 2024, 0.5)
+
+
+def test_every_zone_gets_a_report(zonal_report):
+    assert set(zonal_report['zones']) == {'a', 'b'}
+    assert 'failed' not in zonal_report['zones']['a']
+    assert zonal_report['total']['area'] == round(Benchmark.SYNTHETIC_AREA_M2 / 10000)
+
+
+def test_denominators(zonal_report):
+    a = zonal_report['zones']['a']
+    # GMW: the geometry area
+    assert a['gmw_percent'] == pytest.approx(25.0)
+    # JAXA: its own 25 m pixel area, not the 30 m one
+    assert a['jaxa_percent']['Dense'] == pytest.approx(10.0)
+    assert a['jaxa_percent']['Non-dense'] == pytest.approx(5.0)
+    # Inundation: the 30 m pixel area the elevation histogram was summed over
+    inundation = a['inundation']['SSP3-7.0']
+    assert inundation['percent'] == pytest.approx(inundation['hectares'] / 99.0 * 100)
+
+
+def test_zone_without_pixels_falls_back_on_its_geometry(zonal_report):
+    b = zonal_report['zones']['b']
+    assert b['gmw_hectares'] == 0
+    assert b['inundation']['SSP5-8.5']['hectares'] == 0.0
+    assert b['inundation']['SSP5-8.5']['percent'] == 0.0
+
+
+def test_jaxa_pixel_area_is_summed_at_the_jaxa_scale():
+    # The key says what the request does - a 30 m denominator would be a different request
+    requests = Zonal.get_zonal_requests(ee.FeatureCollection('zonal site'), 2024)
+    jaxa_key, _ = requests['zonal_jaxa']
+    area_key, _ = requests['zonal_area']
+    assert json.loads(Cache.key_label(jaxa_key))['scale'] == 25
+    assert 'pixel_hectares' in json.loads(Cache.key_label(jaxa_key))['reducer']
+    assert json.loads(Cache.key_label(area_key))['scale'] == 30
+
+
+def test_duplicate_zone_ids_are_refused():
+    features = [{'properties': {'zone': 'a'}}, {'properties': {'zone': 'a'}}]
+    with pytest.raises(ValueError, match='more than one feature'):
+        Zonal.parse_zones({'features': features})